@@ -0,0 +1,444 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Offline benchmark of the download engine and the GUI, against a local mock media server.
+# Results are JSON so two runs can be compared with --compare.
+
+RESULTS_VERSION = 1
+
+# Mock media server
+class MediaServer:
+    """
+    Serve synthetic media on 127.0.0.1: /progressive/<name>.mp4 is a single file with
+    range support, /hls/<name>.m3u8 an HLS stream of fragment_count fragments.
+    Every request waits latency seconds before answering.
+    """
+    def __init__(self, file_size, fragment_count, fragment_size, latency=0.0):
+        self.file_data = os.urandom(file_size)
+        self.fragment_data = os.urandom(fragment_size)
+        self.fragment_count = fragment_count
+        self.latency = latency
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _handler(self):
+        media = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                if media.latency:
+                    time.sleep(media.latency)
+                path = self.path.split("?")[0]
+                if path.startswith("/progressive/") and path.endswith(".mp4"):
+                    self.send_data(media.file_data, "video/mp4", send_body, ranged=True)
+                elif path.startswith("/hls/") and path.endswith(".m3u8"):
+                    self.send_data(media.playlist().encode("utf-8"), "application/vnd.apple.mpegurl", send_body)
+                elif path.startswith("/hls/") and path.endswith(".ts"):
+                    self.send_data(media.fragment_data, "video/mp2t", send_body)
+                else:
+                    self.send_error(404)
+
+            def send_data(self, data, content_type, send_body, ranged=False):
+                start = 0
+                range_header = self.headers.get("Range", "")
+                if ranged and range_header.startswith("bytes="):
+                    start = int(range_header[6:].split("-")[0] or 0)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data) - start))
+                if ranged:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                if send_body:
+                    try:
+                        self.wfile.write(data[start:])
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def playlist(self):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for index in range(self.fragment_count):
+            # Every stream shares the same fragments
+            lines += ["#EXTINF:4.0,", f"fragments/{index}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def url(self, kind, name):
+        port = self.server.server_address[1]
+        if kind == "hls":
+            # The file name becomes the title, so it has to be unique per item
+            return f"http://127.0.0.1:{port}/hls/{name}.m3u8"
+        return f"http://127.0.0.1:{port}/progressive/{name}.mp4"
+
+    def item_size(self, kind):
+        return len(self.fragment_data) * self.fragment_count if kind == "hls" else len(self.file_data)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# Measurements shared by both drivers
+class Probe:
+    """Collects scheduling latencies and progress handling times while a scenario runs"""
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.started_at = None
+        self.freed_slots = deque()
+        self.scheduling_latencies = []
+        self.progress_times = []
+
+    def wrap_worker_factory(self, factory):
+        """Time progress callbacks on the driving thread and note when download slots free up"""
+        from engine import DownloadJob
+
+        def create(job, on_progress, on_log, on_finished):
+            def timed_progress(snapshot):
+                start = time.perf_counter()
+                on_progress(snapshot)
+                self.progress_times.append(time.perf_counter() - start)
+
+            if isinstance(job, DownloadJob):
+                run = job.run
+
+                def timed_run(on_progress, on_log):
+                    try:
+                        return run(on_progress, on_log)
+                    finally:
+                        self.freed_slots.append(time.perf_counter())
+                job.run = timed_run
+
+            return factory(job, timed_progress, on_log, on_finished)
+        return create
+
+    def queue_started(self):
+        self.started_at = time.perf_counter()
+        # The first items only wait for the queue to start
+        self.freed_slots.extend([self.started_at] * self.concurrency)
+
+    def item_started(self, item):
+        if self.freed_slots:
+            self.scheduling_latencies.append(time.perf_counter() - self.freed_slots.popleft())
+
+def stats(values):
+    if not values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': ordered[int(0.5 * (len(ordered) - 1))],
+        'p95': ordered[int(0.95 * (len(ordered) - 1))],
+        'max': ordered[-1],
+    }
+
+def configure_scheduler(scheduler, args, metrics):
+    from engine import YoutubeDLPool
+
+    # Every feature that is not under test is switched off so runs stay comparable
+    scheduler.set_max_concurrent(args.concurrency)
+    scheduler.progress_interval = args.progress_interval
+    scheduler.fragment_concurrency = args.fragment_concurrency
+    scheduler.download_archive = None
+    scheduler.info_cache = None
+    scheduler.bandwidth = None
+    scheduler.conversion_pool = None
+    # Each scenario starts with no warm YoutubeDL instances
+    scheduler.ydl_pool = None if args.no_ydl_pool else \
+        YoutubeDLPool(os.path.join(os.path.expanduser("~"), "yt_downloader_cache"))
+    scheduler.set_metrics(metrics)
+
+# Drivers
+def run_engine(urls, output_dir, args, metrics, probe):
+    """Run the queue on plain threads, the way headless mode does"""
+    from engine import DownloadItem, DownloadScheduler, ThreadWorker
+
+    events = queue.Queue()
+    download_queue = [DownloadItem(url, output_dir, "Video (MP4)", "720p") for url in urls]
+    scheduler = DownloadScheduler(
+        download_queue,
+        probe.wrap_worker_factory(
+            lambda job, on_progress, on_log, on_finished:
+                ThreadWorker(job, on_progress, on_log, on_finished, events)))
+    configure_scheduler(scheduler, args, metrics)
+    scheduler.on_item_started = probe.item_started
+
+    probe.queue_started()
+    scheduler.start()
+    while scheduler.is_running:
+        callback, callback_args = events.get()
+        callback(*callback_args)
+    if scheduler.ydl_pool is not None:
+        scheduler.ydl_pool.close()
+    return download_queue
+
+def run_gui(urls, output_dir, args, metrics, probe):
+    """Run the queue through the real main window on an offscreen display"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    from engine import DownloadItem
+    import gui
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = gui.YTDownloaderGUI()
+    window.closeEvent = lambda event: event.accept()
+    window.tray_icon.showMessage = lambda *message: None
+
+    scheduler = window.scheduler
+    configure_scheduler(scheduler, args, metrics)
+    scheduler.worker_factory = probe.wrap_worker_factory(window.create_worker)
+    on_item_started = scheduler.on_item_started
+    scheduler.on_item_started = lambda item: (probe.item_started(item), on_item_started(item))
+    on_queue_finished = scheduler.on_queue_finished
+    scheduler.on_queue_finished = lambda: (on_queue_finished(), app.quit())
+
+    items = [DownloadItem(url, output_dir, "Video (MP4)", "720p") for url in urls]
+    window.enqueue_items(items)
+    probe.queue_started()
+    window.start_queue()
+    app.exec()
+
+    # Let every worker thread finish before the window goes away
+    for worker in list(window.workers):
+        worker.wait()
+    if scheduler.ydl_pool is not None:
+        scheduler.ydl_pool.close()
+    window.close()
+    window.deleteLater()
+    return items
+
+DRIVERS = {'engine': run_engine, 'gui': run_gui}
+
+def run_scenario(server, kind, count, driver, args):
+    from metrics import MetricsRegistry
+
+    output_dir = tempfile.mkdtemp(prefix="osd-bench-")
+    metrics = MetricsRegistry()
+    probe = Probe(args.concurrency)
+    # Unique names so every item is a separate file and a separate extraction
+    urls = [server.url(kind, f"{kind}-{count}-{index}") for index in range(count)]
+    try:
+        start = time.perf_counter()
+        items = DRIVERS[driver](urls, output_dir, args, metrics, probe)
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    snapshot = metrics.snapshot()
+    downloaded = sum(entry['value'] for entry in snapshot['counters'].get('osd_downloaded_bytes_total', []))
+    phases = {entry['labels']['phase']: entry for entry in snapshot['summaries'].get('osd_phase_seconds', [])}
+    # Everything a job spends outside the transfer itself
+    overhead = sum(phases[phase]['sum'] for phase in ("dir_check", "extract", "postprocess") if phase in phases)
+    ttfb = snapshot['summaries'].get('osd_time_to_first_byte_seconds', [{}])[0]
+
+    return {
+        'scenario': f"{driver}-{kind}-{count}",
+        'driver': driver,
+        'kind': kind,
+        'items': count,
+        'failed': sum(1 for item in items if item.status != "Completed"),
+        'wall_seconds': wall,
+        'bytes': downloaded,
+        'expected_bytes': server.item_size(kind) * count,
+        'throughput_bytes_per_second': downloaded / wall if wall else None,
+        'per_item_overhead_seconds': overhead / count,
+        'phase_seconds': {phase: {'p50': entry['p50'], 'p95': entry['p95'], 'sum': entry['sum']}
+                          for phase, entry in phases.items()},
+        'time_to_first_byte_seconds': {'p50': ttfb.get('p50'), 'p95': ttfb.get('p95')},
+        'scheduling_latency_seconds': stats(probe.scheduling_latencies),
+        'progress_event_seconds': stats(probe.progress_times),
+    }
+
+def run_startup(runs):
+    """Start the GUI offscreen runs times and take the median of every startup milestone"""
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    report_path = os.path.join(os.environ["HOME"], "startup.json")
+
+    walls, milestones, failed = [], {}, 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, main_script, "--startup-report", report_path, "--exit-after-startup"],
+                                 env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=120)
+        walls.append(time.perf_counter() - start)
+        try:
+            with open(report_path, "r", encoding="utf-8") as f:
+                report = json.load(f)
+            os.remove(report_path)
+        except (OSError, ValueError):
+            report = None
+        if process.returncode != 0 or report is None:
+            failed += 1
+            continue
+        for name, seconds in report['milestones'].items():
+            milestones.setdefault(name, []).append(seconds)
+
+    return {
+        'scenario': "gui-startup",
+        'driver': "gui",
+        'runs': runs,
+        'failed': failed,
+        'wall_seconds': stats(walls)['p50'],
+        'startup_seconds': {name: stats(values)['p50'] for name, values in milestones.items()},
+    }
+
+def environment():
+    import yt_dlp
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'yt_dlp': yt_dlp.version.__version__,
+        'commit': commit,
+    }
+
+# Comparing runs
+# (label, path to the value in a result, whether higher is better)
+COMPARED = [
+    ("Wall time", ('wall_seconds',), False),
+    ("Throughput", ('throughput_bytes_per_second',), True),
+    ("Per-item overhead", ('per_item_overhead_seconds',), False),
+    ("Scheduling latency p95", ('scheduling_latency_seconds', 'p95'), False),
+    ("Progress event mean", ('progress_event_seconds', 'mean'), False),
+    ("First paint", ('startup_seconds', 'first_paint'), False),
+    ("yt-dlp ready", ('startup_seconds', 'yt_dlp'), False),
+]
+
+def value_at(result, path):
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+def compare(old, new, out=sys.stdout):
+    """Print the relative change of every compared metric for scenarios present in both runs"""
+    old_results = {result['scenario']: result for result in old['results']}
+    out.write(f"{'Scenario':<28}{'Metric':<26}{'Before':>14}{'After':>14}{'Change':>10}\n")
+    for result in new['results']:
+        previous = old_results.get(result['scenario'])
+        if previous is None:
+            continue
+        for label, path, higher_is_better in COMPARED:
+            before, after = value_at(previous, path), value_at(result, path)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            marker = "" if abs(change) < 5 else (" +" if better else " -")
+            out.write(f"{result['scenario']:<28}{label:<26}{before:>14.6g}{after:>14.6g}{change:>9.1f}%{marker}\n")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the OSD download engine")
+    parser.add_argument("--items", type=int, nargs="+", default=[1, 10, 500],
+                        help="queue sizes to run (default: 1 10 500)")
+    parser.add_argument("--kinds", nargs="+", choices=["progressive", "hls"], default=["progressive", "hls"])
+    parser.add_argument("--drivers", nargs="+", choices=list(DRIVERS), default=["engine"],
+                        help="engine runs on plain threads, gui through the main window offscreen")
+    parser.add_argument("--file-size", default="512K", help="size of a progressive file (default: 512K)")
+    parser.add_argument("--fragments", type=int, default=8, help="fragments per HLS stream (default: 8)")
+    parser.add_argument("--fragment-size", default="64K", help="size of an HLS fragment (default: 64K)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the server waits before each response")
+    parser.add_argument("-c", "--concurrency", type=int, default=3, help="concurrent downloads (default: 3)")
+    parser.add_argument("-N", "--fragment-concurrency", type=int, default=4,
+                        help="fragments downloaded at once per HLS item (default: 4)")
+    parser.add_argument("--progress-interval", type=float, default=0.5,
+                        help="seconds between progress events of a job (default: 0.5)")
+    parser.add_argument("--no-ydl-pool", action="store_true",
+                        help="build a new YoutubeDL for every download instead of reusing warm ones")
+    parser.add_argument("--startup", type=int, default=0, metavar="RUNS",
+                        help="also start the GUI offscreen RUNS times and report its startup milestones")
+    parser.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", metavar="RESULTS", help="earlier JSON results to compare this run against")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = parse_args(argv)
+    from yt_dlp.utils import parse_bytes
+
+    # History, archive, caches and settings of the benchmark never touch the user's own
+    home = tempfile.mkdtemp(prefix="osd-bench-home-")
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+
+    server = MediaServer(parse_bytes(args.file_size), args.fragments, parse_bytes(args.fragment_size), args.latency)
+    server.start()
+    results = []
+    try:
+        for driver in args.drivers:
+            for kind in args.kinds:
+                for count in args.items:
+                    sys.stderr.write(f"Running {driver}-{kind}-{count}...\n")
+                    result = run_scenario(server, kind, count, driver, args)
+                    sys.stderr.write(
+                        f"  {result['wall_seconds']:.2f} s, {result['throughput_bytes_per_second'] / 1048576:.2f} MB/s, "
+                        f"{result['per_item_overhead_seconds'] * 1000:.1f} ms overhead per item, "
+                        f"{result['failed']} failed\n")
+                    results.append(result)
+        if args.startup:
+            sys.stderr.write(f"Running gui-startup x{args.startup}...\n")
+            result = run_startup(args.startup)
+            sys.stderr.write(
+                f"  first paint {result['startup_seconds'].get('first_paint', 0):.2f} s, "
+                f"yt-dlp ready {result['startup_seconds'].get('yt_dlp', 0):.2f} s, {result['failed']} failed\n")
+            results.append(result)
+    finally:
+        server.close()
+        shutil.rmtree(home, ignore_errors=True)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'environment': environment(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report, sys.stderr)
+
+    return 1 if any(result['failed'] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,2488 @@
+import os
+import re
+import glob
+import json
+import math
+import time
+import zlib
+import queue
+import heapq
+import itertools
+import random
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from functools import lru_cache
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from postprocess import ConvertJob, find_ffmpeg, read_progress_state
+from formats import FormatSelector, audio_copy_ext
+
+# Download job, runs on a worker thread
+class DownloadJob:
+    """
+    Download one URL with yt-dlp. run() reports through plain callbacks, so the job
+    works the same under a QThread in the GUI and a plain thread when headless.
+    """
+    def __init__(self, url, output_path, format_type, quality, progress_interval=0.5, download_archive=None,
+                 info_cache=None, bandwidth=None, fragment_concurrency=1, postprocess=False,
+                 embed_thumbnail=False, metrics=None, bandwidth_weight=1, ydl_pool=None, audio_copy=False,
+                 section=None):
+        self.url = url
+        self.output_path = output_path
+        self.format_type = format_type
+        self.quality = quality
+        self.progress_interval = progress_interval
+        self.download_archive = download_archive
+        self.info_cache = info_cache
+        self.bandwidth = bandwidth
+        # Share of the global rate relative to other jobs, see BandwidthManager
+        self.bandwidth_weight = bandwidth_weight
+        self.fragment_concurrency = max(1, fragment_concurrency)
+        # With postprocess the job only downloads and leaves merging/encoding to a ConversionPool
+        self.postprocess = postprocess
+        self.embed_thumbnail = embed_thumbnail
+        # Keep the downloaded audio stream as it is instead of encoding it to MP3 where it can be
+        self.audio_copy = audio_copy
+        # (start, end, title) of the part of the video to download, see DownloadItem.section
+        self.section = section
+        # Length of the section in seconds once the video's duration is known
+        self._section_seconds = None
+        self.postprocess_task = None
+        self.metrics = metrics
+        # Lends a warm YoutubeDL instead of building one for this job
+        self.ydl_pool = ydl_pool
+        # Set when the job fails, see classify_error
+        self.error_class = None
+        self.error_message = None
+        # (bytes, seconds) of every fragmented stream this job downloaded
+        self.fragment_stats = []
+        self.is_cancelled = False
+        self.keep_partial = True
+        # (.part file, final file) of every download started, the final name None if unknown
+        self.partial_files = set()
+        self._counted_bytes = {}
+        self._fragment_counts = {}
+        # With concurrent fragments yt-dlp calls the progress hook from several threads
+        self._hook_lock = threading.Lock()
+        self._on_progress = None
+        self._on_log = None
+        self._progress_state = None
+        self._progress_pending = False
+        self._last_progress_emit = 0.0
+        # Phase timestamps (time.monotonic()) and counts for the metrics registry
+        self._timestamps = {}
+        self._retries = 0
+        self._resume_offset = 0
+        self._extractor = None
+
+    def run(self, on_progress, on_log):
+        """Download the URL, returning True on success"""
+        self._mark('start')
+        success = self._run(on_progress, on_log)
+        self._mark('end')
+        if self.metrics is not None:
+            self._record_metrics(success)
+        return success
+
+    def _run(self, on_progress, on_log):
+        import yt_dlp
+        self._on_progress = on_progress
+        self._on_log = on_log
+        try:
+            on_log(f"Starting download of {self.url}")
+
+            # Configure yt-dlp options
+            options = {
+                'format': self._format_selector(),
+                'outtmpl': os.path.join(self.output_path, '%(title)s.%(ext)s'),
+                'quiet': True,
+                'no_warnings': True,
+                # Progress is reported through the hook, never yt-dlp's console output
+                'noprogress': True,
+                'socket_timeout': 30,
+                'retries': 3,
+                # DASH/HLS fragments are fetched in parallel and written back in order by yt-dlp
+                'concurrent_fragment_downloads': self.fragment_concurrency,
+                # A cancelled download leaves its .part file behind and the next run continues from it
+                'continuedl': True,
+                'nopart': False,
+            }
+
+            # Small fixed reads keep throttled downloads smooth instead of bursting whole buffers
+            if self.bandwidth is not None:
+                options['buffersize'] = 64 * 1024
+                options['noresizebuffer'] = True
+
+            # yt-dlp checks and records archive keys itself, including for playlist entries.
+            # A section does not count as the video being downloaded.
+            if self.download_archive is not None and self.section is None:
+                options['download_archive'] = self.download_archive
+
+            # yt-dlp cuts sections out of the stream with ffmpeg, fetching only what they need.
+            # The range and file name are set per job by _watch_section.
+            if self.section is not None and find_ffmpeg() is None:
+                on_log("Downloading part of a video needs ffmpeg, which was not found")
+                self.error_class = ERROR_PERMANENT
+                return False
+
+            # Use actual yt-dlp library
+            on_log("Extracting video information...")
+
+            # Check if output directory exists and is writable
+            if not os.path.exists(self.output_path):
+                try:
+                    os.makedirs(self.output_path, exist_ok=True)
+                    on_log(f"Created output directory: {self.output_path}")
+                except Exception as e:
+                    on_log(f"Cannot create output directory: {str(e)}")
+                    return False
+
+            if not os.access(self.output_path, os.W_OK):
+                on_log(f"No write permission for directory: {self.output_path}")
+                self.error_class = ERROR_PERMANENT
+                return False
+
+            if self.bandwidth is not None:
+                if self.section is None:
+                    self.bandwidth.register(self, self.bandwidth_weight)
+                elif self.bandwidth.limit_now() or self.bandwidth.per_item_limit:
+                    # ffmpeg does the transfer, which leaves no place to throttle it
+                    on_log("Rate limits do not apply to sections, ffmpeg downloads them at full speed")
+            self._mark('checked')
+
+            # Use the actual yt-dlp library
+            if self.ydl_pool is not None:
+                context = self.ydl_pool.acquire(options, self)
+            else:
+                context = self._new_youtube_dl(options)
+            with context as ydl, self._watch_section(ydl):
+                info = self._extract_and_download(ydl)
+
+                # Deliver whatever the throttle held back before reporting completion
+                self._flush_progress()
+
+                if self.is_cancelled:
+                    return False
+
+                if "entries" in info:  # It's a playlist
+                    on_log(f"Successfully downloaded playlist: {info.get('title', 'Unknown')}")
+                else:  # It's a single video
+                    on_log(f"Successfully downloaded: {info.get('title', 'Unknown')}")
+                return True
+
+        except yt_dlp.utils.DownloadCancelled:
+            self._flush_progress()
+            if self.section is not None:
+                # ffmpeg cannot continue a section, it starts over when resumed
+                self._remove_partial_files()
+                on_log(f"Download stopped: {self.url}")
+            elif self.keep_partial:
+                on_log(f"Download stopped, partial data kept for resuming: {self.url}")
+            else:
+                self._remove_partial_files()
+                on_log(f"Download cancelled: {self.url}")
+            return False
+
+        except Exception as e:
+            self._flush_progress()
+            self.error_class = classify_error(e)
+            self.error_message = str(e)
+            on_log(f"Error during download ({self.error_class}): {str(e)}")
+            return False
+
+        finally:
+            if self.bandwidth is not None:
+                self.bandwidth.unregister(self)
+
+    def _new_youtube_dl(self, options):
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(dict(options,
+                                    progress_hooks=[self._progress_hook],
+                                    # yt-dlp's messages go to the logger, which counts the retries
+                                    logger=YtdlLogger(self)))
+        # Marks the end of extraction when yt-dlp downloads and post-processes inline
+        ydl.add_post_processor(phase_marker(self), when='before_dl')
+        return ydl
+
+    def _extract_and_download(self, ydl):
+        """Download the URL, reusing cached extraction results when there are any"""
+        import yt_dlp
+        ffmpeg = find_ffmpeg() if self.postprocess else None
+        if self.postprocess and ffmpeg is None:
+            self._on_log("ffmpeg was not found, yt-dlp will process the download inline")
+
+        cache_key = InfoCache.key_for(self.url, repr(self._format_selector())) if self.info_cache else None
+        if cache_key is None:
+            if ffmpeg is None:
+                return ydl.extract_info(self.url, download=True)
+            return self._download_streams(ydl, ydl.extract_info(self.url, download=False), ffmpeg)
+
+        info = self.info_cache.get(cache_key)
+        if info is not None:
+            self._on_log("Using cached video information")
+            self._check_cancelled()
+            try:
+                if ffmpeg is None:
+                    return ydl.process_ie_result(info, download=True)
+                return self._download_streams(ydl, ydl.process_ie_result(info, download=False), ffmpeg)
+            except yt_dlp.utils.DownloadError as e:
+                # Stream URLs can be revoked before they expire, so retry once with a fresh extraction
+                self._on_log(f"Cached video information is stale ({str(e)}), extracting again")
+                self.info_cache.invalidate(cache_key)
+
+        info = ydl.extract_info(self.url, download=False)
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            self.info_cache.put(cache_key, ydl.sanitize_info(info))
+        self._check_cancelled()
+        if ffmpeg is None:
+            return ydl.process_ie_result(info, download=True)
+        return self._download_streams(ydl, ydl.process_ie_result(info, download=False), ffmpeg)
+
+    def _download_streams(self, ydl, info, ffmpeg):
+        """
+        Download the selected streams of an extracted video without post-processing
+        them, leaving a conversion task in postprocess_task when they need one
+        """
+        import yt_dlp
+        from yt_dlp.utils import make_archive_id, prepend_extension
+
+        # Playlists that could not be expanded keep yt-dlp's own inline processing
+        if info.get('_type') in ('playlist', 'multi_video'):
+            return ydl.process_ie_result(info, download=True)
+
+        self._mark_extracted(info)
+        audio_only = self.format_type != "Video (MP4)"
+        root = os.path.splitext(ydl.prepare_filename(info))[0]
+        copy_ext = None
+        if audio_only and self.audio_copy:
+            copy_ext = audio_copy_ext(info)
+            if copy_ext is None:
+                self._on_log(f"Audio codec {info.get('acodec') or 'unknown'} cannot be kept as it is, encoding to MP3")
+        output = root + ("." + copy_ext if copy_ext else ".mp3" if audio_only else ".mp4")
+        if os.path.exists(output):
+            self._on_log(f"{os.path.basename(output)} has already been downloaded")
+            ydl.record_download_archive(info)
+            return info
+
+        formats = info.get('requested_formats') or [info]
+        inputs = []
+        for fmt in formats:
+            self._check_cancelled()
+            stream_info = dict(info)
+            stream_info.pop('requested_formats', None)
+            stream_info.update(fmt)
+            if self.section is not None:
+                self._cut_section(ydl, stream_info)
+            filename = ydl.prepare_filename(stream_info)
+            if len(formats) > 1:
+                filename = prepend_extension(filename, f"f{fmt['format_id']}")
+            if not ydl.dl(filename, stream_info):
+                raise yt_dlp.utils.DownloadError(f"Download of format {fmt.get('format_id')} failed")
+            inputs.append(filename)
+
+        thumbnail = self._download_thumbnail(ydl, info, root) if self.embed_thumbnail else None
+
+        # A single MP4 stream without a cover to embed is already the final file
+        if not audio_only and not thumbnail and len(inputs) == 1 and inputs[0].endswith(".mp4"):
+            ydl.record_download_archive(info)
+            return info
+
+        self.postprocess_task = {
+            'ffmpeg': ffmpeg,
+            'inputs': inputs,
+            'output': output,
+            'video_streams': sum(1 for fmt in formats if fmt.get('vcodec') != 'none'),
+            'audio_bitrate': self.quality.split()[0] + "k" if audio_only and not copy_ext else None,
+            'audio_copy': copy_ext is not None,
+            'tags': audio_tags(info) if audio_only else None,
+            'thumbnail': thumbnail,
+            'duration': self._section_seconds if self.section is not None else info.get('duration'),
+            'progress_file': root + ".progress",
+            'cancel_file': root + ".cancel",
+            'archive_id': make_archive_id(info['extractor_key'], info['id'])
+                          if info.get('extractor_key') and self.section is None else None,
+        }
+        return info
+
+    def _cut_section(self, ydl, stream_info):
+        """Turn a stream's info into a download of the job's section only"""
+        import yt_dlp
+        from yt_dlp.downloader import get_suitable_downloader
+        from yt_dlp.downloader.external import FFmpegFD
+
+        start, end, title = self.section
+        if not start and end is None:
+            return
+        stream_info.update(section_start=start, section_end=end, section_title=title)
+        # Other downloaders would quietly fetch the whole stream
+        if get_suitable_downloader(stream_info, ydl.params) is not FFmpegFD:
+            raise yt_dlp.utils.DownloadError(
+                f"Format {stream_info.get('format_id')} cannot be partially downloaded")
+
+    def _download_thumbnail(self, ydl, info, root):
+        url = info.get('thumbnail')
+        if not url:
+            return None
+        ext = os.path.splitext(url.split("?")[0])[1].lower()
+        path = root + ".cover" + (ext if ext in (".jpg", ".jpeg", ".png", ".webp") else ".jpg")
+        try:
+            with ydl.urlopen(url) as response, open(path, "wb") as f:
+                f.write(response.read())
+            return path
+        except Exception as e:
+            self._on_log(f"Could not download thumbnail: {str(e)}")
+            return None
+
+    def _check_cancelled(self):
+        # yt-dlp lets DownloadCancelled through every layer, aborting the transfer
+        if self.is_cancelled:
+            import yt_dlp
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled")
+
+    def _remove_partial_files(self):
+        remove_partial_files(self.partial_files, self._on_log)
+
+    def _progress_hook(self, d):
+        """
+        Aggregate yt-dlp progress callbacks and publish at most one snapshot per
+        progress_interval. A snapshot has the keys status, progress, downloaded_bytes,
+        total_bytes, speed, eta, fragment_index, fragment_count and rate_limit.
+
+        yt-dlp calls the hook after every chunk, so this is also where a cancelled
+        job stops the transfer and where bandwidth limits are enforced.
+        """
+        # The chunk reported here is already on disk, so it is counted even when cancelling
+        new_bytes = self._count_bytes(d) if d['status'] == 'downloading' else 0
+        if self.metrics is not None:
+            self.metrics.add_bytes(new_bytes)
+
+        self._check_cancelled()
+
+        if self.bandwidth is not None and new_bytes:
+            self._throttle(new_bytes)
+
+        with self._hook_lock:
+            self._report_progress(d)
+
+    def _report_progress(self, d):
+        if d['status'] == 'downloading' and d.get('downloaded_bytes'):
+            self._mark('first_byte')
+        elif d['status'] == 'finished':
+            self._mark('transferred', overwrite=True)
+
+        filename = d.get('filename')
+        if d.get('tmpfilename'):
+            self.partial_files.add((d['tmpfilename'], filename))
+        if d.get('fragment_count'):
+            self._fragment_counts[filename] = d['fragment_count']
+
+        if d['status'] == 'downloading':
+            try:
+                # Calculate percentage
+                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+                downloaded_bytes = d.get('downloaded_bytes', 0)
+
+                progress = self._progress_state['progress'] if self._progress_state else 0
+                if total_bytes:
+                    progress = int(downloaded_bytes / total_bytes * 100)
+                elif d.get('_percent_str'):
+                    # Fallback to percent string if available
+                    p = d.get('_percent_str', '0%').replace('%', '')
+                    progress = int(float(p))
+
+                self._update_progress({
+                    'status': "Downloading",
+                    'progress': min(progress, 100),
+                    'downloaded_bytes': downloaded_bytes,
+                    'total_bytes': total_bytes,
+                    'speed': d.get('speed'),
+                    'eta': d.get('eta'),
+                    'fragment_index': d.get('fragment_index'),
+                    'fragment_count': d.get('fragment_count'),
+                    'rate_limit': self._rate_limit(),
+                })
+
+            except Exception as e:
+                self._on_log(f"Progress calculation error: {str(e)}")
+
+        elif d['status'] == 'finished':
+            total_bytes = d.get('total_bytes') or d.get('downloaded_bytes')
+            self._update_progress({
+                'status': "Downloading",
+                'progress': 100,
+                'downloaded_bytes': d.get('downloaded_bytes', total_bytes),
+                'total_bytes': total_bytes,
+                'speed': None,
+                'eta': 0,
+                'fragment_index': d.get('fragment_index'),
+                'fragment_count': d.get('fragment_count'),
+                'rate_limit': self._rate_limit(),
+            }, force=True)
+
+            elapsed = d.get('elapsed')
+            fragment_count = self._fragment_counts.get(filename)
+            if total_bytes and elapsed and fragment_count:
+                # Throttled streams say nothing about what the extra connections gain
+                if not self._rate_limit():
+                    self.fragment_stats.append((total_bytes, elapsed))
+                self._on_log(
+                    f"Download finished ({format_size(total_bytes)} in {fragment_count} fragments over "
+                    f"{self.fragment_concurrency} connections in {elapsed:.1f} seconds, "
+                    f"{format_size(total_bytes / elapsed)}/s)")
+            elif total_bytes and elapsed:
+                self._on_log(
+                    f"Download finished ({format_size(total_bytes)} in {elapsed:.1f} seconds)")
+            else:
+                self._on_log("Download finished")
+
+    def _count_bytes(self, d):
+        """Bytes received since the previous report of the same file"""
+        filename = d.get('tmpfilename') or d.get('filename')
+        downloaded_bytes = d.get('downloaded_bytes') or 0
+
+        with self._hook_lock:
+            previous = self._counted_bytes.get(filename)
+            if previous is None:
+                previous = self._resumed_bytes(d)
+            self._counted_bytes[filename] = max(previous, downloaded_bytes)
+            return max(0, downloaded_bytes - previous)
+
+    def _resumed_bytes(self, d):
+        # Bytes a file already had from an earlier run are not counted again. Fragmented
+        # downloads only append finished fragments to the .part file, so its size is
+        # exactly what they resume from; plain HTTP downloads announce their offset.
+        if d.get('fragment_count') or d.get('fragment_index') is not None:
+            try:
+                return os.path.getsize(d['tmpfilename'])
+            except (KeyError, OSError):
+                return 0
+        resumed, self._resume_offset = self._resume_offset, 0
+        return resumed
+
+    def _throttle(self, nbytes):
+        # Fragment threads wait for their tokens in parallel, the shared bucket keeps the total in check
+        deadline = time.monotonic() + self.bandwidth.consume(self, nbytes)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Sleep in short steps so a cancellation is still noticed quickly
+            time.sleep(min(remaining, 0.2))
+            self._check_cancelled()
+
+    def _mark(self, name, overwrite=False):
+        if overwrite or name not in self._timestamps:
+            self._timestamps[name] = time.monotonic()
+
+    def _mark_extracted(self, info):
+        self._mark('extracted')
+        if self.section is not None:
+            self._section_seconds = section_seconds(self.section, info.get('duration'))
+        if info.get('extractor_key'):
+            self._extractor = info['extractor_key'].lower()
+        if info.get('format_plan'):
+            size = info.get('filesize') or info.get('filesize_approx')
+            self._on_log(f"Selected format {info.get('format_id')}: {info['format_plan']}"
+                         + (f", about {format_size(size)}" if size else ""))
+
+    def _record_metrics(self, success):
+        """Record phase timings, time to first byte, retries and the result of this job"""
+        marks = self._timestamps
+        extractor = self._extractor or extractor_for_url(self.url)
+
+        def phase(name, begin, end):
+            if begin in marks and end in marks:
+                self.metrics.observe('osd_phase_seconds', marks[end] - marks[begin], phase=name)
+
+        phase('dir_check', 'start', 'checked')
+        phase('extract', 'checked', 'extracted')
+        phase('transfer', 'extracted', 'transferred')
+        # Without a conversion pool yt-dlp post-processes before returning
+        if self.postprocess_task is None:
+            phase('postprocess', 'transferred', 'end')
+        if 'extracted' in marks and 'first_byte' in marks:
+            self.metrics.observe('osd_time_to_first_byte_seconds', marks['first_byte'] - marks['extracted'])
+
+        if self._retries:
+            self.metrics.inc('osd_download_retries_total', self._retries, extractor=extractor)
+        result = "cancelled" if self.is_cancelled else "completed" if success else "failed"
+        self.metrics.inc('osd_downloads_total', extractor=extractor, result=result)
+        if result == "failed" and self.error_class:
+            self.metrics.inc('osd_download_errors_total', extractor=extractor, error_class=self.error_class)
+
+    def _rate_limit(self):
+        return self.bandwidth.rate_for(self) if self.bandwidth is not None else 0
+
+    def _update_progress(self, state, force=False):
+        self._progress_state = state
+        self._progress_pending = True
+
+        now = time.monotonic()
+        if force or now - self._last_progress_emit >= self.progress_interval:
+            self._last_progress_emit = now
+            self._flush_progress()
+
+    def _flush_progress(self):
+        if self._progress_pending:
+            self._progress_pending = False
+            self._on_progress(dict(self._progress_state))
+
+    def _format_selector(self):
+        return format_selector(self.format_type, self.quality, self.audio_copy)
+
+    def _filename_suffix(self):
+        # Parts of the same video get files of their own
+        if self.section is None:
+            return ""
+        label = section_label(self.section).replace(":", ".")
+        return " [" + re.sub(r'[\\/*?"<>|%]', "_", label) + "]"
+
+    @contextmanager
+    def _watch_section(self, ydl):
+        """
+        Point ydl at the section for the duration of a with block and report progress
+        while ffmpeg downloads it. ffmpeg does not call the progress hook, so its
+        -progress output is polled and measured against the length of the section
+        rather than the whole video.
+        """
+        if self.section is None:
+            yield
+            return
+        import yt_dlp
+        fd, progress_file = tempfile.mkstemp(prefix="osd-section-", suffix=".progress")
+        os.close(fd)
+        # The range and file name differ for every section. They are set on the lent
+        # instance rather than passed in the options, which would key a pooled instance
+        # of its own to each section, and the instance gets its own values back afterwards.
+        start, end, _ = self.section
+        keys = ('download_ranges', 'outtmpl', 'external_downloader_args')
+        previous = {key: ydl.params[key] for key in keys if key in ydl.params}
+        ydl.params['download_ranges'] = yt_dlp.utils.download_range_func(
+            None, [(start, end if end is not None else math.inf)])
+        ydl.params['outtmpl'] = dict(ydl.params['outtmpl'], default=os.path.join(
+            self.output_path, f'%(title)s{self._filename_suffix()}.%(ext)s'))
+        ydl.params['external_downloader_args'] = {'ffmpeg_o': ['-progress', progress_file]}
+        stop = threading.Event()
+        try:
+            with watch_ffmpeg() as processes:
+                watcher = threading.Thread(target=self._poll_section, args=(progress_file, processes, stop),
+                                           daemon=True)
+                watcher.start()
+                try:
+                    yield
+                except yt_dlp.utils.DownloadError:
+                    # ffmpeg stopped by _poll_section fails the download
+                    if self.is_cancelled:
+                        raise yt_dlp.utils.DownloadCancelled("Download cancelled") from None
+                    raise
+                finally:
+                    stop.set()
+                    watcher.join()
+        finally:
+            for key in keys:
+                if key in previous:
+                    ydl.params[key] = previous[key]
+                else:
+                    ydl.params.pop(key, None)
+            try:
+                os.remove(progress_file)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _ffmpeg_output(process):
+        # yt-dlp passes the .part file last, as a file: URL
+        output = process.args[-1]
+        return output[len("file:"):] if output.startswith("file:") else output
+
+    def _poll_section(self, progress_file, processes, stop):
+        started = counted = None
+        while not stop.wait(self.progress_interval):
+            if self.is_cancelled:
+                # Nothing of ffmpeg's calls back into the job, so it is stopped from here
+                for process in list(processes):
+                    if process.poll() is None:
+                        process.kill()
+                        self.partial_files.add((self._ffmpeg_output(process), None))
+                continue
+            seconds, size = read_progress_state(progress_file)
+            if seconds is None:
+                continue
+            now = time.monotonic()
+            if started is None or (counted and size < counted):
+                # ffmpeg started on the section or, after a merge's video, on its audio
+                started, counted = now, 0
+            if self.metrics is not None and size > counted:
+                self.metrics.add_bytes(size - counted)
+            counted = size
+
+            length = self._section_seconds
+            fraction = min(seconds / length, 1.0) if length else None
+            elapsed = now - started
+            with self._hook_lock:
+                self._mark('first_byte')
+                self._update_progress({
+                    'status': "Downloading",
+                    'progress': int(fraction * 100) if fraction is not None else 0,
+                    'downloaded_bytes': size,
+                    'total_bytes': int(size / fraction) if fraction else None,
+                    'speed': size / elapsed if elapsed > 0 else None,
+                    'eta': int(elapsed / fraction - elapsed) if fraction and elapsed > 0 else None,
+                    'fragment_index': None,
+                    'fragment_count': None,
+                    'rate_limit': self._rate_limit(),
+                })
+
+    def cancel(self, keep_partial=True):
+        """
+        Stop the download at the next progress callback. With keep_partial the .part
+        file stays on disk so a new job for the same URL resumes from it.
+        """
+        self.keep_partial = keep_partial
+        self.is_cancelled = True
+
+# Partial files
+def remove_partial_files(partial_files, on_log):
+    """Delete the (.part file, final file) pairs of an unfinished download, see DownloadJob.partial_files"""
+    for tmpfilename, filename in partial_files:
+        # Fragmented downloads also keep one file per fragment in flight and their state in a .ytdl file
+        paths = [tmpfilename] + glob.glob(glob.escape(tmpfilename) + "-Frag*")
+        if filename:
+            paths.append(filename + ".ytdl")
+        for path in paths:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                on_log(f"Could not remove partial file {path}: {str(e)}")
+
+# yt-dlp logger
+class YtdlLogger:
+    """Receives yt-dlp's output instead of the console and counts its retries"""
+    RETRY_PATTERN = re.compile(r'\bRetrying\b')
+    RESUME_PATTERN = re.compile(r'Resuming download at byte (\d+)')
+
+    def __init__(self, job):
+        self.job = job
+
+    def debug(self, message):
+        # Pooled instances keep their logger between jobs
+        if self.job is None:
+            return
+        if self.RETRY_PATTERN.search(message):
+            self.job._retries += 1
+        match = self.RESUME_PATTERN.search(message)
+        if match:
+            self.job._resume_offset = int(match.group(1))
+
+    def info(self, message):
+        self.debug(message)
+
+    def warning(self, message):
+        self.debug(message)
+
+    def error(self, message):
+        pass
+
+# Failure classification
+ERROR_TRANSIENT = "transient"
+ERROR_RATE_LIMITED = "rate_limited"
+ERROR_RESTRICTED = "restricted"
+ERROR_PERMANENT = "permanent"
+
+# Checked in this order against the lowercased error message
+ERROR_PATTERNS = [
+    (ERROR_RATE_LIMITED, re.compile(r"http error 429|too many requests|rate.?limit|not a bot")),
+    (ERROR_RESTRICTED, re.compile(r"not (?:made this video )?available in your country|geo.?restrict|"
+                                  r"confirm your age|age.?restrict|inappropriate for some users|private video|"
+                                  r"members.?only|join this channel|requires payment|sign in")),
+    (ERROR_PERMANENT, re.compile(r"video unavailable|has been removed|unsupported url|http error 40[0461]|"
+                                 r"http error 410|not a valid url|does not exist|no video formats|"
+                                 r"requested format is not available|no space left|permission denied|"
+                                 # Checked before the generic ssl errors below, retrying cannot fix a certificate
+                                 r"certificate[_ ]verify[_ ]failed|certificate has expired|self.signed certificate")),
+    (ERROR_TRANSIENT, re.compile(r"http error 403|http error 5\d\d|timed? ?out|connection (?:reset|refused|aborted)|"
+                                 r"remote end closed|incompleteread|incomplete read|temporary failure|"
+                                 r"name resolution|network is unreachable|unable to download|giving up after|"
+                                 r"broken pipe|eof occurred|ssl|fragment")),
+]
+
+def classify_error(error):
+    """
+    Sort a download error into ERROR_TRANSIENT (worth retrying soon), ERROR_RATE_LIMITED
+    (retry once the site calms down), ERROR_RESTRICTED (geo, age or account locked)
+    or ERROR_PERMANENT. Unrecognized network errors count as transient, anything else
+    as permanent.
+    """
+    # yt-dlp wraps the original exception, whose type says more than the message
+    original = error
+    exc_info = getattr(error, 'exc_info', None)
+    if exc_info and exc_info[1] is not None:
+        original = exc_info[1]
+    if type(original).__name__ == "GeoRestrictedError":
+        return ERROR_RESTRICTED
+
+    message = f"{error} {original}".lower()
+    for error_class, pattern in ERROR_PATTERNS:
+        if pattern.search(message):
+            return error_class
+    if isinstance(original, (OSError, TimeoutError)):
+        return ERROR_TRANSIENT
+    return ERROR_PERMANENT
+
+def host_key(url):
+    """Site a URL belongs to, used to cool down rate limited sites as a whole"""
+    try:
+        host = (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+    if host == "youtu.be":
+        return "youtube.com"
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+# Extraction end marker
+def phase_marker(job):
+    """Postprocessor that runs right before yt-dlp starts a download and marks the end of extraction"""
+    return _phase_marker_class()(job)
+
+@lru_cache(maxsize=None)
+def _phase_marker_class():
+    # Defined on first use, importing this module must not import yt-dlp
+    from yt_dlp.postprocessor import PostProcessor
+
+    class PhaseMarker(PostProcessor):
+        def __init__(self, job):
+            super().__init__()
+            self.job = job
+
+        def run(self, info):
+            if self.job is not None:
+                self.job._mark_extracted(info)
+            return [], info
+
+    return PhaseMarker
+
+# ffmpeg processes started by yt-dlp
+# Threads watching for the ffmpeg processes they start, see watch_ffmpeg
+_ffmpeg_watchers = {}
+_ffmpeg_lock = threading.Lock()
+
+@contextmanager
+def watch_ffmpeg():
+    """
+    Collect the ffmpeg processes yt-dlp starts on this thread during a with block in
+    the list it yields, so another thread can stop them. yt-dlp's ffmpeg downloader
+    only hands out its process when reading from a pipe.
+    """
+    _watched_popen_class()
+    processes = []
+    with _ffmpeg_lock:
+        _ffmpeg_watchers[threading.get_ident()] = processes
+    try:
+        yield processes
+    finally:
+        with _ffmpeg_lock:
+            _ffmpeg_watchers.pop(threading.get_ident(), None)
+
+@lru_cache(maxsize=None)
+def _watched_popen_class():
+    # Installed on first use, importing this module must not import yt-dlp
+    from yt_dlp.downloader import external
+
+    class WatchedPopen(external.Popen):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            with _ffmpeg_lock:
+                processes = _ffmpeg_watchers.get(threading.get_ident())
+                if processes is not None:
+                    processes.append(self)
+
+    external.Popen = WatchedPopen
+    return WatchedPopen
+
+# Warm YoutubeDL instances
+class YoutubeDLPool:
+    """
+    Long-lived YoutubeDL instances, each lent to one download or extraction at a
+    time. A reused instance keeps its extractors with the player and signature data
+    they worked out, its cookies and, with yt-dlp's requests handler, its open
+    connections. cache_dir is passed to every instance as yt-dlp's on-disk cache,
+    so player code and signature functions also survive restarts.
+
+    Instances are matched by their options. An instance lent for a DownloadJob also
+    reports progress, log messages and the end of extraction to that job. Instances
+    whose user raised are closed rather than reused, and at most max_idle wait
+    idle, the least recently used one being closed first.
+    """
+    def __init__(self, cache_dir=None, max_idle=16):
+        self.cache_dir = cache_dir
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        # (key, entry) pairs, least recently used first
+        self._idle = []
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def acquire(self, options, job=None):
+        """Lend a YoutubeDL with options for the duration of a with block"""
+        key = (job is not None, repr(sorted(options.items())))
+        entry = self._take(key) or self._create(options, job is not None)
+        entry.job = entry.logger.job = entry.marker.job = job
+        try:
+            yield entry.ydl
+        except BaseException:
+            entry.ydl.close()
+            raise
+        entry.job = entry.logger.job = entry.marker.job = None
+        self._put(key, entry)
+
+    def close(self):
+        with self.lock:
+            idle, self._idle = self._idle, []
+        for _, entry in idle:
+            entry.ydl.close()
+
+    def _take(self, key):
+        with self.lock:
+            for index in range(len(self._idle) - 1, -1, -1):
+                if self._idle[index][0] == key:
+                    self.reused += 1
+                    return self._idle.pop(index)[1]
+        return None
+
+    def _put(self, key, entry):
+        with self.lock:
+            self._idle.append((key, entry))
+            evicted = self._idle[:-self.max_idle] if len(self._idle) > self.max_idle else []
+            del self._idle[:len(evicted)]
+        for _, old in evicted:
+            old.ydl.close()
+
+    def _create(self, options, for_job):
+        import yt_dlp
+        entry = _PooledYoutubeDL()
+        options = dict(options)
+        if self.cache_dir and 'cachedir' not in options:
+            options['cachedir'] = self.cache_dir
+        if for_job:
+            options['progress_hooks'] = [lambda d: entry.job._progress_hook(d)]
+            options['logger'] = entry.logger
+        entry.ydl = yt_dlp.YoutubeDL(options)
+        if for_job:
+            entry.ydl.add_post_processor(entry.marker, when='before_dl')
+        with self.lock:
+            self.created += 1
+        return entry
+
+class _PooledYoutubeDL:
+    def __init__(self):
+        self.ydl = None
+        self.job = None
+        self.logger = YtdlLogger(None)
+        self.marker = phase_marker(None)
+
+# Lazy yt-dlp import
+def load_yt_dlp():
+    """
+    Import yt-dlp and its extractor classes, returning the seconds it took. Nothing in
+    this module imports yt-dlp before it is needed, so the GUI calls this on a
+    background thread at startup; a first use on another thread meanwhile simply
+    waits on Python's import lock until the import is done.
+    """
+    start = time.perf_counter()
+    from yt_dlp.extractor import gen_extractor_classes
+    gen_extractor_classes()
+    return time.perf_counter() - start
+
+# URL resolver
+class UrlResolver:
+    """
+    Expand a URL into one DownloadItem per video using flat extraction, then fetch
+    each entry's metadata concurrently on a thread pool. With a ydl_pool the
+    extractions run on its warm YoutubeDL instances. Items with sections requested
+    expand further into one item per section.
+    """
+    METADATA_FIELDS = ('id', 'title', 'duration', 'extractor_key', 'filesize', 'filesize_approx',
+                       'format_id', 'format_plan', 'chapters')
+
+    def __init__(self, max_workers=4, info_cache=None, ydl_pool=None, audio_copy=False):
+        self.max_workers = max_workers
+        self.info_cache = info_cache
+        self.ydl_pool = ydl_pool
+        # Must match the download jobs' setting, it is part of the format selection they reuse
+        self.audio_copy = audio_copy
+        self._local = threading.local()
+        self._instances = []
+
+    def resolve(self, item, on_metadata, on_log):
+        """
+        Return the items that replace item in the queue. A single video resolves to
+        [item] with its metadata reported through on_metadata. Playlist entries come
+        with flat metadata only, see needs_metadata.
+        """
+        import yt_dlp
+        try:
+            # Playlist entries come back unresolved, a single video is extracted fully
+            options = {
+                'format': format_selector(item.format_type, item.quality, self.audio_copy),
+                'extract_flat': 'in_playlist',
+                'quiet': True,
+                'no_warnings': True,
+                'socket_timeout': 30,
+            }
+            context = self.ydl_pool.acquire(options) if self.ydl_pool is not None else yt_dlp.YoutubeDL(options)
+            with context as ydl:
+                info = ydl.extract_info(item.url, download=False)
+                if info.get('_type') not in ('playlist', 'multi_video'):
+                    self._cache_info(ydl, item, info)
+
+            if info.get('_type') not in ('playlist', 'multi_video'):
+                metadata = self._summarize(info)
+                on_metadata(item, metadata)
+                return split_sections(item, metadata, on_log)
+
+            entries = [entry for entry in info.get('entries') or [] if entry]
+        except Exception as e:
+            # Fall back to queueing the URL as given. Time ranges need nothing from the
+            # video, chapters cannot be found without it.
+            on_log(f"Could not resolve {item.url}: {str(e)}")
+            return split_sections(item, {}, on_log)
+
+        items = []
+        for entry in entries:
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            if not entry_url:
+                continue
+            entry_item = DownloadItem(entry_url, item.output_path, item.format_type, item.quality)
+            entry_item.title = entry.get('title') or "Unknown"
+            entry_item.metadata = self._summarize(entry)
+            entry_item.priority = item.priority
+            entry_item.deadline = item.deadline
+            # Flat entries come without chapters, so only time ranges can be found in them
+            entry_item.sections = item.sections
+            items += split_sections(entry_item, entry_item.metadata, lambda message: None)
+            entry_item.sections = None
+
+        on_log(f"Playlist {info.get('title', item.url)} expanded into {len(items)} videos")
+        if item.sections and parse_sections(item.sections)[1]:
+            on_log("Chapters can only be selected for single videos, the playlist's videos are marked failed")
+        return items
+
+    @staticmethod
+    def needs_metadata(item):
+        """
+        True for a playlist entry that only has the playlist's flat metadata so far.
+        Fully extracted videos, and the sections split from them, carry the chosen
+        format; items of a URL that could not be resolved carry nothing to go on.
+        """
+        return item.status != "Failed" and 'id' in item.metadata and 'format_id' not in item.metadata
+
+    def fetch_metadata(self, items, on_metadata, on_log):
+        """Fetch full metadata for every item, several extractions at a time"""
+        # Sections of the same video share one extraction
+        groups = {}
+        for item in items:
+            groups.setdefault((item.url, item.format_type, item.quality), []).append(item)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._fetch_metadata, group[0]): group for group in groups.values()}
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    metadata = future.result()
+                except Exception as e:
+                    on_log(f"Could not fetch metadata for {group[0].url}: {str(e)}")
+                    continue
+                for item in group:
+                    on_metadata(item, dict(metadata))
+
+        for ydl in self._instances:
+            ydl.close()
+        self._instances = []
+
+    def _fetch_metadata(self, item):
+        options = {
+            'format': format_selector(item.format_type, item.quality, self.audio_copy),
+            'quiet': True,
+            'no_warnings': True,
+            'socket_timeout': 30,
+        }
+        if self.ydl_pool is not None:
+            with self.ydl_pool.acquire(options) as ydl:
+                info = ydl.extract_info(item.url, download=False)
+                self._cache_info(ydl, item, info)
+            return self._summarize(info)
+
+        # YoutubeDL instances are not thread-safe, so each pool thread gets its own
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            import yt_dlp
+            ydl = self._local.ydl = yt_dlp.YoutubeDL(options)
+            self._instances.append(ydl)
+        info = ydl.extract_info(item.url, download=False)
+        self._cache_info(ydl, item, info)
+        return self._summarize(info)
+
+    def _cache_info(self, ydl, item, info):
+        # The download job picks this up instead of extracting the same video again
+        if self.info_cache is not None:
+            cache_key = InfoCache.key_for(item.url, repr(format_selector(item.format_type, item.quality, self.audio_copy)))
+            if cache_key:
+                self.info_cache.put(cache_key, ydl.sanitize_info(info))
+
+    def _summarize(self, info):
+        return {key: info.get(key) for key in self.METADATA_FIELDS if info.get(key) is not None}
+
+def format_selector(format_type, quality, audio_copy=False):
+    """Format selector for yt-dlp's 'format' option; streams are only merged when ffmpeg is there to do it"""
+    return FormatSelector(format_type, quality, can_merge=find_ffmpeg() is not None,
+                          audio_copy=audio_copy and format_type != "Video (MP4)")
+
+def audio_tags(info):
+    """Tags written into audio files, from the video's metadata"""
+    tags = {
+        'title': info.get('track') or info.get('title'),
+        'artist': info.get('artist') or info.get('uploader'),
+        'album': info.get('album'),
+        'date': (info.get('release_date') or info.get('upload_date') or "")[:4] or None,
+    }
+    return {key: value for key, value in tags.items() if value}
+
+def format_size(bytes):
+    """Format bytes to human-readable size"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if bytes < 1024:
+            return f"{bytes:.2f} {unit}"
+        bytes /= 1024
+    return f"{bytes:.2f} TB"
+
+# Background log file writer
+class LogWriter(threading.Thread):
+    """Append log lines to a daily log file from a background thread, in batches"""
+    def __init__(self, log_dir, batch_size=200, flush_interval=1.0):
+        super().__init__(daemon=True)
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._file = None
+        self._file_date = None
+    
+    def write(self, line):
+        """Queue a line for writing; never touches the filesystem on the caller's thread"""
+        self._queue.put((datetime.now().strftime('%Y%m%d'), line))
+    
+    def close(self):
+        """Flush everything queued so far and stop the writer thread"""
+        if self.is_alive():
+            self._queue.put(None)
+            self.join(timeout=5)
+    
+    def run(self):
+        batch = []
+        deadline = 0.0
+        running = True
+        
+        while running:
+            try:
+                timeout = max(0.0, deadline - time.monotonic()) if batch else None
+                entry = self._queue.get(timeout=timeout)
+                if entry is None:
+                    running = False
+                else:
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(entry)
+                    if len(batch) < self.batch_size:
+                        continue
+            except queue.Empty:
+                pass
+            
+            self._flush(batch)
+            batch = []
+        
+        if self._file:
+            self._file.close()
+    
+    def _flush(self, batch):
+        try:
+            for date, line in batch:
+                # Rotate to a new file when the day changes
+                if date != self._file_date:
+                    self._open(date)
+                self._file.write(line + "\n")
+            if self._file:
+                self._file.flush()
+        except Exception as e:
+            print(f"Error writing to log file: {str(e)}")
+    
+    def _open(self, date):
+        if self._file:
+            self._file.close()
+            self._file = None
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._file = open(os.path.join(self.log_dir, f"log_{date}.txt"), "a", encoding="utf-8")
+        self._file_date = date
+
+# Download History Store
+class HistoryStore:
+    """Download history persisted in SQLite, one row inserted per finished download"""
+    FIELDS = ("url", "title", "format", "quality", "date", "status")
+    SCHEMA_VERSION = 1
+    
+    def __init__(self, db_path, legacy_json_path=None, on_log=None):
+        self.db_path = db_path
+        self.on_log = on_log or (lambda message: None)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        if db_path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    format TEXT,
+                    quality TEXT,
+                    date TEXT,
+                    status TEXT
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_url ON history (url)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_date ON history (date)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_status ON history (status)")
+        
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            if legacy_json_path:
+                self._migrate_json(legacy_json_path)
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+    
+    def _migrate_json(self, json_path):
+        """
+        One-time import of the old yt_downloader_history.json file. A file that
+        cannot be imported is renamed to .bad and the store starts without it.
+        """
+        if not os.path.exists(json_path):
+            return
+        
+        try:
+            with open(json_path, "r") as f:
+                entries = json.load(f)
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO history (url, title, format, quality, date, status) VALUES (?, ?, ?, ?, ?, ?)",
+                    [tuple(entry.get(field, "") for field in self.FIELDS) for entry in entries]
+                )
+        except (OSError, ValueError, TypeError, AttributeError, sqlite3.Error) as e:
+            try:
+                os.replace(json_path, json_path + ".bad")
+                self.on_log(f"Could not import old history {json_path} ({str(e)}), renamed it to .bad")
+            except OSError as rename_error:
+                self.on_log(f"Could not import old history {json_path} ({str(e)}) "
+                            f"nor rename it ({str(rename_error)})")
+            return
+        
+        # Keep the old file around as a backup, but never import it twice
+        os.replace(json_path, json_path + ".migrated")
+    
+    def add(self, entry):
+        """Insert a history entry dict and return its row id"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO history (url, title, format, quality, date, status) VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(entry.get(field, "") for field in self.FIELDS)
+            )
+        return cursor.lastrowid
+    
+    def get(self, entry_id):
+        row = self.conn.execute("SELECT * FROM history WHERE id = ?", (entry_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def count(self, text_filter=""):
+        where, params = self._where(text_filter)
+        return self.conn.execute(f"SELECT COUNT(*) FROM history {where}", params).fetchone()[0]
+    
+    def page(self, offset, limit, order_by="date", descending=True, text_filter=""):
+        """Return up to limit entries starting at offset in the given order, newest first by default"""
+        where, params = self._where(text_filter)
+        rows = self.conn.execute(
+            f"SELECT * FROM history {where} {self._order(order_by, descending)} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def position(self, entry_id, order_by="date", descending=True, text_filter=""):
+        """Return the offset an entry has in page() order, or None if the filter excludes it"""
+        entry = self.get(entry_id)
+        if entry is None:
+            return None
+        
+        where, params = self._where(text_filter, "id = ?")
+        if not self.conn.execute(f"SELECT COUNT(*) FROM history {where}", params + [entry_id]).fetchone()[0]:
+            return None
+        
+        # Rows ahead of the entry in page() order. SQLite sorts NULL below every value, which
+        # comparisons do not see, so rows with a NULL column are placed explicitly.
+        column = self._column(order_by)
+        op = '>' if descending else '<'
+        if entry[column] is None:
+            before = f"({column} IS NULL AND id {op} ?)" + (f" OR {column} IS NOT NULL" if descending else "")
+            before_params = [entry_id]
+        else:
+            before = f"{column} {op} ? OR ({column} = ? AND id {op} ?)" + ("" if descending else f" OR {column} IS NULL")
+            before_params = [entry[column], entry[column], entry_id]
+        where, params = self._where(text_filter, f"({before})")
+        return self.conn.execute(f"SELECT COUNT(*) FROM history {where}", params + before_params).fetchone()[0]
+    
+    def _column(self, order_by):
+        # Only known field names ever reach the SQL text
+        return order_by if order_by in self.FIELDS else "date"
+    
+    def _order(self, order_by, descending):
+        direction = "DESC" if descending else "ASC"
+        return f"ORDER BY {self._column(order_by)} {direction}, id {direction}"
+    
+    def _where(self, text_filter, extra=None):
+        clauses, params = [], []
+        if text_filter:
+            pattern = "%" + text_filter.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(title LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        if extra:
+            clauses.append(extra)
+        return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+    
+    def urls(self, status=None):
+        """Distinct URLs in the history, only those with the given status if one is set"""
+        return self._select_urls(self.conn, status)
+    
+    @classmethod
+    def read_urls(cls, db_path, status=None):
+        """urls() of the history in db_path on a connection of its own, so any thread can call it"""
+        conn = sqlite3.connect(db_path)
+        try:
+            return cls._select_urls(conn, status)
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _select_urls(conn, status):
+        where, params = ("WHERE status = ?", [status]) if status else ("", [])
+        return [row[0] for row in conn.execute(f"SELECT DISTINCT url FROM history {where}", params)]
+    
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM history")
+    
+    def close(self):
+        self.conn.close()
+
+# Persistent Download Queue
+class QueueStore:
+    """
+    The download queue persisted in SQLite so it survives restarts and crashes. Each
+    change writes only the rows it touches, appended to the WAL journal instead of
+    rewriting the queue. Items are linked to their rows through item.queue_id.
+    """
+    FIELDS = ("url", "output_path", "format_type", "quality", "title", "status",
+              "progress", "downloaded_bytes", "metadata", "date_added", "priority", "deadline",
+              "sections", "section_start", "section_end", "section_title", "partial_files")
+    # Columns added after the first version of the table, with their types
+    ADDED_COLUMNS = {"priority": "INTEGER DEFAULT 0", "deadline": "REAL", "sections": "TEXT",
+                     "section_start": "REAL", "section_end": "REAL", "section_title": "TEXT",
+                     "partial_files": "TEXT"}
+    # Items saved in these states were running when the application stopped
+    IN_PROGRESS_STATES = ("Downloading", "Converting", "Waiting to retry")
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        if db_path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    position REAL NOT NULL,
+                    url TEXT NOT NULL,
+                    output_path TEXT,
+                    format_type TEXT,
+                    quality TEXT,
+                    title TEXT,
+                    status TEXT,
+                    progress INTEGER,
+                    downloaded_bytes INTEGER,
+                    metadata TEXT,
+                    date_added TEXT,
+                    priority INTEGER DEFAULT 0,
+                    deadline REAL,
+                    sections TEXT,
+                    section_start REAL,
+                    section_end REAL,
+                    section_title TEXT,
+                    partial_files TEXT
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_position ON queue (position)")
+            
+            # Queues saved by older versions lack the newer columns
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(queue)")}
+            for column, definition in self.ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE queue ADD COLUMN {column} {definition}")
+    
+    def load(self):
+        """Return the stored items in queue order, in the state they were last saved in"""
+        items = []
+        for row in self.conn.execute("SELECT * FROM queue ORDER BY position, id"):
+            item = DownloadItem(row['url'], row['output_path'], row['format_type'], row['quality'])
+            item.title = row['title']
+            item.status = row['status']
+            item.progress = row['progress'] or 0
+            item.downloaded_bytes = row['downloaded_bytes'] or 0
+            item.metadata = json.loads(row['metadata']) if row['metadata'] else {}
+            item.date_added = row['date_added']
+            item.priority = row['priority'] or 0
+            item.deadline = row['deadline']
+            item.sections = row['sections']
+            if row['section_start'] is not None:
+                item.section = (row['section_start'], row['section_end'], row['section_title'])
+            item.partial_files = [tuple(paths) for paths in json.loads(row['partial_files'] or "[]")]
+            item.queue_id = row['id']
+            items.append(item)
+        return items
+    
+    def add(self, items):
+        """Append items at the end of the queue"""
+        last = self.conn.execute("SELECT MAX(position) FROM queue").fetchone()[0] or 0
+        with self.conn:
+            self._insert(items, [last + offset for offset in range(1, len(items) + 1)])
+    
+    def replace(self, item, items):
+        """Swap the row of item for rows of items at the same place in the queue"""
+        row = self.conn.execute("SELECT position FROM queue WHERE id = ?", (item.queue_id,)).fetchone()
+        if row is None:
+            self.add(items)
+            return
+        
+        # New rows fit between the replaced one and the next, no other row moves
+        start = row['position']
+        end = self.conn.execute("SELECT MIN(position) FROM queue WHERE position > ?", (start,)).fetchone()[0]
+        step = (end - start) / (len(items) + 1) if end is not None else 1
+        positions = [start + step * offset for offset in range(len(items))]
+        if end is not None and not all(a < b for a, b in zip(positions, positions[1:] + [end])):
+            self._renumber()
+            self.replace(item, items)
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM queue WHERE id = ?", (item.queue_id,))
+            self._insert(items, positions)
+        if item not in items:
+            item.queue_id = None
+    
+    def move(self, item, before=None):
+        """Move the row of item in front of the row of before, or to the end without it"""
+        if item.queue_id is None:
+            return
+        row = None
+        if before is not None and before.queue_id is not None:
+            row = self.conn.execute("SELECT position FROM queue WHERE id = ?", (before.queue_id,)).fetchone()
+        if row is None:
+            last = self.conn.execute("SELECT MAX(position) FROM queue").fetchone()[0] or 0
+            position = last + 1
+        else:
+            # Halfway to the previous row, no other row moves
+            end = row['position']
+            start = self.conn.execute("SELECT MAX(position) FROM queue WHERE position < ? AND id != ?",
+                                      (end, item.queue_id)).fetchone()[0]
+            position = (start + end) / 2 if start is not None else end - 1
+            if start is not None and not start < position < end:
+                self._renumber()
+                self.move(item, before)
+                return
+        with self.conn:
+            self.conn.execute("UPDATE queue SET position = ? WHERE id = ?", (position, item.queue_id))
+    
+    def save(self, item):
+        """Write the current state of a stored item"""
+        if item.queue_id is None:
+            return
+        with self.conn:
+            self.conn.execute(
+                f"UPDATE queue SET {', '.join(field + ' = ?' for field in self.FIELDS)} WHERE id = ?",
+                self._values(item) + (item.queue_id,)
+            )
+    
+    def remove(self, item):
+        if item.queue_id is None:
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM queue WHERE id = ?", (item.queue_id,))
+        item.queue_id = None
+    
+    def _renumber(self):
+        # Halving between the same rows runs out of float precision after some fifty moves,
+        # whole positions in the current order make room again
+        rows = self.conn.execute("SELECT id FROM queue ORDER BY position, id").fetchall()
+        with self.conn:
+            self.conn.executemany("UPDATE queue SET position = ? WHERE id = ?",
+                                  [(position, row['id']) for position, row in enumerate(rows, 1)])
+    
+    def _insert(self, items, positions):
+        for item, position in zip(items, positions):
+            cursor = self.conn.execute(
+                f"INSERT INTO queue (position, {', '.join(self.FIELDS)}) VALUES (?{', ?' * len(self.FIELDS)})",
+                (position,) + self._values(item)
+            )
+            item.queue_id = cursor.lastrowid
+    
+    def _values(self, item):
+        return (item.url, item.output_path, item.format_type, item.quality, item.title, item.status,
+                item.progress, item.downloaded_bytes, json.dumps(item.metadata, default=str), item.date_added,
+                item.priority, item.deadline, item.sections) + (item.section or (None, None, None)) + \
+               (json.dumps(item.partial_files) if item.partial_files else None,)
+    
+    def close(self):
+        self.conn.close()
+
+# Download Archive
+class DownloadArchive:
+    """
+    Set of "<extractor> <video id>" keys of finished downloads, backed by a file in
+    yt-dlp's --download-archive format. An instance can be passed to yt-dlp directly
+    as the download_archive option.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._ids = set()
+        self._lock = threading.Lock()
+        
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._ids.update(line.strip() for line in f if line.strip())
+    
+    def __contains__(self, archive_id):
+        return archive_id in self._ids
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def add(self, archive_id):
+        """Record a finished download; called by yt-dlp from worker threads"""
+        with self._lock:
+            if archive_id in self._ids:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(archive_id + "\n")
+            self._ids.add(archive_id)
+
+@lru_cache(maxsize=4096)
+def archive_id_for_url(url):
+    """Work out the archive key of a URL from the URL alone, without any network access"""
+    from yt_dlp.extractor import gen_extractor_classes
+    from yt_dlp.utils import make_archive_id
+    for ie in gen_extractor_classes():
+        if ie.ie_key() == "Generic":
+            continue
+        if ie.suitable(url):
+            video_id = ie.get_temp_id(url)
+            return make_archive_id(ie, video_id) if video_id else None
+    return None
+
+@lru_cache(maxsize=4096)
+def extractor_for_url(url):
+    """Name of the extractor yt-dlp would pick for a URL, used to label metrics"""
+    from yt_dlp.extractor import gen_extractor_classes
+    for ie in gen_extractor_classes():
+        if ie.ie_key() != "Generic" and ie.suitable(url):
+            return ie.ie_key().lower()
+    return "generic"
+
+# Bulk URL import
+URL_PATTERN = re.compile(r'(?:https?://|www\.|(?:m\.)?youtube\.com/|youtu\.be/)[^\s,;|"\'<>]+', re.IGNORECASE)
+YOUTUBE_ID_PATTERN = re.compile(r'^[0-9A-Za-z_-]{11}$')
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com",
+                 "www.youtube-nocookie.com")
+YOUTUBE_WATCH_URL = "https://www.youtube.com/watch?v="
+
+def find_urls(text):
+    """URL-like tokens in free text, one-per-line lists and CSV exports alike"""
+    return [match.group(0).rstrip(").]") for match in URL_PATTERN.finditer(text)]
+
+def normalize_url(url):
+    """
+    Canonical form of a URL, or None if it is not a usable http(s) URL. YouTube
+    video links of every shape (youtu.be, shorts, embed, mobile, extra parameters)
+    become one watch URL, so the same video always looks the same.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ("http", "https") or not host:
+        return None
+
+    if host == "youtu.be" or host in YOUTUBE_HOSTS:
+        query = parse_qs(parts.query)
+        segments = [segment for segment in parts.path.split("/") if segment]
+        video_id = None
+        if host == "youtu.be":
+            video_id = segments[0] if segments else None
+        elif parts.path == "/watch":
+            video_id = query.get("v", [None])[0]
+        elif len(segments) >= 2 and segments[0] in ("shorts", "embed", "live", "v"):
+            video_id = segments[1]
+        elif parts.path == "/playlist" and query.get("list"):
+            return f"https://www.youtube.com/playlist?list={query['list'][0]}"
+
+        if video_id and YOUTUBE_ID_PATTERN.match(video_id):
+            return YOUTUBE_WATCH_URL + video_id
+
+    # Everything else keeps its path and query, only the fragment is dropped
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+def is_single_video(url):
+    """True for normalized URLs that are known to be one video without resolving them"""
+    return url.startswith(YOUTUBE_WATCH_URL)
+
+def video_key(url):
+    """Identity of the video behind a URL, used to find duplicates: its archive id when known"""
+    url = normalize_url(url) or url
+    if is_single_video(url):
+        # Same key yt-dlp's archive uses, without matching the URL against every extractor
+        return "youtube " + url[len(YOUTUBE_WATCH_URL):]
+    return archive_id_for_url(url) or url
+
+def plan_import(candidates, known_keys):
+    """
+    Normalize candidate URLs and drop invalid ones and duplicates, both within the
+    candidates and of known_keys (see video_key). Returns (urls, invalid, duplicates):
+    the canonical URLs to add in input order and the counts of what was dropped.
+    known_keys is updated with the keys of the returned URLs.
+    """
+    urls, invalid, duplicates = [], 0, 0
+    for candidate in candidates:
+        url = normalize_url(candidate)
+        if url is None:
+            invalid += 1
+            continue
+        key = video_key(url)
+        if key in known_keys:
+            duplicates += 1
+            continue
+        known_keys.add(key)
+        urls.append(url)
+    return urls, invalid, duplicates
+
+def prepare_output_directory(path):
+    """Create path if it does not exist; returns an error message, or None if it is writable"""
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path, exist_ok=True)
+        except Exception as e:
+            return f"Cannot create output directory: {str(e)}"
+    if not os.access(path, os.W_OK):
+        return f"No write permission for directory: {path}"
+    return None
+
+# Extracted Info Cache
+class InfoCache:
+    """
+    On-disk cache of extracted info dicts keyed by video and format selection. Entries
+    expire after a TTL or when the signed stream URLs inside them do, whichever is
+    first, and the least recently used ones are evicted past max_bytes.
+    """
+    # Stop using an entry this many seconds before its stream URLs expire
+    EXPIRY_MARGIN = 300
+    EXPIRE_PATTERN = re.compile(r'[?&/]expire[=/](\d+)')
+    
+    def __init__(self, db_path, ttl=3600, max_bytes=100 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Shared by all worker threads, every access goes through the lock
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        if db_path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS info_cache (
+                    key TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_info_cache_last_used ON info_cache (last_used)")
+    
+    @staticmethod
+    def key_for(url, format_key):
+        """Cache key for a URL and format selection, or None if the URL has no known video ID"""
+        archive_id = archive_id_for_url(url)
+        return f"{archive_id}|{format_key}" if archive_id else None
+    
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT data, expires FROM info_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                with self.conn:
+                    self.conn.execute("DELETE FROM info_cache WHERE key = ?", (key,))
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE info_cache SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(zlib.decompress(row[0]))
+    
+    def put(self, key, info):
+        now = time.time()
+        data = zlib.compress(json.dumps(info).encode("utf-8"))
+        expires = self._expiry(info, now)
+        if expires <= now:
+            return
+        
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO info_cache (key, data, size, expires, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), expires, now)
+            )
+            self.conn.execute("DELETE FROM info_cache WHERE expires <= ?", (now,))
+            self._evict()
+    
+    def invalidate(self, key):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM info_cache WHERE key = ?", (key,))
+    
+    def _expiry(self, info, now):
+        expires = now + self.ttl
+        formats = (info.get('formats') or []) + (info.get('requested_formats') or []) + [info]
+        for fmt in formats:
+            for field in ('url', 'manifest_url', 'fragment_base_url'):
+                match = self.EXPIRE_PATTERN.search(fmt.get(field) or "")
+                if match:
+                    expires = min(expires, int(match.group(1)) - self.EXPIRY_MARGIN)
+        return expires
+    
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM info_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM info_cache ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM info_cache WHERE key = ?", stale)
+
+# Bandwidth limiting
+class TokenBucket:
+    """Token bucket refilled at rate bytes per second; a rate of 0 means unlimited"""
+    def __init__(self, rate=0, burst=1.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate):
+        self._refill(time.monotonic())
+        self.rate = rate
+
+    def reserve(self, nbytes):
+        """Take nbytes from the bucket and return how long the caller has to wait for them"""
+        now = time.monotonic()
+        self._refill(now)
+        if not self.rate:
+            return 0.0
+        # Chunks can be larger than the bucket, the debt is paid off by waiting
+        self.tokens -= nbytes
+        return max(0.0, -self.tokens / self.rate)
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.rate * self.burst, self.tokens + (now - self.updated) * self.rate)
+        else:
+            self.tokens = 0.0
+        self.updated = now
+
+class BandwidthManager:
+    """
+    Split a global download rate across the active jobs, each throttled by its own
+    token bucket. Jobs get a share proportional to their weight, capped at
+    per_item_limit, and whatever a capped job cannot use goes to the others.
+
+    schedule is a list of (start, end, limit) windows, start and end as "HH:MM"
+    local time (a window may wrap past midnight); inside a window its limit replaces
+    global_limit. All rates are bytes per second, 0 meaning unlimited.
+    """
+    def __init__(self, global_limit=0, per_item_limit=0, schedule=None):
+        self.lock = threading.Lock()
+        self._buckets = {}
+        self._weights = {}
+        self._current_limit = None
+        self.configure(global_limit, per_item_limit, schedule)
+
+    def configure(self, global_limit=0, per_item_limit=0, schedule=None):
+        """Change the limits; downloads already running pick them up immediately"""
+        with self.lock:
+            self.global_limit = global_limit
+            self.per_item_limit = per_item_limit
+            self.schedule = [(self._minutes(start), self._minutes(end), limit)
+                             for start, end, limit in schedule or []]
+            self._rebalance()
+
+    @staticmethod
+    def _minutes(hhmm):
+        hours, minutes = hhmm.split(":")
+        return int(hours) * 60 + int(minutes)
+
+    def limit_now(self):
+        """The global limit in effect right now, after applying the schedule"""
+        now = datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, limit in self.schedule:
+            if start <= end:
+                inside = start <= minute < end
+            else:
+                inside = minute >= start or minute < end
+            if inside:
+                return limit
+        return self.global_limit
+
+    def register(self, key, weight=1):
+        with self.lock:
+            self._buckets[key] = TokenBucket()
+            self._weights[key] = max(weight, 1)
+            self._rebalance()
+
+    def set_weight(self, key, weight):
+        with self.lock:
+            if key in self._weights:
+                self._weights[key] = max(weight, 1)
+                self._rebalance()
+
+    def unregister(self, key):
+        with self.lock:
+            self._buckets.pop(key, None)
+            self._weights.pop(key, None)
+            self._rebalance()
+
+    def rate_for(self, key):
+        """Effective rate of one job, 0 when it is not limited"""
+        with self.lock:
+            bucket = self._buckets.get(key)
+            return bucket.rate if bucket else 0
+
+    def consume(self, key, nbytes):
+        """Account nbytes downloaded by a job; returns the seconds it should pause"""
+        with self.lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return 0.0
+            # Schedule windows are crossed while downloads are running
+            if self.limit_now() != self._current_limit:
+                self._rebalance()
+            return bucket.reserve(nbytes)
+
+    def _rebalance(self):
+        # Weighted max-min fair split, called with the lock held
+        self._current_limit = self.limit_now()
+        remaining = self._current_limit
+        total_weight = sum(self._weights.values())
+        cap = self.per_item_limit or float('inf')
+
+        # Heaviest jobs hit the per-item cap first, so their leftovers are shared by the rest
+        for key in sorted(self._buckets, key=self._weights.get, reverse=True):
+            weight = self._weights[key]
+            if self._current_limit:
+                rate = min(cap, remaining * weight / total_weight)
+                remaining -= rate
+            else:
+                rate = self.per_item_limit
+            total_weight -= weight
+            self._buckets[key].set_rate(int(rate))
+
+# Download Queue Item
+# Queue item priorities, higher ones are scheduled first and get a bigger share of the bandwidth
+PRIORITY_HIGH = 1
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -1
+PRIORITY_NAMES = {PRIORITY_HIGH: "High", PRIORITY_NORMAL: "Normal", PRIORITY_LOW: "Low"}
+PRIORITY_WEIGHTS = {PRIORITY_HIGH: 4, PRIORITY_NORMAL: 2, PRIORITY_LOW: 1}
+
+class DownloadItem:
+    def __init__(self, url, output_path, format_type, quality):
+        self.url = url
+        self.output_path = output_path
+        self.format_type = format_type
+        self.quality = quality
+        self.status = "Queued"
+        self.progress = 0
+        self.speed = None
+        self.eta = None
+        self.downloaded_bytes = 0
+        self.rate_limit = 0
+        self.worker = None
+        self.title = "Unknown"
+        self.metadata = {}
+        self.date_added = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Row of the item in a QueueStore
+        self.queue_id = None
+        # Failed attempts so far and when the next one may start (time.monotonic())
+        self.attempts = 0
+        self.retry_at = None
+        self.error_class = None
+        self.priority = PRIORITY_NORMAL
+        # Wall clock time (time.time()) the item should be done by, None for no deadline
+        self.deadline = None
+        # Position in the queue as last seen by the scheduler, see DownloadScheduler.reorder
+        self.order = None
+        # Time ranges and chapter names as typed when the URL was added, see parse_sections;
+        # UrlResolver turns them into one item per section
+        self.sections = None
+        # (start, end, title) in seconds of the only part of the video to download, None for
+        # all of it; end is None to download to the end, title the chapter name if any
+        self.section = None
+        # Partial files a paused download left for resuming, see DownloadJob.partial_files
+        self.partial_files = []
+
+def expected_bytes(item):
+    """Size of the item's download according to its metadata, None when it is unknown"""
+    size = item.metadata.get('filesize') or item.metadata.get('filesize_approx')
+    if not size:
+        return None
+    duration = item.metadata.get('duration')
+    if item.section is not None and duration:
+        # Streams are assumed to spread their bytes evenly over time
+        size = int(size * (section_seconds(item.section, duration) or 0) / duration)
+    return size
+
+def remaining_bytes(item):
+    """Bytes left to download according to the item's metadata, None when its size is unknown"""
+    size = expected_bytes(item)
+    if size is None:
+        return None
+    return max(0, size - item.downloaded_bytes)
+
+def parse_timestamp(text):
+    """Seconds of a [[H:]MM:]SS timestamp such as 1:02:03.5"""
+    parts = text.strip().split(":")
+    if len(parts) > 3 or not all(re.fullmatch(r'\d+(\.\d+)?', part) for part in parts):
+        raise ValueError(f"Invalid time: {text}")
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def parse_sections(text):
+    """
+    Parse comma separated time ranges (1:30-3:00, 1:02:00-end) and chapter names
+    into ([(start, end)], [chapter name]); end is None for the end of the video.
+    Raises ValueError for a range that ends before it starts or gives neither end.
+    """
+    ranges, chapters = [], []
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r'([\d:.]*)\s*-\s*([\d:.]*|end)', part, re.IGNORECASE)
+        if not match:
+            chapters.append(part)
+            continue
+        start = parse_timestamp(match.group(1)) if match.group(1) else 0
+        end = parse_timestamp(match.group(2)) if match.group(2) and match.group(2).lower() != "end" else None
+        # A range with neither end given is the whole video, which is no section
+        if (end is not None and end <= start) or (not match.group(1) and end is None):
+            raise ValueError(f"Invalid time range: {part}")
+        ranges.append((start, end))
+    return ranges, chapters
+
+def select_sections(text, chapters):
+    """
+    Sections for a parse_sections text, as (start, end, title) in video order. Chapter
+    names match the video's chapters case-insensitively, also by part of the title.
+    Returns (sections, names that matched no chapter).
+    """
+    ranges, names = parse_sections(text)
+    sections = [(start, end, None) for start, end in ranges]
+    unmatched = []
+    for name in names:
+        matches = [chapter for chapter in chapters or [] if name.lower() in (chapter.get('title') or "").lower()]
+        if not matches:
+            unmatched.append(name)
+        sections += [(chapter.get('start_time') or 0, chapter.get('end_time'), chapter.get('title'))
+                     for chapter in matches]
+    # The same chapter named twice is downloaded once
+    return sorted(set(sections), key=lambda section: (section[0], section[1] is None, section[1] or 0)), unmatched
+
+def section_label(section):
+    """The chapter name of a section, or its time range such as 1:30-3:00"""
+    start, end, title = section
+    if title:
+        return title
+    return f"{format_timestamp(start)}-{format_timestamp(end) if end is not None else 'end'}"
+
+def section_seconds(section, duration=None):
+    """Length of a section of a video lasting duration seconds, None when it is unknown"""
+    start, end, _ = section
+    if duration:
+        end = min(end, duration) if end is not None else duration
+    return max(0, end - start) if end is not None else None
+
+def with_section(item, section):
+    """Copy of a queue item that downloads only section of the video"""
+    copy = DownloadItem(item.url, item.output_path, item.format_type, item.quality)
+    copy.title = item.title
+    copy.metadata = dict(item.metadata)
+    copy.priority = item.priority
+    copy.deadline = item.deadline
+    copy.section = section
+    return copy
+
+def split_sections(item, metadata, on_log):
+    """
+    The items for the sections item asks for, [item] itself when it asks for
+    none. metadata is the video's, which may not have reached item yet; time ranges
+    need none of it. An item naming a chapter the video does not have comes back
+    "Failed".
+    """
+    if not item.sections:
+        return [item]
+    sections, unmatched = select_sections(item.sections, metadata.get('chapters'))
+    item.sections = None
+    if unmatched:
+        # Downloading the other sections, or the whole video, would pass for what was asked
+        for name in unmatched:
+            on_log(f"No chapter matching {name!r} in {metadata.get('title', item.url)}, not downloading it")
+        item.status = "Failed"
+        item.error_class = ERROR_PERMANENT
+        return [item]
+    if not sections:
+        return [item]
+    if len(sections) == 1:
+        item.section = sections[0]
+        return [item]
+    items = []
+    for section in sections:
+        section_item = with_section(item, section)
+        section_item.metadata = dict(metadata)
+        section_item.title = metadata.get('title') or item.title
+        items.append(section_item)
+    return items
+
+def history_entry(item, success):
+    """Build the history record of a finished queue item"""
+    return {
+        "url": item.url,
+        "title": (item.title if item.title != "Unknown" else item.url)
+                 + (f" [{section_label(item.section)}]" if item.section is not None else ""),
+        "format": item.format_type,
+        "quality": item.quality,
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "status": "Completed" if success else "Failed"
+    }
+
+# Download Queue Scheduler
+class DownloadScheduler:
+    """
+    Run up to max_concurrent queue items at once, each on its own worker.
+
+    Workers come from worker_factory(job, on_progress, on_log, on_finished), which
+    must deliver the three callbacks on the thread that drives the scheduler. The
+    on_* attributes are the scheduler's own events and are called on that thread too.
+
+    With a conversion_pool, finished downloads that need merging or encoding move
+    to converting ("Converting" status) and free their download slot right away.
+
+    Pausing is cooperative: a paused item shows "Pausing" until its worker has really
+    stopped, then "Resumable" if partial data was kept or "Paused" if nothing was
+    downloaded yet. Both go back to "Queued" through resume().
+
+    Downloads that fail with a transient or rate limited error (see classify_error)
+    wait in "Waiting to retry" without holding a slot and are started again after an
+    exponential backoff with jitter, up to max_retries times. Rate limiting also
+    cools down the whole site: none of its items start until the cooldown is over.
+    Both need call_later(delay, callback), which must call callback on the driving
+    thread after delay seconds; without it failures are final.
+
+    Items are picked by priority, then earliest deadline, then queue order. The
+    "sjf" policy puts the smallest remaining download before queue order (shortest
+    job first), which lowers the mean time to completion when sizes vary a lot;
+    items of unknown size go after the known ones. Candidates live in a heap, so
+    filling a slot does not scan the queue: items that become "Queued" while the
+    scheduler runs are handed over with enqueue(), reorder() rebuilds the heap after
+    the queue order or the policy changed, and removed items go through remove().
+    """
+    POLICIES = ("fifo", "sjf")
+    RESUMABLE_STATES = ("Paused", "Resumable")
+    RETRY_STATE = "Waiting to retry"
+    RETRYABLE_ERRORS = (ERROR_TRANSIENT, ERROR_RATE_LIMITED)
+    RETRY_BASE_DELAY = 5.0
+    RETRY_MAX_DELAY = 300.0
+    COOLDOWN_BASE = 60.0
+    COOLDOWN_MAX = 900.0
+
+    def __init__(self, download_queue, worker_factory, max_concurrent=3, progress_interval=0.5):
+        self.download_queue = download_queue
+        self.worker_factory = worker_factory
+        self.max_concurrent = max(1, max_concurrent)
+        self.progress_interval = progress_interval
+        self.download_archive = None
+        self.info_cache = None
+        self.bandwidth = None
+        self.fragment_concurrency = 1
+        self.conversion_pool = None
+        self.embed_thumbnail = False
+        self.audio_copy = False
+        self.metrics = None
+        self.ydl_pool = None
+        self.max_retries = 3
+        self.call_later = None
+        # Host -> [cooldown end (time.monotonic()), rate limit strikes in a row]
+        self.host_cooldowns = {}
+        # Measured [bytes, seconds] of fragmented streams per fragment concurrency
+        self.fragment_throughput = {}
+        self.active = []
+        self.converting = []
+        # Cancelled items whose workers have not stopped yet
+        self.stopping = {}
+        self.is_running = False
+        self.policy = "fifo"
+        # Heap of (sort key, entry id, item); an entry is stale unless it is the item's latest
+        self._heap = []
+        self._entries = {}
+        self._entry_ids = itertools.count()
+        self._next_order = 0
+        # Candidates that cannot start until a retry or cooldown timer fires
+        self._held = []
+
+        # Event callbacks
+        self.on_item_started = lambda item: None
+        self.on_item_progress = lambda item, snapshot: None
+        self.on_item_finished = lambda item, success: None
+        self.on_item_skipped = lambda item: None
+        self.on_item_paused = lambda item: None
+        self.on_item_converting = lambda item: None
+        self.on_item_retrying = lambda item, delay: None
+        self.on_log = lambda message: None
+        self.on_queue_finished = lambda: None
+
+    def set_metrics(self, metrics):
+        """Record job metrics into a MetricsRegistry and report the queue state as gauges"""
+        self.metrics = metrics
+        metrics.gauge_function('osd_active_downloads', lambda: len(self.active))
+        metrics.gauge_function('osd_active_conversions', lambda: len(self.converting))
+        metrics.gauge_function('osd_queued_items',
+                               lambda: sum(1 for item in list(self.download_queue) if item.status == "Queued"))
+
+    def set_max_concurrent(self, max_concurrent):
+        self.max_concurrent = max(1, max_concurrent)
+        if self.is_running:
+            self.fill_slots()
+
+    def set_policy(self, policy):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.policy = policy
+        self.reorder()
+
+    def start(self):
+        self.is_running = True
+        self.reorder()
+        self.fill_slots()
+
+    def reorder(self):
+        """Rebuild the candidate heap from the queue, after its order or the policy changed"""
+        self._heap = []
+        self._entries = {}
+        self._held = []
+        for order, item in enumerate(self.download_queue):
+            item.order = order
+            if item.status == "Queued" or item.status == self.RETRY_STATE:
+                self._heap.append(self._entry(item))
+        self._next_order = len(self.download_queue)
+        heapq.heapify(self._heap)
+
+    def enqueue(self, items):
+        """
+        Schedule items that became "Queued", or whose priority, deadline or size
+        changed, and start them if there is room
+        """
+        for item in items:
+            self._push(item)
+        if self.is_running:
+            self.fill_slots()
+
+    def replace(self, item, items):
+        """Schedule the items a placeholder expanded into at the placeholder's place in the queue"""
+        self._entries.pop(item, None)
+        if item.order is not None:
+            for offset, new_item in enumerate(items):
+                new_item.order = item.order + offset / len(items)
+        self.enqueue(items)
+
+    def set_priority(self, item, priority):
+        """Change the priority of an item; a running download gets its new bandwidth share at once"""
+        item.priority = priority
+        if item in self.active and self.bandwidth is not None:
+            self.bandwidth.set_weight(item.worker.job, PRIORITY_WEIGHTS.get(priority, 1))
+        self.enqueue([item])
+
+    def remove(self, item):
+        """Take an item out of scheduling before it leaves the queue, cancelling it if in flight"""
+        self._entries.pop(item, None)
+        if self.is_active(item):
+            self.cancel(item)
+
+    def sort_key(self, item):
+        key = [-item.priority, item.deadline if item.deadline is not None else math.inf]
+        if self.policy == "sjf":
+            size = remaining_bytes(item)
+            key.append(size if size is not None else math.inf)
+        key.append(item.order)
+        return tuple(key)
+
+    def _entry(self, item):
+        entry_id = next(self._entry_ids)
+        self._entries[item] = entry_id
+        return (self.sort_key(item), entry_id, item)
+
+    def _push(self, item):
+        if item.order is None:
+            item.order = self._next_order
+            self._next_order += 1
+        if item.status == "Queued" or item.status == self.RETRY_STATE:
+            heapq.heappush(self._heap, self._entry(item))
+
+    def pause(self):
+        """Stop scheduling new items and stop everything in flight, keeping partial data"""
+        self.is_running = False
+        paused = list(self.active)
+        for item in paused:
+            self._retire(item, keep_partial=True)
+            item.status = "Pausing"
+        return paused
+
+    def resume(self):
+        """Put paused items back in the queue and start it; returns the resumed items"""
+        resumed = [item for item in self.download_queue if item.status in self.RESUMABLE_STATES]
+        for item in resumed:
+            item.status = "Queued"
+        self.start()
+        return resumed
+
+    def is_active(self, item):
+        return item in self.active or item in self.stopping or item in self.converting
+
+    def cancel(self, item):
+        """Cancel a single in-flight item and discard its partial data"""
+        if item in self.active:
+            self._retire(item, keep_partial=False)
+            item.status = "Cancelled"
+            if self.is_running:
+                self.fill_slots()
+        elif item in self.stopping:
+            # Already stopping for a pause, drop the partial data instead of keeping it
+            self.stopping[item].cancel(keep_partial=False)
+            item.status = "Cancelled"
+        elif item in self.converting:
+            self.converting.remove(item)
+            item.worker.cancel(keep_partial=False)
+            item.worker = None
+            item.status = "Cancelled"
+            if self.is_running:
+                self.fill_slots()
+
+    def fill_slots(self):
+        now = time.monotonic()
+        while len(self.active) < self.max_concurrent and self._heap:
+            _, entry_id, item = heapq.heappop(self._heap)
+            if self._entries.get(item) != entry_id:
+                continue
+            if item.status != "Queued" and item.status != self.RETRY_STATE:
+                del self._entries[item]
+                continue
+            if (item.status == self.RETRY_STATE and item.retry_at > now) or \
+                    self._cooling_down(host_key(item.url), now):
+                # Set aside until _wake, popping it on every fill would scan them all again
+                self._held.append(item)
+                continue
+            del self._entries[item]
+            # A part of a video is not the video, the archive only knows whole ones
+            if self.download_archive is not None and item.section is None and \
+                    archive_id_for_url(item.url) in self.download_archive:
+                item.status = "Skipped (already archived)"
+                self.on_log(f"Skipping already downloaded video: {item.url}")
+                self.on_item_skipped(item)
+                continue
+            self._start_item(item)
+
+        # Items still being resolved will be scheduled once they turn into queued items, items
+        # waiting for a retry or a cooldown once their timer fires
+        if not self.active and not self.converting and \
+                not any(item.status in ("Resolving", "Pausing", "Queued", self.RETRY_STATE)
+                        for item in self.download_queue):
+            self.is_running = False
+            self.on_queue_finished()
+
+    def _start_item(self, item):
+        item.status = "Downloading"
+        job = DownloadJob(item.url, item.output_path, item.format_type, item.quality,
+                          progress_interval=self.progress_interval,
+                          download_archive=self.download_archive,
+                          info_cache=self.info_cache,
+                          bandwidth=self.bandwidth,
+                          fragment_concurrency=self.fragment_concurrency,
+                          postprocess=self.conversion_pool is not None,
+                          embed_thumbnail=self.embed_thumbnail,
+                          metrics=self.metrics,
+                          bandwidth_weight=PRIORITY_WEIGHTS.get(item.priority, 1),
+                          ydl_pool=self.ydl_pool,
+                          audio_copy=self.audio_copy,
+                          section=item.section)
+
+        # Bind the item into each callback so progress and completion reach the right row
+        item.worker = self.worker_factory(
+            job,
+            lambda snapshot, item=item: self._on_progress(item, snapshot),
+            self.on_log,
+            lambda success, item=item: self._on_finished(item, success)
+        )
+
+        self.active.append(item)
+        self.on_item_started(item)
+        item.worker.start()
+
+    def _on_progress(self, item, snapshot):
+        if item in self.active:
+            item.progress = snapshot['progress']
+            item.speed = snapshot['speed']
+            item.eta = snapshot['eta']
+            item.downloaded_bytes = snapshot['downloaded_bytes'] or 0
+            item.rate_limit = snapshot['rate_limit']
+            self.on_item_progress(item, snapshot)
+
+    def _on_finished(self, item, success):
+        if item in self.stopping:
+            self._on_stopped(item, success)
+            return
+        if item not in self.active:
+            return
+
+        self.active.remove(item)
+        job = item.worker.job
+        if success:
+            self._record_fragment_stats(job)
+            self.host_cooldowns.pop(host_key(item.url), None)
+        item.worker = None
+        item.speed = None
+        item.eta = None
+        item.rate_limit = 0
+
+        if success and job.postprocess_task is not None:
+            self._start_conversion(item, job.postprocess_task)
+        elif success or not self._schedule_retry(item, job):
+            item.status = "Completed" if success else "Failed"
+            self.on_item_finished(item, success)
+
+        if self.is_running:
+            self.fill_slots()
+
+    def retry_delay(self, attempt):
+        """Backoff before retry number attempt: doubling each time, with half of it random"""
+        delay = min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _schedule_retry(self, item, job):
+        item.error_class = job.error_class
+        if self.call_later is None or job.error_class not in self.RETRYABLE_ERRORS or \
+                item.attempts >= self.max_retries:
+            return False
+
+        item.attempts += 1
+        delay = self.retry_delay(item.attempts)
+        if job.error_class == ERROR_RATE_LIMITED:
+            delay = max(delay, self._start_cooldown(host_key(item.url)))
+        item.status = self.RETRY_STATE
+        item.retry_at = time.monotonic() + delay
+        self._push(item)
+        self.on_log(f"Retrying {item.url} in {delay:.0f} s (attempt {item.attempts + 1} of "
+                    f"{self.max_retries + 1}, {job.error_class} error)")
+        self.on_item_retrying(item, delay)
+        self.call_later(delay, self._wake)
+        return True
+
+    def _start_cooldown(self, host):
+        """Hold back every item of a rate limiting host; returns the cooldown in seconds"""
+        cooldown = self.host_cooldowns.setdefault(host, [0.0, 0])
+        cooldown[1] += 1
+        duration = min(self.COOLDOWN_MAX, self.COOLDOWN_BASE * 2 ** (cooldown[1] - 1))
+        # Concurrent failures of the same host extend the cooldown instead of stacking it
+        cooldown[0] = max(cooldown[0], time.monotonic() + duration)
+        self.on_log(f"{host or 'The site'} is rate limiting, holding its downloads back for {duration:.0f} s")
+        if self.call_later is not None:
+            self.call_later(duration, self._wake)
+        return duration
+
+    def _cooling_down(self, host, now):
+        cooldown = self.host_cooldowns.get(host)
+        return cooldown is not None and cooldown[0] > now
+
+    def _wake(self):
+        held, self._held = self._held, []
+        for item in held:
+            if item in self._entries:
+                self._push(item)
+        if self.is_running:
+            self.fill_slots()
+
+    def _start_conversion(self, item, task):
+        item.status = "Converting"
+        item.progress = 0
+        job = ConvertJob(item.url, task, self.conversion_pool, self.progress_interval, self.metrics)
+        item.worker = self.worker_factory(
+            job,
+            lambda snapshot, item=item: self._on_convert_progress(item, snapshot),
+            self.on_log,
+            lambda success, item=item: self._on_converted(item, success)
+        )
+
+        self.converting.append(item)
+        self.on_item_converting(item)
+        item.worker.start()
+
+    def _on_convert_progress(self, item, snapshot):
+        if item in self.converting:
+            item.progress = snapshot['progress']
+            item.eta = snapshot['eta']
+            self.on_item_progress(item, snapshot)
+
+    def _on_converted(self, item, success):
+        # Late callbacks from cancelled conversions are ignored
+        if item not in self.converting:
+            return
+
+        self.converting.remove(item)
+        archive_id = item.worker.job.task.get('archive_id')
+        item.worker = None
+        item.eta = None
+        if success and archive_id and self.download_archive is not None:
+            self.download_archive.add(archive_id)
+
+        item.status = "Completed" if success else "Failed"
+        self.on_item_finished(item, success)
+
+        if self.is_running:
+            self.fill_slots()
+
+    def _record_fragment_stats(self, job):
+        if not job.fragment_stats:
+            return
+        totals = self.fragment_throughput.setdefault(job.fragment_concurrency, [0, 0.0])
+        for size, elapsed in job.fragment_stats:
+            totals[0] += size
+            totals[1] += elapsed
+
+        message = (f"Fragmented downloads with {job.fragment_concurrency} connections average "
+                   f"{format_size(self.fragment_rate(job.fragment_concurrency))}/s")
+        gain = self.fragment_gain(job.fragment_concurrency)
+        if gain is not None:
+            message += f", {gain:.1f}x the single connection rate"
+        self.on_log(message)
+
+    def fragment_rate(self, concurrency):
+        """Average measured bytes per second of fragmented streams, None without samples"""
+        size, elapsed = self.fragment_throughput.get(concurrency, (0, 0.0))
+        return size / elapsed if elapsed else None
+
+    def fragment_gain(self, concurrency):
+        """Throughput of concurrency connections relative to one, None until both were measured"""
+        rate, baseline = self.fragment_rate(concurrency), self.fragment_rate(1)
+        if concurrency == 1 or not rate or not baseline:
+            return None
+        return rate / baseline
+
+    def _on_stopped(self, item, success):
+        worker = self.stopping.pop(item)
+        # Removed items are gone from the queue, nothing is left to report
+        if item.status != "Pausing":
+            return
+
+        job = worker.job
+        if success and job.postprocess_task is not None:
+            # The download completed before the cancellation was noticed
+            self._start_conversion(item, job.postprocess_task)
+        elif success:
+            item.status = "Completed"
+            self.on_item_finished(item, success)
+        else:
+            item.status = "Resumable" if item.downloaded_bytes else "Paused"
+            item.partial_files = list(job.partial_files)
+            # The queue was started again while this worker was still stopping
+            if self.is_running:
+                item.status = "Queued"
+                self._push(item)
+            self.on_item_paused(item)
+
+        if self.is_running:
+            self.fill_slots()
+
+    def _retire(self, item, keep_partial):
+        self.active.remove(item)
+        worker = item.worker
+        item.worker = None
+        item.speed = None
+        item.eta = None
+        item.rate_limit = 0
+        if worker is not None:
+            self.stopping[item] = worker
+            worker.cancel(keep_partial)
+
+# Plain thread worker
+class ThreadWorker(threading.Thread):
+    """Run a DownloadJob on a plain thread, posting its callbacks to an event queue"""
+    def __init__(self, job, on_progress, on_log, on_finished, events):
+        super().__init__(daemon=True)
+        self.job = job
+        self.on_progress = on_progress
+        self.on_log = on_log
+        self.on_finished = on_finished
+        self.events = events
+
+    def run(self):
+        success = self.job.run(
+            lambda snapshot: self.events.put((self.on_progress, (snapshot,))),
+            lambda message: self.events.put((self.on_log, (message,)))
+        )
+        self.events.put((self.on_finished, (success,)))
+
+    def cancel(self, keep_partial=True):
+        self.job.cancel(keep_partial)
@@ -0,0 +1,271 @@
+import re
+
+# Format selection works on yt-dlp's format dicts alone, so it stays free of Qt and yt-dlp and
+# can be run against format lists saved from real extractions
+
+# Codecs the MP4 conversion can copy as they are, and the subset every MP4 player handles
+MP4_VIDEO_CODECS = ("avc1", "avc3", "h264", "hev1", "hvc1", "h265", "av01", "vp09", "vp9")
+MP4_AUDIO_CODECS = ("mp4a", "aac", "mp3", "opus", "ac-3", "ec-3", "flac", "alac")
+PREFERRED_VIDEO_CODECS = ("avc1", "avc3", "h264")
+PREFERRED_AUDIO_CODECS = ("mp4a", "aac")
+
+# Containers an audio stream is copied into when it is kept as it is, by codec and, for
+# unknown codecs, by extension
+AUDIO_COPY_CONTAINERS = {"mp4a": "m4a", "aac": "m4a", "alac": "m4a", "mp3": "mp3", "opus": "opus",
+                         "vorbis": "ogg", "flac": "flac"}
+AUDIO_COPY_EXTS = {"m4a": "m4a", "mp3": "mp3", "opus": "opus", "ogg": "ogg", "flac": "flac"}
+
+# Cost model weights, in bytes of transfer each step is considered worth
+MERGE_COST = 2 * 1024 * 1024     # one more ffmpeg run...
+MERGE_COST_RATIO = 0.05          # ...which also rewrites the streams once
+COMPAT_COST_RATIO = 0.5          # codecs other than H.264/AAC play in fewer MP4 players
+# Audio is always encoded to MP3, sources a little below the target bitrate still count as reaching it
+AUDIO_BITRATE_SLACK = 0.9
+
+def has_video(fmt):
+    return fmt.get('vcodec') != 'none'
+
+def has_audio(fmt):
+    return fmt.get('acodec') != 'none'
+
+def codec_family(codec):
+    """Lowercased codec name without its profile, e.g. "avc1" for "avc1.64001F"; None if unknown"""
+    if not codec or codec == 'none':
+        return None
+    return codec.split('.')[0].lower()
+
+def format_size_estimate(fmt):
+    return fmt.get('filesize') or fmt.get('filesize_approx')
+
+def audio_copy_ext(fmt):
+    """Extension of the file the audio of fmt can be copied into without encoding, None if it cannot"""
+    family = codec_family(fmt.get('acodec'))
+    if family is not None:
+        return AUDIO_COPY_CONTAINERS.get(family)
+    return AUDIO_COPY_EXTS.get(fmt.get('ext'))
+
+class FormatPlan:
+    """
+    Streams to download: one format, or a video and an audio format to merge. size
+    is the predicted bytes to transfer and cost what the cost model charges for the
+    plan, both None when a size is unknown. compatible and preferred tell whether
+    the streams can be copied into an MP4 and whether they are H.264/AAC.
+    """
+    def __init__(self, formats, merge=False, audio_only=False, audio_copy=False):
+        self.formats = formats
+        self.merge = merge
+        self.audio_only = audio_only
+        self.audio_copy = audio_copy
+        self.compatible, self.preferred = mp4_compatibility(formats)
+        self.size, self.cost = plan_cost(formats, merge, self.preferred or audio_only)
+
+    @property
+    def format_id(self):
+        return "+".join(str(fmt.get('format_id')) for fmt in self.formats)
+
+    def describe(self):
+        """Short summary of the decision for the queue, e.g. "720p avc1/mp4a, merge" """
+        video = next((fmt for fmt in self.formats if has_video(fmt)), None)
+        audio = next((fmt for fmt in self.formats if has_audio(fmt)), None)
+        parts = []
+        if self.audio_only:
+            bitrate = (audio.get('abr') or audio.get('tbr')) if audio else None
+            parts.append(f"{bitrate:.0f}k" if bitrate else "audio")
+        elif video is not None and video.get('height'):
+            parts.append(f"{video['height']}p")
+        codecs = [codec_family(fmt.get(key)) for fmt, key in ((video, 'vcodec'), (audio, 'acodec'))
+                  if fmt is not None and not (self.audio_only and key == 'vcodec')]
+        codecs = [codec for codec in codecs if codec]
+        parts.append("/".join(codecs) if codecs else self.formats[0].get('ext') or "unknown")
+        summary = " ".join(parts)
+        if self.audio_only:
+            ext = audio_copy_ext(self.formats[0]) if self.audio_copy else None
+            return f"{summary}, copy to .{ext}" if ext else f"{summary}, to MP3"
+        return f"{summary}, {'merge' if self.merge else 'single file'}"
+
+    def to_format(self):
+        """The plan as the format dict yt-dlp expects back from a format selector"""
+        if not self.merge:
+            selected = dict(self.formats[0])
+        else:
+            video, audio = self.formats
+            selected = {
+                'requested_formats': [video, audio],
+                'format': f"{video.get('format')}+{audio.get('format')}",
+                'format_id': self.format_id,
+                'ext': merged_ext(video, audio),
+                'protocol': f"{video.get('protocol')}+{audio.get('protocol')}",
+                'width': video.get('width'),
+                'height': video.get('height'),
+                'resolution': video.get('resolution'),
+                'fps': video.get('fps'),
+                'dynamic_range': video.get('dynamic_range'),
+                'vcodec': video.get('vcodec'),
+                'vbr': video.get('vbr'),
+                'acodec': audio.get('acodec'),
+                'abr': audio.get('abr'),
+                'asr': audio.get('asr'),
+                'audio_channels': audio.get('audio_channels'),
+                'tbr': sum(fmt.get('tbr') or 0 for fmt in self.formats) or None,
+            }
+        selected['filesize_approx'] = self.size
+        selected['format_plan'] = self.describe()
+        return selected
+
+def merged_ext(video, audio):
+    # The container yt-dlp itself would merge into when it post-processes inline
+    if video.get('ext') == "mp4" and audio.get('ext') in ("m4a", "mp4"):
+        return "mp4"
+    if video.get('ext') == audio.get('ext') == "webm":
+        return "webm"
+    return "mkv"
+
+def mp4_compatibility(formats):
+    """
+    (copyable, preferred) for streams going into one MP4: whether ffmpeg can copy
+    them in as they are, and whether they are H.264/AAC. Unknown codecs are judged
+    by the container.
+    """
+    copyable = preferred = True
+    for fmt in formats:
+        streams = []
+        if has_video(fmt):
+            streams.append((codec_family(fmt.get('vcodec')), MP4_VIDEO_CODECS, PREFERRED_VIDEO_CODECS))
+        if has_audio(fmt):
+            streams.append((codec_family(fmt.get('acodec')), MP4_AUDIO_CODECS, PREFERRED_AUDIO_CODECS))
+        for family, allowed, best in streams:
+            if family is None:
+                if fmt.get('ext') not in ("mp4", "m4a", "mov"):
+                    preferred = False
+            elif family not in allowed:
+                copyable = preferred = False
+            elif family not in best:
+                preferred = False
+    return copyable, preferred
+
+def plan_cost(formats, merge, preferred):
+    """(size, bytes-equivalent cost) of downloading formats, (None, None) when a size is unknown"""
+    sizes = [format_size_estimate(fmt) for fmt in formats]
+    if not all(sizes):
+        return None, None
+    size = sum(sizes)
+    cost = size
+    if merge:
+        cost += MERGE_COST + size * MERGE_COST_RATIO
+    if not preferred:
+        cost += size * COMPAT_COST_RATIO
+    return size, cost
+
+def _pick(plans):
+    """The cheapest plan of known size; without sizes the best H.264/AAC single file, latest first"""
+    known = [plan for plan in plans if plan.cost is not None]
+    if known:
+        return min(known, key=lambda plan: plan.cost)
+    if not plans:
+        return None
+    # yt-dlp lists formats worst first, so later ones win ties
+    return max(enumerate(plans), key=lambda entry: (entry[1].preferred, not entry[1].merge, entry[0]))[1]
+
+def _video_plans(formats, max_height, can_merge):
+    progressive = [fmt for fmt in formats if has_video(fmt) and has_audio(fmt)]
+    video_only = [fmt for fmt in formats if has_video(fmt) and not has_audio(fmt)]
+    audio_only = [fmt for fmt in formats if has_audio(fmt) and not has_video(fmt)]
+
+    plans = [FormatPlan([fmt]) for fmt in progressive]
+    if can_merge and audio_only:
+        audio_only = _best_audio_per_codec(audio_only)
+        plans += [FormatPlan([video, audio], merge=True) for video in video_only for audio in audio_only]
+    if not plans:
+        # Nothing with sound can be made, a single stream is still better than failing
+        plans = [FormatPlan([fmt]) for fmt in video_only or audio_only]
+
+    # Only plans that fit in an MP4 as they are, unless nothing does
+    compatible = [plan for plan in plans if plan.compatible] or plans
+    return _best_height_tier(compatible, max_height)
+
+def _best_audio_per_codec(audio_only):
+    # The best sounding stream of each codec; whether AAC or another codec suits the video
+    # better is left to the cost model, which sees every pairing
+    def codec(fmt):
+        return codec_family(fmt.get('acodec')) or fmt.get('ext')
+
+    def bitrate(fmt):
+        return fmt.get('abr') or fmt.get('tbr') or 0
+
+    best = {}
+    for fmt in audio_only:
+        best[codec(fmt)] = max(best.get(codec(fmt), 0), bitrate(fmt))
+    return [fmt for fmt in audio_only if bitrate(fmt) == best[codec(fmt)]]
+
+def _best_height_tier(plans, max_height):
+    """Plans at the highest height within max_height, or the lowest height above it if none fits"""
+    def height(plan):
+        return next((fmt.get('height') for fmt in plan.formats if has_video(fmt)), None)
+
+    known = [plan for plan in plans if height(plan)]
+    if not known:
+        return plans
+    fitting = [plan for plan in known if height(plan) <= max_height]
+    target = max(map(height, fitting)) if fitting else min(map(height, known))
+    return [plan for plan in known if height(plan) == target]
+
+def _audio_plans(formats, target_bitrate, audio_copy):
+    audio_only = [fmt for fmt in formats if has_audio(fmt) and not has_video(fmt)]
+    if not audio_only:
+        # Audio taken out of a video, the cheapest one of them
+        return [FormatPlan([fmt], audio_only=True, audio_copy=audio_copy) for fmt in formats if has_audio(fmt)]
+    if audio_copy:
+        # Streams that can be kept as they are beat any that would still need encoding
+        audio_only = [fmt for fmt in audio_only if audio_copy_ext(fmt)] or audio_only
+
+    def bitrate(fmt):
+        return fmt.get('abr') or fmt.get('tbr') or 0
+
+    # Anything that reaches the MP3 bitrate sounds the same after encoding, so the smallest of
+    # those wins; below it only the best bitrate counts
+    enough = [fmt for fmt in audio_only if bitrate(fmt) >= target_bitrate * AUDIO_BITRATE_SLACK]
+    if not enough:
+        best = max(bitrate(fmt) for fmt in audio_only)
+        enough = [fmt for fmt in audio_only if bitrate(fmt) == best]
+    return [FormatPlan([fmt], audio_only=True, audio_copy=audio_copy) for fmt in enough]
+
+def select_formats(formats, format_type, quality, can_merge=True, audio_copy=False):
+    """
+    Choose what to download from an extracted format list (yt-dlp's order, worst
+    first) by a cost model: bytes to transfer, plus a charge for an extra merge and
+    for codecs that are not H.264/AAC. Video keeps the best height up to the chosen
+    quality, merged with the best stream of some audio codec, and never trades
+    either for a cheaper plan; audio keeps the smallest stream that reaches the MP3
+    bitrate, with audio_copy one that can be kept without encoding if there is any.
+    Returns a FormatPlan, or None without formats.
+    """
+    formats = [fmt for fmt in formats if has_video(fmt) or has_audio(fmt)]
+    if format_type == "Video (MP4)":
+        match = re.match(r'(\d+)p', quality or "")
+        plans = _video_plans(formats, int(match.group(1)) if match else 720, can_merge)
+    else:
+        match = re.match(r'(\d+)', quality or "")
+        plans = _audio_plans(formats, int(match.group(1)) if match else 128, audio_copy)
+    return _pick(plans)
+
+class FormatSelector:
+    """
+    select_formats as a yt-dlp format selector, given as the 'format' option. The
+    chosen format carries format_plan, the decision in words, and
+    filesize_approx, the predicted size.
+    """
+    def __init__(self, format_type, quality, can_merge=True, audio_copy=False):
+        self.format_type = format_type
+        self.quality = quality
+        self.can_merge = can_merge
+        self.audio_copy = audio_copy
+
+    def __call__(self, ctx):
+        plan = select_formats(ctx['formats'], self.format_type, self.quality, self.can_merge, self.audio_copy)
+        if plan is not None:
+            yield plan.to_format()
+
+    def __repr__(self):
+        # Stable across instances, it is part of cache and pool keys
+        return (f"FormatSelector({self.format_type!r}, {self.quality!r}, can_merge={self.can_merge}, "
+                f"audio_copy={self.audio_copy})")
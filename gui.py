@@ -0,0 +1,1915 @@
+import os
+import json
+import time
+import sqlite3
+from datetime import datetime
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
+                            QLabel, QLineEdit, QPushButton, QComboBox, QFileDialog,
+                            QProgressBar, QTextEdit, QTabWidget, QTableView,
+                            QCheckBox, QMessageBox, QSystemTrayIcon, QMenu, QSpinBox, QTimeEdit,
+                            QInputDialog)
+from PyQt6.QtCore import (Qt, QThread, QTimer, QTime, pyqtSignal, QSettings, QAbstractTableModel, QModelIndex,
+                          QMimeData)
+from PyQt6.QtGui import QDragEnterEvent, QDropEvent, QAction
+
+from postprocess import ConversionPool
+from metrics import MetricsRegistry, MetricsServer
+from engine import (DownloadItem, DownloadScheduler, UrlResolver, LogWriter, HistoryStore,
+                    DownloadArchive, InfoCache, QueueStore, YoutubeDLPool, BandwidthManager, format_size, history_entry,
+                    load_yt_dlp, find_urls, plan_import, video_key, is_single_video, prepare_output_directory,
+                    expected_bytes, parse_sections, split_sections, select_sections, section_label, format_timestamp,
+                    remove_partial_files,
+                    PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, PRIORITY_NAMES)
+
+# Startup timing
+class StartupTimer:
+    """
+    Startup milestones in seconds since the process started loading the application.
+    Startup is complete once the window has painted, the history is loaded and
+    yt-dlp is imported; the milestones are then logged and can be written as JSON.
+    """
+    REQUIRED = ("first_paint", "history", "yt_dlp")
+    LABELS = {"imports": "imports", "window": "window", "first_paint": "first paint",
+              "history": "history", "yt_dlp": "yt-dlp ready"}
+
+    def __init__(self, started_at=None, report_path=None, exit_when_complete=False):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.report_path = report_path
+        self.exit_when_complete = exit_when_complete
+        self.milestones = {}
+        self.durations = {}
+
+    def mark(self, name):
+        self.milestones.setdefault(name, time.perf_counter() - self.started_at)
+
+    @property
+    def is_complete(self):
+        return all(name in self.milestones for name in self.REQUIRED)
+
+    def summary(self):
+        parts = [f"{self.LABELS.get(name, name)} {seconds:.2f} s"
+                 for name, seconds in sorted(self.milestones.items(), key=lambda milestone: milestone[1])]
+        text = "Startup: " + ", ".join(parts)
+        if 'yt_dlp_import' in self.durations:
+            text += f" (yt-dlp import took {self.durations['yt_dlp_import']:.2f} s)"
+        return text
+
+    def write_report(self):
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            json.dump({'milestones': self.milestones, 'durations': self.durations}, f, indent=2)
+
+# yt-dlp loader thread
+class YtdlpLoader(QThread):
+    """Import yt-dlp off the GUI thread once the window is up"""
+    loaded_signal = pyqtSignal(float)
+
+    def run(self):
+        self.loaded_signal.emit(load_yt_dlp())
+
+# Download worker thread
+class DownloadWorker(QThread):
+    """Run a DownloadJob on a QThread; signals deliver its callbacks to the GUI thread"""
+    # Progress is published as a snapshot dict, see DownloadJob._progress_hook for its keys
+    progress_signal = pyqtSignal(dict)
+    finished_signal = pyqtSignal(str, bool)
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+
+    def run(self):
+        success = self.job.run(self.progress_signal.emit, self.log_signal.emit)
+        self.finished_signal.emit(self.job.url, success)
+
+    def cancel(self, keep_partial=True):
+        self.job.cancel(keep_partial)
+
+# URL resolver thread
+class ResolveWorker(QThread):
+    """
+    Run UrlResolver for placeholder items off the GUI thread, one after another, then
+    fetch the metadata of the playlist entries they expanded into and of metadata_items
+    """
+    resolved_signal = pyqtSignal(object, list)
+    metadata_signal = pyqtSignal(object, dict)
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, placeholders, resolver, metadata_items=()):
+        super().__init__()
+        self.placeholders = placeholders
+        self.resolver = resolver
+        self.metadata_items = list(metadata_items)
+
+    def run(self):
+        pending = self.metadata_items
+        for placeholder in self.placeholders:
+            items = self.resolver.resolve(placeholder, self.metadata_signal.emit, self.log_signal.emit)
+            self.resolved_signal.emit(placeholder, items)
+
+            # Expanded playlist entries only have flat metadata so far
+            pending += [item for item in items if self.resolver.needs_metadata(item)]
+
+        if pending:
+            self.resolver.fetch_metadata(pending, self.metadata_signal.emit, self.log_signal.emit)
+
+# Import planning thread
+class ImportWorker(QThread):
+    """
+    Drop the candidate URLs that are invalid or the same video as one of known_urls, off
+    the GUI thread, since matching a URL against yt-dlp's extractors takes milliseconds
+    """
+    planned_signal = pyqtSignal(list, int, int)
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, candidates, known_urls, history_path=None):
+        super().__init__()
+        self.candidates = candidates
+        self.known_urls = known_urls
+        # The completed downloads in this history are known too
+        self.history_path = history_path
+
+    def run(self):
+        known_urls = list(self.known_urls)
+        if self.history_path is not None:
+            try:
+                known_urls += HistoryStore.read_urls(self.history_path, "Completed")
+            except sqlite3.Error as e:
+                self.log_signal.emit(f"Could not read the history to find duplicates: {str(e)}")
+        known_keys = {video_key(url) for url in known_urls}
+        self.planned_signal.emit(*plan_import(self.candidates, known_keys))
+
+# Queue Table Model
+class QueueTableModel(QAbstractTableModel):
+    """
+    Table model over download_queue that repaints only the cells that changed. Rows
+    can be dragged to a new place; rows_moved(items, before) reports the moved items
+    and the item they now come before (None at the end).
+    """
+    COLUMNS = ["Title", "URL", "Format", "Quality", "Progress", "Speed", "ETA", "Status", "Priority",
+               "Size", "Selected Format", "Section"]
+    PROGRESS_COLUMN = 4
+    STATUS_COLUMN = 7
+    PRIORITY_COLUMN = 8
+    SIZE_COLUMN = 9
+    PLAN_COLUMN = 10
+    SECTION_COLUMN = 11
+    MIME_TYPE = "application/x-osd-queue-rows"
+    rows_moved = pyqtSignal(list, object)
+
+    def __init__(self, download_queue):
+        super().__init__()
+        self.download_queue = download_queue
+        self._rows = {}
+        self._reindex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.download_queue)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        item = self.download_queue[index.row()]
+        column = index.column()
+        if column == 0:
+            return item.title
+        elif column == 1:
+            return item.url
+        elif column == 2:
+            return item.format_type
+        elif column == 3:
+            return item.quality
+        elif column == self.PROGRESS_COLUMN:
+            return f"{item.progress}%"
+        elif column == 5:
+            speed = f"{format_size(item.speed)}/s" if item.speed else ""
+            # Show the share of the bandwidth limit this download currently gets
+            if item.rate_limit:
+                speed = f"{speed} (max {format_size(item.rate_limit)}/s)".lstrip()
+            return speed
+        elif column == 6:
+            return f"{item.eta} s" if item.eta else ""
+        elif column == self.STATUS_COLUMN:
+            return item.status
+        elif column == self.SIZE_COLUMN:
+            # Predicted by the format selection, before anything is downloaded
+            size = expected_bytes(item)
+            return format_size(size) if size else ""
+        elif column == self.PLAN_COLUMN:
+            return item.metadata.get('format_plan', "")
+        elif column == self.SECTION_COLUMN:
+            # Placeholders show what was asked for until the video's sections are known
+            return section_label(item.section) if item.section is not None else item.sections or ""
+        else:
+            priority = PRIORITY_NAMES.get(item.priority, str(item.priority))
+            if item.deadline is not None:
+                priority += f", by {datetime.fromtimestamp(item.deadline).strftime('%H:%M')}"
+            return priority
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index) | Qt.ItemFlag.ItemIsDropEnabled
+        if index.isValid():
+            flags |= Qt.ItemFlag.ItemIsDragEnabled
+        return flags
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [self.MIME_TYPE]
+
+    def mimeData(self, indexes):
+        data = QMimeData()
+        rows = sorted({index.row() for index in indexes})
+        data.setData(self.MIME_TYPE, json.dumps(rows).encode())
+        return data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if action != Qt.DropAction.MoveAction or not data.hasFormat(self.MIME_TYPE):
+            return False
+        if row < 0:
+            # Dropped onto a row rather than between two
+            row = parent.row() if parent.isValid() else len(self.download_queue)
+        self.move_rows(json.loads(bytes(data.data(self.MIME_TYPE)).decode()), row)
+        # The rows are already in place; accepting the drop would make the view remove the originals
+        return False
+
+    def move_rows(self, rows, destination):
+        """Move the items at rows in front of the row at destination, keeping their order"""
+        moved = [self.download_queue[row] for row in sorted(set(rows)) if 0 <= row < len(self.download_queue)]
+        moved_ids = {id(item) for item in moved}
+        before = next((item for item in self.download_queue[destination:] if id(item) not in moved_ids), None)
+        for item in moved:
+            source = self._rows[id(item)]
+            target = self._rows[id(before)] if before is not None else len(self.download_queue)
+            if target in (source, source + 1):
+                continue
+            self.beginMoveRows(QModelIndex(), source, source, QModelIndex(), target)
+            self.download_queue.pop(source)
+            self.download_queue.insert(target - 1 if target > source else target, item)
+            self._reindex()
+            self.endMoveRows()
+        if moved:
+            self.rows_moved.emit(moved, before)
+
+    def item_at(self, row):
+        if 0 <= row < len(self.download_queue):
+            return self.download_queue[row]
+        return None
+
+    def append_items(self, items):
+        if not items:
+            return
+        first = len(self.download_queue)
+        self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+        for offset, item in enumerate(items):
+            self.download_queue.append(item)
+            self._rows[id(item)] = first + offset
+        self.endInsertRows()
+
+    def replace_item(self, item, items):
+        """Swap one row for several, keeping their position in the queue"""
+        row = self._rows.get(id(item))
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.download_queue.pop(row)
+        self.endRemoveRows()
+        
+        if items:
+            self.beginInsertRows(QModelIndex(), row, row + len(items) - 1)
+            self.download_queue[row:row] = items
+            self.endInsertRows()
+        self._reindex()
+
+    def remove_item(self, item):
+        row = self._rows.get(id(item))
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.download_queue.pop(row)
+        self._reindex()
+        self.endRemoveRows()
+
+    def item_changed(self, item, first_column=PROGRESS_COLUMN, last_column=STATUS_COLUMN):
+        """Notify views that some cells of one item changed (progress and status by default)"""
+        row = self._rows.get(id(item))
+        if row is not None:
+            self.dataChanged.emit(self.index(row, first_column), self.index(row, last_column))
+
+    def _reindex(self):
+        self._rows = {id(item): row for row, item in enumerate(self.download_queue)}
+
+# History Table Model
+class HistoryTableModel(QAbstractTableModel):
+    """Lazy model over HistoryStore that fetches rows page by page as the view scrolls"""
+    COLUMNS = ["Title", "URL", "Format", "Date", "Status"]
+    FIELDS = ["title", "url", "format", "date", "status"]
+    PAGE_SIZE = 200
+
+    def __init__(self, history_store):
+        super().__init__()
+        self.history_store = history_store
+        self.order_by = "date"
+        self.descending = True
+        self.text_filter = ""
+        self._entries = []
+        self._total = self.history_store.count()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._entries)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self._entries[index.row()].get(self.FIELDS[index.column()]) or ""
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self._entries) < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        entries = self.history_store.page(len(self._entries), self.PAGE_SIZE,
+                                          self.order_by, self.descending, self.text_filter)
+        if not entries:
+            # The store shrank underneath us, stop asking for more
+            self._total = len(self._entries)
+            return
+        first = len(self._entries)
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+        self._entries.extend(entries)
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # Sorting is done by the store, the model just starts over from the first page
+        self.order_by = self.FIELDS[column]
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.reload()
+
+    def set_filter(self, text):
+        self.text_filter = text.strip()
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self._entries = []
+        self._total = self.history_store.count(self.text_filter)
+        self.endResetModel()
+
+    def entry_at(self, row):
+        if 0 <= row < len(self._entries):
+            return self._entries[row]
+        return None
+
+    def entry_added(self, entry_id):
+        """Insert a newly stored entry at its sorted position without reloading the rest"""
+        position = self.history_store.position(entry_id, self.order_by, self.descending, self.text_filter)
+        if position is None:
+            return
+
+        fully_loaded = not self.canFetchMore()
+        self._total += 1
+        # Rows past the loaded range are picked up by a later fetchMore
+        if position < len(self._entries) or (position == len(self._entries) and fully_loaded):
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._entries.insert(position, self.history_store.get(entry_id))
+            self.endInsertRows()
+
+# Main Application Window
+class YTDownloaderGUI(QMainWindow):
+    MAX_LOG_LINES = 5000
+    
+    def __init__(self, startup=None):
+        super().__init__()
+        self.startup = startup or StartupTimer()
+        self.startup_reported = False
+        
+        # Application settings
+        self.settings = QSettings("OSD", "settings")
+        self.history_store = None
+        self.history_model = None
+        self.download_queue = []
+        self.resolvers = set()
+        self.workers = set()
+        # Imports are planned one at a time so each sees the items queued by the one before
+        self.import_worker = None
+        self.pending_imports = []
+        self.is_dark_mode = self.settings.value("dark_mode", False, type=bool)
+        # Messages raised before the log view exists, logged once it does
+        self.pending_log_messages = []
+        
+        # Log file writes happen on a background thread
+        self.log_writer = LogWriter(os.path.join(os.path.expanduser("~"), "yt_downloader_logs"))
+        self.log_writer.start()
+        QApplication.instance().aboutToQuit.connect(self.log_writer.close)
+        
+        # Queue scheduler runs several downloads at once
+        self.scheduler = DownloadScheduler(
+            self.download_queue,
+            self.create_worker,
+            self.settings.value("max_concurrent_downloads", 3, type=int),
+            self.settings.value("progress_interval_ms", 500, type=int) / 1000
+        )
+        self.scheduler.on_item_started = self.download_started
+        self.scheduler.on_item_progress = self.update_progress
+        self.scheduler.on_item_finished = self.download_finished
+        self.scheduler.on_item_skipped = self.download_skipped
+        self.scheduler.on_item_paused = self.download_paused
+        self.scheduler.on_item_converting = self.conversion_started
+        self.scheduler.on_item_retrying = self.download_retrying
+        self.scheduler.call_later = lambda delay, callback: QTimer.singleShot(int(delay * 1000), callback)
+        self.scheduler.max_retries = self.settings.value("max_retries", 3, type=int)
+        policy = self.settings.value("queue_policy", "fifo", type=str)
+        if policy in DownloadScheduler.POLICIES:
+            self.scheduler.set_policy(policy)
+        self.scheduler.on_log = self.log_message
+        self.scheduler.on_queue_finished = self.queue_finished
+        
+        # Archive of finished downloads, used to skip videos fetched before
+        self.download_archive = DownloadArchive(
+            os.path.join(os.path.expanduser("~"), "yt_downloader_archive.txt"))
+        if self.settings.value("use_download_archive", True, type=bool):
+            self.scheduler.download_archive = self.download_archive
+        
+        # Extracted video information is reused by retries and re-downloads
+        self.info_cache = self.open_info_cache()
+        self.scheduler.info_cache = self.info_cache
+        
+        # Warm YoutubeDL instances shared by resolving and downloading
+        self.ydl_pool = YoutubeDLPool(os.path.join(os.path.expanduser("~"), "yt_downloader_cache"))
+        QApplication.instance().aboutToQuit.connect(self.ydl_pool.close)
+        self.scheduler.ydl_pool = self.ydl_pool
+        
+        # Bandwidth limits are shared by every download
+        self.bandwidth = BandwidthManager()
+        self.apply_bandwidth_settings()
+        self.scheduler.bandwidth = self.bandwidth
+        self.scheduler.fragment_concurrency = self.settings.value("concurrent_fragments", 4, type=int)
+        
+        # Merges and MP3 encodes run in separate processes next to the downloads
+        self.conversion_pool = ConversionPool(self.settings.value("conversion_workers", 2, type=int))
+        QApplication.instance().aboutToQuit.connect(self.conversion_pool.shutdown)
+        self.scheduler.conversion_pool = self.conversion_pool
+        self.scheduler.embed_thumbnail = self.settings.value("embed_thumbnail", True, type=bool)
+        self.scheduler.audio_copy = self.settings.value("audio_copy", False, type=bool)
+        
+        # Job timings, bytes and results for the stats tab and the metrics endpoint
+        self.metrics = MetricsRegistry()
+        self.scheduler.set_metrics(self.metrics)
+        self.metrics_server = None
+        
+        # Setup UI
+        self.setWindowTitle("OSD")
+        self.setMinimumSize(900, 600)
+        
+        # Create system tray icon
+        self.setup_tray_icon()
+        
+        # Create main widget and layout
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.main_layout = QVBoxLayout(self.central_widget)
+        
+        # Create tab widget
+        self.tabs = QTabWidget()
+        self.main_layout.addWidget(self.tabs)
+        
+        # Create tabs; the ones not needed right away are built on their first visit
+        self.lazy_tabs = {}
+        self.setup_download_tab()
+        self.setup_queue_tab()
+        self.add_lazy_tab("History", self.setup_history_tab)
+        self.add_lazy_tab("Stats", self.setup_stats_tab)
+        self.add_lazy_tab("Settings", self.setup_settings_tab)
+        self.tabs.currentChanged.connect(self.build_tab)
+        for message in self.pending_log_messages:
+            self.log_message(message)
+        self.pending_log_messages = []
+        
+        # The queue is saved as it changes and restored from the last session
+        self.queue_store = self.open_queue_store()
+        QApplication.instance().aboutToQuit.connect(self.queue_store.close)
+        self.resume_queue_on_start = self.restore_queue()
+        
+        # Serve the metrics once the log view exists to report on it
+        self.apply_metrics_settings()
+        QApplication.instance().aboutToQuit.connect(self.stop_metrics_server)
+        
+        # Apply theme
+        self.apply_theme()
+        
+        # Setup drag and drop
+        self.setAcceptDrops(True)
+        
+        # Show the window; history and yt-dlp are loaded once it has painted
+        self.show()
+        self.startup.mark("window")
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if "first_paint" not in self.startup.milestones:
+            self.startup.mark("first_paint")
+            QTimer.singleShot(0, self.finish_startup)
+    
+    def finish_startup(self):
+        if self.history_store is None:
+            self.load_history()
+        self.startup.mark("history")
+        
+        # Downloads interrupted by closing or a crash continue from their partial files
+        if self.resume_queue_on_start:
+            self.start_queue()
+        
+        self.yt_dlp_loader = YtdlpLoader()
+        self.yt_dlp_loader.loaded_signal.connect(self.yt_dlp_loaded)
+        self.yt_dlp_loader.start()
+    
+    def yt_dlp_loaded(self, seconds):
+        self.startup.mark("yt_dlp")
+        self.startup.durations['yt_dlp_import'] = seconds
+        self.yt_dlp_loader.wait()
+        self.report_startup()
+    
+    def report_startup(self):
+        if self.startup_reported or not self.startup.is_complete:
+            return
+        self.startup_reported = True
+        self.log_message(self.startup.summary())
+        
+        if self.startup.report_path:
+            try:
+                self.startup.write_report()
+            except OSError as e:
+                self.log_message(f"Error writing startup report: {str(e)}")
+        if self.startup.exit_when_complete:
+            # quit() would close the window and ask for confirmation
+            QApplication.exit(0)
+    
+    def add_lazy_tab(self, title, setup):
+        tab = QWidget()
+        self.lazy_tabs[tab] = setup
+        self.tabs.addTab(tab, title)
+    
+    def build_tab(self, index):
+        setup = self.lazy_tabs.pop(self.tabs.widget(index), None)
+        if setup is not None:
+            setup(self.tabs.widget(index))
+    
+    def setup_tray_icon(self):
+        # In a real app, you would use a real icon
+        self.tray_icon = QSystemTrayIcon(self)
+        tray_menu = QMenu()
+        
+        show_action = QAction("Show", self)
+        show_action.triggered.connect(self.show)
+        tray_menu.addAction(show_action)
+        
+        exit_action = QAction("Exit", self)
+        exit_action.triggered.connect(QApplication.quit)
+        tray_menu.addAction(exit_action)
+        
+        self.tray_icon.setContextMenu(tray_menu)
+        self.tray_icon.setToolTip("OSD")
+        self.tray_icon.show()
+    
+    def setup_download_tab(self):
+        download_tab = QWidget()
+        layout = QVBoxLayout(download_tab)
+        
+        # URL input section
+        url_layout = QHBoxLayout()
+        url_label = QLabel("YouTube URL:")
+        self.url_input = QLineEdit()
+        self.url_input.setPlaceholderText("Enter YouTube video or playlist URL")
+        url_layout.addWidget(url_label)
+        url_layout.addWidget(self.url_input)
+        layout.addLayout(url_layout)
+        
+        # Output directory section
+        dir_layout = QHBoxLayout()
+        dir_label = QLabel("Save to:")
+        self.dir_input = QLineEdit()
+        self.dir_input.setPlaceholderText("Select download directory")
+        self.dir_input.setText(self.settings.value("default_directory", "", type=str))
+        browse_btn = QPushButton("Browse")
+        browse_btn.clicked.connect(self.browse_directory)
+        dir_layout.addWidget(dir_label)
+        dir_layout.addWidget(self.dir_input)
+        dir_layout.addWidget(browse_btn)
+        layout.addLayout(dir_layout)
+        
+        # Format and quality selection
+        format_layout = QHBoxLayout()
+        
+        format_label = QLabel("Format:")
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(["Video (MP4)", "Audio (MP3)"])
+        self.format_combo.currentIndexChanged.connect(self.update_quality_options)
+        
+        quality_label = QLabel("Quality:")
+        self.quality_combo = QComboBox()
+        
+        # Set default format from settings
+        default_format = self.settings.value("default_format", "Video (MP4)", type=str)
+        default_index = 0 if default_format == "Video (MP4)" else 1
+        self.format_combo.setCurrentIndex(default_index)
+        
+        format_layout.addWidget(format_label)
+        format_layout.addWidget(self.format_combo)
+        format_layout.addWidget(quality_label)
+        format_layout.addWidget(self.quality_combo)
+        layout.addLayout(format_layout)
+        
+        # Parts of the video to download, each becomes a queue item of its own
+        sections_layout = QHBoxLayout()
+        sections_label = QLabel("Sections:")
+        self.sections_input = QLineEdit()
+        self.sections_input.setPlaceholderText("Whole video, or time ranges and chapter names, e.g. 1:30-3:00, Intro")
+        sections_layout.addWidget(sections_label)
+        sections_layout.addWidget(self.sections_input)
+        layout.addLayout(sections_layout)
+        
+        # Update quality options based on default format
+        self.update_quality_options()
+        
+        # Download button
+        self.download_btn = QPushButton("Add to Queue")
+        self.download_btn.clicked.connect(self.add_to_queue)
+        layout.addWidget(self.download_btn)
+        
+        # Bulk import, dropping text or files on the window does the same
+        import_layout = QHBoxLayout()
+        paste_btn = QPushButton("Paste URLs")
+        paste_btn.clicked.connect(self.import_from_clipboard)
+        import_file_btn = QPushButton("Import URL List...")
+        import_file_btn.clicked.connect(self.import_from_file)
+        import_layout.addWidget(paste_btn)
+        import_layout.addWidget(import_file_btn)
+        layout.addLayout(import_layout)
+        
+        # Progress section
+        progress_layout = QVBoxLayout()
+        progress_label = QLabel("Download Progress:")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        
+        progress_layout.addWidget(progress_label)
+        progress_layout.addWidget(self.progress_bar)
+        layout.addLayout(progress_layout)
+        
+        # Log section
+        log_layout = QVBoxLayout()
+        log_label = QLabel("Log:")
+        self.log_text = QTextEdit()
+        self.log_text.setReadOnly(True)
+        # Keep only the most recent lines so the view doesn't grow forever
+        self.log_text.document().setMaximumBlockCount(self.MAX_LOG_LINES)
+        
+        log_layout.addWidget(log_label)
+        log_layout.addWidget(self.log_text)
+        layout.addLayout(log_layout)
+        
+        self.tabs.addTab(download_tab, "Download")
+    
+    def setup_queue_tab(self):
+        queue_tab = QWidget()
+        layout = QVBoxLayout(queue_tab)
+        
+        # Queue table
+        self.queue_model = QueueTableModel(self.download_queue)
+        self.queue_table = QTableView()
+        self.queue_table.setModel(self.queue_model)
+        self.queue_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.queue_table.horizontalHeader().setStretchLastSection(True)
+        
+        # Rows are dragged to change the download order, priorities are set from the context menu
+        self.queue_table.setDragDropMode(QTableView.DragDropMode.InternalMove)
+        self.queue_table.setDragDropOverwriteMode(False)
+        self.queue_table.setDropIndicatorShown(True)
+        self.queue_model.rows_moved.connect(self.queue_reordered)
+        self.queue_table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.queue_table.customContextMenuRequested.connect(self.show_queue_menu)
+        
+        # Queue controls
+        controls_layout = QHBoxLayout()
+        self.start_queue_btn = QPushButton("Start Queue")
+        self.start_queue_btn.clicked.connect(self.start_queue)
+        
+        self.pause_queue_btn = QPushButton("Pause Queue")
+        self.pause_queue_btn.clicked.connect(self.pause_queue)
+        self.pause_queue_btn.setEnabled(False)
+        
+        self.remove_item_btn = QPushButton("Remove Selected")
+        self.remove_item_btn.clicked.connect(self.remove_selected_item)
+        
+        controls_layout.addWidget(self.start_queue_btn)
+        controls_layout.addWidget(self.pause_queue_btn)
+        controls_layout.addWidget(self.remove_item_btn)
+        
+        layout.addWidget(self.queue_table)
+        layout.addLayout(controls_layout)
+        
+        self.tabs.addTab(queue_tab, "Queue")
+    
+    def setup_history_tab(self, history_tab):
+        layout = QVBoxLayout(history_tab)
+        
+        # Opened before startup got to it
+        if self.history_store is None:
+            self.load_history()
+        
+        # History filter, applied by the store after a short typing pause
+        self.history_filter_input = QLineEdit()
+        self.history_filter_input.setPlaceholderText("Filter by title or URL")
+        self.history_filter_timer = QTimer(self)
+        self.history_filter_timer.setSingleShot(True)
+        self.history_filter_timer.setInterval(300)
+        self.history_filter_timer.timeout.connect(
+            lambda: self.history_model.set_filter(self.history_filter_input.text()))
+        self.history_filter_input.textChanged.connect(self.history_filter_timer.start)
+        
+        # History table, rows are fetched from the store as the view scrolls
+        self.history_model = HistoryTableModel(self.history_store)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
+        self.history_table.horizontalHeader().setStretchLastSection(True)
+        self.history_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.history_table.setSortingEnabled(True)
+        self.history_table.sortByColumn(3, Qt.SortOrder.DescendingOrder)
+        
+        # History controls
+        controls_layout = QHBoxLayout()
+        self.clear_history_btn = QPushButton("Clear History")
+        self.clear_history_btn.clicked.connect(self.clear_history)
+        
+        self.redownload_btn = QPushButton("Re-download Selected")
+        self.redownload_btn.clicked.connect(self.redownload_selected)
+        
+        controls_layout.addWidget(self.clear_history_btn)
+        controls_layout.addWidget(self.redownload_btn)
+        
+        layout.addWidget(self.history_filter_input)
+        layout.addWidget(self.history_table)
+        layout.addLayout(controls_layout)
+    
+    def setup_stats_tab(self, stats_tab):
+        layout = QVBoxLayout(stats_tab)
+        
+        self.stats_label = QLabel()
+        self.stats_label.setTextFormat(Qt.TextFormat.RichText)
+        self.stats_label.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
+        self.stats_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        
+        layout.addWidget(self.stats_label)
+        layout.addStretch()
+        
+        # Only refreshed while the tab is visible
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(1000)
+        self.stats_timer.timeout.connect(self.refresh_stats)
+        self.tabs.currentChanged.connect(
+            lambda index: self.stats_timer.start() if self.tabs.widget(index) is stats_tab else self.stats_timer.stop())
+        
+        # Built on the visit that switched to it, which the handler above missed
+        if self.tabs.currentWidget() is stats_tab:
+            self.refresh_stats()
+            self.stats_timer.start()
+    
+    def refresh_stats(self):
+        snapshot = self.metrics.snapshot()
+        
+        def values(section, name):
+            return snapshot[section].get(name, [])
+        
+        def gauge(name):
+            entries = values('gauges', name)
+            return entries[0]['value'] if entries else 0
+        
+        def seconds(value):
+            return f"{value:.2f} s" if value is not None else "-"
+        
+        results = {}
+        by_extractor = {}
+        for entry in values('counters', 'osd_downloads_total'):
+            result = entry['labels']['result']
+            results[result] = results.get(result, 0) + entry['value']
+            counts = by_extractor.setdefault(entry['labels']['extractor'], {})
+            counts[result] = counts.get(result, 0) + entry['value']
+        errors = {}
+        for entry in values('counters', 'osd_download_errors_total'):
+            error_class = entry['labels']['error_class']
+            errors[error_class] = errors.get(error_class, 0) + entry['value']
+        downloaded = sum(entry['value'] for entry in values('counters', 'osd_downloaded_bytes_total'))
+        retries = sum(entry['value'] for entry in values('counters', 'osd_download_retries_total'))
+        
+        html = [
+            f"<p><b>Throughput:</b> {format_size(gauge('osd_throughput_bytes_per_second'))}/s"
+            f" &nbsp; <b>Downloaded:</b> {format_size(downloaded)}"
+            f" &nbsp; <b>Retries:</b> {retries}</p>",
+            f"<p><b>Active:</b> {gauge('osd_active_downloads')} downloads,"
+            f" {gauge('osd_active_conversions')} conversions, {gauge('osd_queued_items')} queued"
+            f" &nbsp; <b>Finished:</b> {results.get('completed', 0)} completed,"
+            f" {results.get('failed', 0)} failed, {results.get('cancelled', 0)} cancelled</p>",
+            "<p><b>Errors:</b> " + (", ".join(f"{count} {error_class.replace('_', ' ')}"
+                                                for error_class, count in sorted(errors.items())) or "none") + "</p>",
+        ]
+        
+        # Phase timings
+        html.append("<table cellspacing='8'><tr><th align='left'>Phase</th><th>p50</th><th>p95</th><th>Count</th></tr>")
+        phases = {entry['labels']['phase']: entry for entry in values('summaries', 'osd_phase_seconds')}
+        rows = [(phase, phases.get(phase)) for phase in ("dir_check", "extract", "transfer", "postprocess")]
+        # Conversion time split by what ffmpeg did, to compare copying audio with encoding it
+        conversions = {entry['labels']['mode']: entry for entry in values('summaries', 'osd_conversion_seconds')}
+        rows += [(f"convert ({mode})", conversions[mode]) for mode in ("remux", "copy", "encode") if mode in conversions]
+        ttfb = values('summaries', 'osd_time_to_first_byte_seconds')
+        rows.append(("time to first byte", ttfb[0] if ttfb else None))
+        for name, entry in rows:
+            if entry is None:
+                html.append(f"<tr><td>{name}</td><td align='right'>-</td><td align='right'>-</td>"
+                            f"<td align='right'>0</td></tr>")
+            else:
+                html.append(f"<tr><td>{name}</td><td align='right'>{seconds(entry['p50'])}</td>"
+                            f"<td align='right'>{seconds(entry['p95'])}</td><td align='right'>{entry['count']}</td></tr>")
+        html.append("</table>")
+        
+        # Failure rate per extractor
+        html.append("<table cellspacing='8'><tr><th align='left'>Extractor</th><th>Completed</th>"
+                    "<th>Failed</th><th>Failure Rate</th></tr>")
+        for extractor, counts in sorted(by_extractor.items()):
+            completed, failed = counts.get('completed', 0), counts.get('failed', 0)
+            rate = f"{failed / (completed + failed) * 100:.1f}%" if completed + failed else "-"
+            html.append(f"<tr><td>{extractor}</td><td align='right'>{completed}</td>"
+                        f"<td align='right'>{failed}</td><td align='right'>{rate}</td></tr>")
+        html.append("</table>")
+        
+        if self.metrics_server is not None:
+            html.append(f"<p>Metrics endpoint: http://127.0.0.1:{self.metrics_server.port}/metrics</p>")
+        
+        self.stats_label.setText("".join(html))
+    
+    def setup_settings_tab(self, settings_tab):
+        layout = QVBoxLayout(settings_tab)
+        
+        # Default directory setting
+        dir_layout = QHBoxLayout()
+        dir_label = QLabel("Default Download Directory:")
+        self.default_dir_input = QLineEdit()
+        self.default_dir_input.setText(self.settings.value("default_directory", "", type=str))
+        browse_default_btn = QPushButton("Browse")
+        browse_default_btn.clicked.connect(self.browse_default_directory)
+        
+        dir_layout.addWidget(dir_label)
+        dir_layout.addWidget(self.default_dir_input)
+        dir_layout.addWidget(browse_default_btn)
+        
+        # Default format setting
+        format_layout = QHBoxLayout()
+        format_label = QLabel("Default Format:")
+        self.default_format_combo = QComboBox()
+        self.default_format_combo.addItems(["Video (MP4)", "Audio (MP3)"])
+        default_format = self.settings.value("default_format", "Video (MP4)", type=str)
+        default_index = 0 if default_format == "Video (MP4)" else 1
+        self.default_format_combo.setCurrentIndex(default_index)
+        
+        format_layout.addWidget(format_label)
+        format_layout.addWidget(self.default_format_combo)
+        
+        # Theme setting
+        theme_layout = QHBoxLayout()
+        theme_label = QLabel("Theme:")
+        self.theme_toggle = QCheckBox("Dark Mode")
+        self.theme_toggle.setChecked(self.is_dark_mode)
+        self.theme_toggle.stateChanged.connect(self.toggle_theme)
+        
+        theme_layout.addWidget(theme_label)
+        theme_layout.addWidget(self.theme_toggle)
+        
+        # Concurrent downloads setting
+        concurrency_layout = QHBoxLayout()
+        concurrency_label = QLabel("Concurrent Downloads:")
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 16)
+        self.concurrency_spin.setValue(self.scheduler.max_concurrent)
+        
+        concurrency_layout.addWidget(concurrency_label)
+        concurrency_layout.addWidget(self.concurrency_spin)
+        
+        # Progress update interval setting
+        interval_layout = QHBoxLayout()
+        interval_label = QLabel("Progress Update Interval (ms):")
+        self.progress_interval_spin = QSpinBox()
+        self.progress_interval_spin.setRange(50, 5000)
+        self.progress_interval_spin.setSingleStep(50)
+        self.progress_interval_spin.setValue(int(self.scheduler.progress_interval * 1000))
+        
+        interval_layout.addWidget(interval_label)
+        interval_layout.addWidget(self.progress_interval_spin)
+        
+        # Parallel fragment connections setting
+        fragments_layout = QHBoxLayout()
+        fragments_label = QLabel("Fragment Connections per Download (DASH/HLS):")
+        self.fragments_spin = QSpinBox()
+        self.fragments_spin.setRange(1, 16)
+        self.fragments_spin.setValue(self.scheduler.fragment_concurrency)
+        
+        fragments_layout.addWidget(fragments_label)
+        fragments_layout.addWidget(self.fragments_spin)
+        
+        # Conversion settings
+        conversion_layout = QHBoxLayout()
+        conversion_label = QLabel("Conversion Processes:")
+        self.conversion_workers_spin = QSpinBox()
+        self.conversion_workers_spin.setRange(1, 16)
+        self.conversion_workers_spin.setValue(self.conversion_pool.max_workers)
+        self.thumbnail_toggle = QCheckBox("Embed thumbnails")
+        self.thumbnail_toggle.setChecked(self.scheduler.embed_thumbnail)
+        self.audio_copy_toggle = QCheckBox("Keep original audio (no MP3 encoding)")
+        self.audio_copy_toggle.setToolTip("Audio downloads keep their M4A/Opus stream and are only retagged, "
+                                          "they are encoded to MP3 only when no container fits the stream")
+        self.audio_copy_toggle.setChecked(self.scheduler.audio_copy)
+        
+        conversion_layout.addWidget(conversion_label)
+        conversion_layout.addWidget(self.conversion_workers_spin)
+        conversion_layout.addWidget(self.thumbnail_toggle)
+        conversion_layout.addWidget(self.audio_copy_toggle)
+        
+        # Automatic retry setting
+        retries_layout = QHBoxLayout()
+        retries_label = QLabel("Retries after Network or Rate Limit Errors:")
+        self.retries_spin = QSpinBox()
+        self.retries_spin.setRange(0, 10)
+        self.retries_spin.setValue(self.scheduler.max_retries)
+        
+        retries_layout.addWidget(retries_label)
+        retries_layout.addWidget(self.retries_spin)
+        
+        # Queue order setting
+        policy_layout = QHBoxLayout()
+        policy_label = QLabel("Queue Order (within a priority):")
+        self.policy_combo = QComboBox()
+        self.policy_combo.addItem("First added first", "fifo")
+        self.policy_combo.addItem("Smallest download first", "sjf")
+        self.policy_combo.setCurrentIndex(self.policy_combo.findData(self.scheduler.policy))
+        
+        policy_layout.addWidget(policy_label)
+        policy_layout.addWidget(self.policy_combo)
+        
+        # Metadata fetch threads setting
+        metadata_layout = QHBoxLayout()
+        metadata_label = QLabel("Playlist Metadata Threads:")
+        self.metadata_workers_spin = QSpinBox()
+        self.metadata_workers_spin.setRange(1, 16)
+        self.metadata_workers_spin.setValue(self.settings.value("metadata_workers", 4, type=int))
+        
+        metadata_layout.addWidget(metadata_label)
+        metadata_layout.addWidget(self.metadata_workers_spin)
+        
+        # Download archive setting
+        archive_layout = QHBoxLayout()
+        archive_label = QLabel("Download Archive:")
+        self.archive_toggle = QCheckBox("Skip videos that were already downloaded")
+        self.archive_toggle.setChecked(self.scheduler.download_archive is not None)
+        
+        archive_layout.addWidget(archive_label)
+        archive_layout.addWidget(self.archive_toggle)
+        
+        # Bandwidth limit settings
+        bandwidth_layout = QHBoxLayout()
+        bandwidth_label = QLabel("Total Bandwidth Limit (KB/s, 0 = unlimited):")
+        self.bandwidth_limit_spin = QSpinBox()
+        self.bandwidth_limit_spin.setRange(0, 1000000)
+        self.bandwidth_limit_spin.setSingleStep(100)
+        self.bandwidth_limit_spin.setValue(self.settings.value("bandwidth_limit_kbps", 0, type=int))
+        per_item_label = QLabel("Per Download (KB/s):")
+        self.per_item_limit_spin = QSpinBox()
+        self.per_item_limit_spin.setRange(0, 1000000)
+        self.per_item_limit_spin.setSingleStep(100)
+        self.per_item_limit_spin.setValue(self.settings.value("bandwidth_per_item_kbps", 0, type=int))
+        
+        bandwidth_layout.addWidget(bandwidth_label)
+        bandwidth_layout.addWidget(self.bandwidth_limit_spin)
+        bandwidth_layout.addWidget(per_item_label)
+        bandwidth_layout.addWidget(self.per_item_limit_spin)
+        
+        # Time of day window for the total limit
+        schedule_layout = QHBoxLayout()
+        self.schedule_toggle = QCheckBox("Apply total limit only between")
+        self.schedule_toggle.setChecked(self.settings.value("bandwidth_schedule_enabled", False, type=bool))
+        self.schedule_start_edit = QTimeEdit(
+            QTime.fromString(self.settings.value("bandwidth_schedule_start", "09:00", type=str), "HH:mm"))
+        self.schedule_start_edit.setDisplayFormat("HH:mm")
+        self.schedule_end_edit = QTimeEdit(
+            QTime.fromString(self.settings.value("bandwidth_schedule_end", "18:00", type=str), "HH:mm"))
+        self.schedule_end_edit.setDisplayFormat("HH:mm")
+        
+        schedule_layout.addWidget(self.schedule_toggle)
+        schedule_layout.addWidget(self.schedule_start_edit)
+        schedule_layout.addWidget(QLabel("and"))
+        schedule_layout.addWidget(self.schedule_end_edit)
+        schedule_layout.addStretch()
+        
+        # Metrics endpoint setting
+        metrics_layout = QHBoxLayout()
+        metrics_label = QLabel("Metrics Endpoint Port (0 = off):")
+        self.metrics_port_spin = QSpinBox()
+        self.metrics_port_spin.setRange(0, 65535)
+        self.metrics_port_spin.setValue(self.settings.value("metrics_port", 0, type=int))
+        
+        metrics_layout.addWidget(metrics_label)
+        metrics_layout.addWidget(self.metrics_port_spin)
+        
+        # Save settings button
+        self.save_settings_btn = QPushButton("Save Settings")
+        self.save_settings_btn.clicked.connect(self.save_settings)
+        
+        # Add all layouts to main layout
+        layout.addLayout(dir_layout)
+        layout.addLayout(format_layout)
+        layout.addLayout(theme_layout)
+        layout.addLayout(concurrency_layout)
+        layout.addLayout(interval_layout)
+        layout.addLayout(fragments_layout)
+        layout.addLayout(conversion_layout)
+        layout.addLayout(retries_layout)
+        layout.addLayout(policy_layout)
+        layout.addLayout(metadata_layout)
+        layout.addLayout(archive_layout)
+        layout.addLayout(bandwidth_layout)
+        layout.addLayout(schedule_layout)
+        layout.addLayout(metrics_layout)
+        layout.addWidget(self.save_settings_btn)
+        layout.addStretch()
+    
+    def browse_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, "Select Download Directory")
+        if directory:
+            self.dir_input.setText(directory)
+    
+    def browse_default_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, "Select Default Download Directory")
+        if directory:
+            self.default_dir_input.setText(directory)
+    
+    def update_quality_options(self):
+        self.quality_combo.clear()
+        if self.format_combo.currentText() == "Video (MP4)":
+            self.quality_combo.addItems(["1080p", "720p", "480p", "360p"])
+        else:  # Audio (MP3)
+            self.quality_combo.addItems(["192 kbps", "128 kbps", "96 kbps"])
+        
+        # Set default quality from settings
+        if self.format_combo.currentText() == "Video (MP4)":
+            default_quality = self.settings.value("default_video_quality", "720p", type=str)
+            index = self.quality_combo.findText(default_quality)
+        else:
+            default_quality = self.settings.value("default_audio_quality", "128 kbps", type=str)
+            index = self.quality_combo.findText(default_quality)
+        
+        if index >= 0:
+            self.quality_combo.setCurrentIndex(index)
+    
+    def add_to_queue(self):
+        url = self.url_input.text().strip()
+        output_path = self.dir_input.text().strip()
+        format_type = self.format_combo.currentText()
+        quality = self.quality_combo.currentText()
+        
+        if not url:
+            self.show_error("Please enter a YouTube URL")
+            return
+        
+        sections = self.read_sections()
+        if sections is False:
+            return
+        
+        # Several pasted URLs go through the bulk import
+        if len(find_urls(url)) > 1:
+            if self.import_urls(url):
+                self.url_input.clear()
+                self.sections_input.clear()
+            return
+        
+        if not output_path:
+            self.show_error("Please select a download directory")
+            return
+            
+        # Check if output directory exists and is writable
+        error = prepare_output_directory(output_path)
+        if error:
+            self.show_error(error)
+            return
+        
+        # Create download item, it stays a placeholder until the URL is resolved
+        download_item = DownloadItem(url, output_path, format_type, quality)
+        download_item.status = "Resolving"
+        download_item.sections = sections
+        
+        # Add to queue
+        self.queue_model.append_items([download_item])
+        self.queue_store.add([download_item])
+        self.resolve_items([download_item])
+        
+        # Clear URL input
+        self.url_input.clear()
+        self.sections_input.clear()
+        
+        # Show success message
+        self.log_message(f"Added to queue: {url}")
+        
+        # Enable start button if it was disabled
+        self.start_queue_btn.setEnabled(True)
+        
+        # Switch to queue tab
+        self.tabs.setCurrentIndex(1)
+    
+    def read_sections(self):
+        """The sections typed in the download tab, None for whole videos and False if they are invalid"""
+        sections = self.sections_input.text().strip()
+        try:
+            parse_sections(sections)
+        except ValueError as e:
+            self.show_error(str(e))
+            return False
+        return sections or None
+    
+    def create_worker(self, job, on_progress, on_log, on_finished):
+        """Worker factory for the scheduler; queued signals bring callbacks back to the GUI thread"""
+        worker = DownloadWorker(job)
+        worker.progress_signal.connect(on_progress)
+        worker.log_signal.connect(on_log)
+        worker.finished_signal.connect(lambda url, success: on_finished(success))
+        
+        # Cancelled workers keep running until yt-dlp returns, so every worker stays
+        # referenced until its thread has really stopped
+        worker.finished.connect(lambda worker=worker: self._reap_worker(worker))
+        self.workers.add(worker)
+        return worker
+    
+    def _reap_worker(self, worker):
+        # finished fires just before the thread exits, so wait() for it before dropping the reference
+        worker.wait()
+        self.workers.discard(worker)
+    
+    def import_urls(self, text):
+        """
+        Queue every URL found in text with the current format and quality once
+        duplicates are sorted out on an ImportWorker. Returns False if nothing could be
+        queued because of the download directory.
+        """
+        output_path = self.dir_input.text().strip()
+        if not output_path:
+            self.show_error("Please select a download directory")
+            return False
+        
+        # One directory check for the whole import
+        error = prepare_output_directory(output_path)
+        if error:
+            self.show_error(error)
+            return False
+        
+        sections = self.read_sections()
+        if sections is False:
+            return False
+        
+        candidates = find_urls(text)
+        if not candidates:
+            self.log_message("No URLs found to import")
+            return True
+        
+        if self.history_store is None:
+            self.load_history()
+        format_type = self.format_combo.currentText()
+        quality = self.quality_combo.currentText()
+        self.pending_imports.append((candidates, output_path, format_type, quality, sections))
+        self._start_next_import()
+        return True
+    
+    def _start_next_import(self):
+        if self.import_worker is not None or not self.pending_imports:
+            return
+        candidates, *options = self.pending_imports.pop(0)
+        
+        # Videos already queued or downloaded are left out. The history is read on the worker,
+        # unless it is kept in memory and only reachable from this thread.
+        known_urls = [item.url for item in self.download_queue]
+        history_path = self.history_store.db_path
+        if history_path == ":memory:":
+            known_urls += self.history_store.urls("Completed")
+            history_path = None
+        worker = ImportWorker(candidates, known_urls, history_path)
+        worker.log_signal.connect(self.log_message)
+        worker.planned_signal.connect(
+            lambda urls, invalid, duplicates, options=options: self.import_planned(urls, invalid, duplicates, *options))
+        worker.finished.connect(self._reap_import_worker)
+        self.import_worker = worker
+        worker.start()
+    
+    def _reap_import_worker(self):
+        self.import_worker.wait()
+        self.import_worker = None
+        self._start_next_import()
+    
+    def import_planned(self, urls, invalid, duplicates, output_path, format_type, quality, sections):
+        # Plain video links need no resolving, only their metadata is fetched, unless the
+        # video's chapters decide the sections
+        needs_chapters = bool(sections and parse_sections(sections)[1])
+        items = []
+        for url in urls:
+            item = DownloadItem(url, output_path, format_type, quality)
+            item.sections = sections
+            if is_single_video(url) and not needs_chapters:
+                items += split_sections(item, {}, self.log_message)
+            else:
+                item.status = "Resolving"
+                items.append(item)
+        
+        # All rows go in with one model update and one transaction
+        self.queue_model.append_items(items)
+        self.queue_store.add(items)
+        if items:
+            self.resolve_items([item for item in items if item.status == "Resolving"],
+                               [item for item in items if item.status == "Queued"])
+        
+        self.log_message(f"Imported {len(items)} URLs, skipped {duplicates} duplicates"
+                         f" and {invalid} invalid URLs")
+        if items:
+            self.start_queue_btn.setEnabled(True)
+            self.tabs.setCurrentIndex(1)
+            self.scheduler.enqueue(items)
+    
+    def import_from_clipboard(self):
+        self.import_urls(QApplication.clipboard().text())
+    
+    def import_from_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import URL List", "",
+                                              "URL lists (*.txt *.csv);;All files (*)")
+        if path:
+            self.import_url_files([path])
+    
+    def import_url_files(self, paths):
+        texts = []
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    texts.append(f.read())
+            except OSError as e:
+                self.log_message(f"Cannot read {path}: {str(e)}")
+        if texts:
+            self.import_urls("\n".join(texts))
+    
+    def resolve_items(self, placeholders, metadata_items=()):
+        resolver = ResolveWorker(
+            placeholders,
+            UrlResolver(self.settings.value("metadata_workers", 4, type=int), self.info_cache, self.ydl_pool,
+                        self.scheduler.audio_copy),
+            metadata_items)
+        resolver.resolved_signal.connect(self.url_resolved)
+        resolver.metadata_signal.connect(self.metadata_resolved)
+        resolver.log_signal.connect(self.log_message)
+        resolver.finished.connect(lambda resolver=resolver: self._reap_resolver(resolver))
+        self.resolvers.add(resolver)
+        resolver.start()
+    
+    def _reap_resolver(self, resolver):
+        resolver.wait()
+        self.resolvers.discard(resolver)
+    
+    def url_resolved(self, placeholder, items):
+        # The placeholder may have been removed from the queue while resolving
+        if placeholder not in self.download_queue:
+            return
+        
+        # Items naming chapters the video does not have stay failed until given a section
+        for item in items:
+            if item.status != "Failed":
+                item.status = "Queued"
+        
+        if items == [placeholder]:
+            self.queue_model.item_changed(placeholder, 0, QueueTableModel.SECTION_COLUMN)
+            self.queue_store.save(placeholder)
+            self.scheduler.enqueue(items)
+        else:
+            self.queue_model.replace_item(placeholder, items)
+            self.queue_store.replace(placeholder, items)
+            self.scheduler.replace(placeholder, items)
+    
+    def metadata_resolved(self, item, metadata):
+        item.metadata.update(metadata)
+        if metadata.get('title'):
+            item.title = metadata['title']
+        self.queue_model.item_changed(item, 0, QueueTableModel.SECTION_COLUMN)
+        self.queue_store.save(item)
+        # The size is known now, which moves the item when the smallest downloads go first
+        if self.scheduler.policy == "sjf" and item.status == "Queued":
+            self.scheduler.enqueue([item])
+    
+    def enqueue_items(self, items):
+        self.queue_model.append_items(items)
+        self.queue_store.add(items)
+        self.scheduler.enqueue(items)
+    
+    def queue_reordered(self, items, before):
+        for item in items:
+            self.queue_store.move(item, before)
+        self.scheduler.reorder()
+    
+    def selected_queue_items(self):
+        return [self.queue_model.item_at(index.row())
+                for index in self.queue_table.selectionModel().selectedRows()]
+    
+    def show_queue_menu(self, position):
+        items = self.selected_queue_items()
+        if not items:
+            return
+        
+        menu = QMenu(self)
+        for priority in (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW):
+            action = menu.addAction(f"{PRIORITY_NAMES[priority]} Priority")
+            action.triggered.connect(lambda checked, priority=priority: self.set_priority(items, priority))
+        menu.addSeparator()
+        menu.addAction("Finish Within...").triggered.connect(lambda: self.ask_deadline(items))
+        menu.addAction("Clear Deadline").triggered.connect(lambda: self.set_deadline(items, None))
+        menu.addSeparator()
+        menu.addAction("Download Section...").triggered.connect(lambda: self.ask_section(items))
+        chapters = items[0].metadata.get('chapters') if len(items) == 1 else None
+        if chapters:
+            chapter_menu = menu.addMenu("Download Chapter")
+            for chapter in chapters:
+                section = (chapter.get('start_time') or 0, chapter.get('end_time'), chapter.get('title'))
+                action = chapter_menu.addAction(f"{format_timestamp(section[0])}  {chapter.get('title') or ''}")
+                action.triggered.connect(lambda checked, section=section: self.set_section(items, section))
+        menu.addAction("Download Whole Video").triggered.connect(lambda: self.set_section(items, None))
+        menu.exec(self.queue_table.viewport().mapToGlobal(position))
+    
+    def set_priority(self, items, priority):
+        for item in items:
+            self.scheduler.set_priority(item, priority)
+            self.queue_model.item_changed(item, QueueTableModel.PRIORITY_COLUMN, QueueTableModel.PRIORITY_COLUMN)
+            self.queue_store.save(item)
+    
+    def ask_deadline(self, items):
+        minutes, ok = QInputDialog.getInt(self, "Finish Within", "Minutes from now:", 60, 1, 7 * 24 * 60)
+        if ok:
+            self.set_deadline(items, time.time() + minutes * 60)
+    
+    def set_deadline(self, items, deadline):
+        for item in items:
+            item.deadline = deadline
+            self.queue_model.item_changed(item, QueueTableModel.PRIORITY_COLUMN, QueueTableModel.PRIORITY_COLUMN)
+            self.queue_store.save(item)
+        self.scheduler.enqueue(items)
+    
+    def ask_section(self, items):
+        current = section_label(items[0].section) if items[0].section is not None else ""
+        text, ok = QInputDialog.getText(self, "Download Section",
+                                        "Time range (e.g. 1:30-3:00 or 1:02:00-end) or chapter name:", text=current)
+        if not ok:
+            return
+        if not text.strip():
+            self.set_section(items, None)
+            return
+        try:
+            sections, unmatched = select_sections(text, items[0].metadata.get('chapters'))
+        except ValueError as e:
+            self.show_error(str(e))
+            return
+        if unmatched or len(sections) != 1:
+            self.show_error("Enter one time range, or the name of one chapter of the video")
+            return
+        self.set_section(items, sections[0])
+    
+    def set_section(self, items, section):
+        for item in items:
+            # Running and finished downloads keep the part they started with
+            if item.status not in ("Queued", "Paused", "Resumable", "Failed", "Cancelled"):
+                continue
+            item.section = section
+            # Partial data of another part of the video is of no use
+            item.progress = 0
+            item.downloaded_bytes = 0
+            if item.status == "Resumable":
+                item.status = "Paused"
+            elif item.status in ("Failed", "Cancelled"):
+                # Choosing what to download is asking for it again
+                item.status = "Queued"
+                item.attempts = 0
+                item.error_class = None
+            self.queue_model.item_changed(item, 0, QueueTableModel.SECTION_COLUMN)
+            self.queue_store.save(item)
+        self.scheduler.enqueue(items)
+    
+    def start_queue(self):
+        if not self.download_queue:
+            self.show_error("Queue is empty")
+            return
+        
+        if not self.scheduler.is_running:
+            # Update button states
+            self.start_queue_btn.setEnabled(False)
+            self.pause_queue_btn.setEnabled(True)
+            
+            # Paused items go back into the pool of schedulable items and continue from their partial data
+            for item in self.scheduler.resume():
+                self.queue_model.item_changed(item)
+                self.queue_store.save(item)
+    
+    def download_started(self, item):
+        self.queue_model.item_changed(item)
+        self.queue_store.save(item)
+    
+    def download_skipped(self, item):
+        self.queue_model.item_changed(item)
+        self.queue_store.save(item)
+    
+    def download_paused(self, item):
+        self.queue_model.item_changed(item)
+        self.queue_store.save(item)
+    
+    def conversion_started(self, item):
+        self.queue_model.item_changed(item)
+        self.queue_store.save(item)
+    
+    def download_retrying(self, item, delay):
+        self.queue_model.item_changed(item)
+        self.queue_store.save(item)
+    
+    def update_progress(self, item, snapshot):
+        # The progress bar shows the combined progress of every active download
+        active = self.scheduler.active
+        if active:
+            self.progress_bar.setValue(sum(i.progress for i in active) // len(active))
+        self.queue_model.item_changed(item)
+    
+    def download_finished(self, item, success):
+        # Add to history
+        history_item = history_entry(item, success)
+        entry_id = self.save_history(history_item)
+        if entry_id is not None and self.history_model is not None:
+            self.history_model.entry_added(entry_id)
+        
+        # Show notification
+        if success:
+            self.tray_icon.showMessage(
+                "Download Complete",
+                f"Successfully downloaded: {history_item['title']}",
+                QSystemTrayIcon.MessageIcon.Information,
+                3000
+            )
+        else:
+            self.tray_icon.showMessage(
+                "Download Failed",
+                f"Failed to download: {history_item['title']}",
+                QSystemTrayIcon.MessageIcon.Warning,
+                3000
+            )
+        
+        # Remove from queue
+        self.queue_model.remove_item(item)
+        self.queue_store.remove(item)
+        
+        # Reset progress bar once nothing is downloading
+        if not self.scheduler.active:
+            self.progress_bar.setValue(0)
+    
+    def queue_finished(self):
+        self.progress_bar.setValue(0)
+        self.start_queue_btn.setEnabled(True)
+        self.pause_queue_btn.setEnabled(False)
+    
+    def pause_queue(self):
+        if self.scheduler.is_running:
+            for item in self.scheduler.pause():
+                self.queue_model.item_changed(item)
+                self.queue_store.save(item)
+            
+            # Update button states
+            self.start_queue_btn.setEnabled(True)
+            self.pause_queue_btn.setEnabled(False)
+    
+    def remove_selected_item(self):
+        selected_rows = self.queue_table.selectionModel().selectedIndexes()
+        if not selected_rows:
+            return
+        
+        item = self.queue_model.item_at(selected_rows[0].row())
+        
+        if item is not None:
+            # Cancels the download if it is running
+            self.scheduler.remove(item)
+            # A paused download's partial data would be left behind with nothing to resume it
+            if item.status in DownloadScheduler.RESUMABLE_STATES:
+                remove_partial_files(item.partial_files, self.log_message)
+            
+            # Remove from queue
+            self.queue_model.remove_item(item)
+            self.queue_store.remove(item)
+    
+    def clear_history(self):
+        reply = QMessageBox.question(
+            self, 
+            "Clear History", 
+            "Are you sure you want to clear download history?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        
+        if reply == QMessageBox.StandardButton.Yes:
+            self.history_store.clear()
+            self.history_model.reload()
+    
+    def redownload_selected(self):
+        selected_rows = self.history_table.selectionModel().selectedIndexes()
+        if not selected_rows:
+            return
+        
+        item = self.history_model.entry_at(selected_rows[0].row())
+        
+        if item is not None:
+            # Add to queue
+            download_item = DownloadItem(
+                item.get("url", ""),
+                self.settings.value("default_directory", "", type=str),
+                item.get("format", "Video (MP4)"),
+                item.get("quality", "720p")
+            )
+            download_item.title = item.get("title", "Unknown")
+            
+            self.enqueue_items([download_item])
+            
+            # Switch to queue tab
+            self.tabs.setCurrentIndex(1)
+    
+    def save_settings(self):
+        # Save default directory
+        self.settings.setValue("default_directory", self.default_dir_input.text())
+        
+        # Save default format
+        self.settings.setValue("default_format", self.default_format_combo.currentText())
+        
+        # Save default qualities
+        if self.quality_combo.count() > 0:
+            if self.format_combo.currentText() == "Video (MP4)":
+                self.settings.setValue("default_video_quality", self.quality_combo.currentText())
+            else:
+                self.settings.setValue("default_audio_quality", self.quality_combo.currentText())
+        
+        # Save concurrent download limit
+        self.settings.setValue("max_concurrent_downloads", self.concurrency_spin.value())
+        self.scheduler.set_max_concurrent(self.concurrency_spin.value())
+        
+        # Save progress update interval (applies to downloads started from now on)
+        self.settings.setValue("progress_interval_ms", self.progress_interval_spin.value())
+        self.scheduler.progress_interval = self.progress_interval_spin.value() / 1000
+        
+        # Save fragment connections (applies to downloads started from now on)
+        self.settings.setValue("concurrent_fragments", self.fragments_spin.value())
+        self.scheduler.fragment_concurrency = self.fragments_spin.value()
+        
+        # Save conversion settings
+        self.settings.setValue("conversion_workers", self.conversion_workers_spin.value())
+        if self.conversion_workers_spin.value() != self.conversion_pool.max_workers:
+            self.conversion_pool.set_max_workers(self.conversion_workers_spin.value())
+        self.settings.setValue("embed_thumbnail", self.thumbnail_toggle.isChecked())
+        self.scheduler.embed_thumbnail = self.thumbnail_toggle.isChecked()
+        self.settings.setValue("audio_copy", self.audio_copy_toggle.isChecked())
+        self.scheduler.audio_copy = self.audio_copy_toggle.isChecked()
+        
+        # Save retry setting
+        self.settings.setValue("max_retries", self.retries_spin.value())
+        self.scheduler.max_retries = self.retries_spin.value()
+        
+        # Save queue order
+        self.settings.setValue("queue_policy", self.policy_combo.currentData())
+        if self.policy_combo.currentData() != self.scheduler.policy:
+            self.scheduler.set_policy(self.policy_combo.currentData())
+        
+        # Save playlist metadata threads
+        self.settings.setValue("metadata_workers", self.metadata_workers_spin.value())
+        
+        # Save download archive setting
+        self.settings.setValue("use_download_archive", self.archive_toggle.isChecked())
+        self.scheduler.download_archive = self.download_archive if self.archive_toggle.isChecked() else None
+        
+        # Save bandwidth limits, running downloads are rebalanced right away
+        self.settings.setValue("bandwidth_limit_kbps", self.bandwidth_limit_spin.value())
+        self.settings.setValue("bandwidth_per_item_kbps", self.per_item_limit_spin.value())
+        self.settings.setValue("bandwidth_schedule_enabled", self.schedule_toggle.isChecked())
+        self.settings.setValue("bandwidth_schedule_start", self.schedule_start_edit.time().toString("HH:mm"))
+        self.settings.setValue("bandwidth_schedule_end", self.schedule_end_edit.time().toString("HH:mm"))
+        self.apply_bandwidth_settings()
+        
+        # Save metrics endpoint port
+        if self.metrics_port_spin.value() != self.settings.value("metrics_port", 0, type=int):
+            self.settings.setValue("metrics_port", self.metrics_port_spin.value())
+            self.apply_metrics_settings()
+        
+        # Update UI with new settings
+        self.dir_input.setText(self.default_dir_input.text())
+        
+        # Show confirmation
+        QMessageBox.information(self, "Settings Saved", "Your settings have been saved successfully.")
+    
+    def apply_bandwidth_settings(self):
+        total = self.settings.value("bandwidth_limit_kbps", 0, type=int) * 1024
+        per_item = self.settings.value("bandwidth_per_item_kbps", 0, type=int) * 1024
+        
+        if self.settings.value("bandwidth_schedule_enabled", False, type=bool):
+            # Limited inside the window, unlimited the rest of the day
+            schedule = [(self.settings.value("bandwidth_schedule_start", "09:00", type=str),
+                         self.settings.value("bandwidth_schedule_end", "18:00", type=str),
+                         total)]
+            self.bandwidth.configure(0, per_item, schedule)
+        else:
+            self.bandwidth.configure(total, per_item)
+    
+    def apply_metrics_settings(self):
+        self.stop_metrics_server()
+        port = self.settings.value("metrics_port", 0, type=int)
+        if not port:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, port)
+            self.metrics_server.start()
+            self.log_message(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            self.metrics_server = None
+            self.log_message(f"Cannot serve metrics on port {port}: {str(e)}")
+    
+    def stop_metrics_server(self):
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+    
+    def toggle_theme(self, state):
+        self.is_dark_mode = state == Qt.CheckState.Checked
+        self.settings.setValue("dark_mode", self.is_dark_mode)
+        self.apply_theme()
+    
+    def apply_theme(self):
+        if self.is_dark_mode:
+            # Dark theme
+            self.setStyleSheet("""
+                QWidget {
+                    background-color: #2D2D2D;
+                    color: #FFFFFF;
+                    font-family: 'Segoe UI';
+                    font-size: 12pt;
+                }
+                QPushButton {
+                    background-color: #0D7377;
+                    color: white;
+                    border: none;
+                    padding: 8px 16px;
+                    border-radius: 4px;
+                }
+                
+                QPushButton:hover {
+                    background-color: #14FFEC;
+                    color: #2D2D2D;
+                }
+                QLineEdit, QTextEdit, QComboBox {
+                    background-color: #3D3D3D;
+                    color: #FFFFFF;
+                    border: 1px solid #555555;
+                    padding: 4px;
+                    border-radius: 4px;
+                }
+                QTableView {
+                    background-color: #3D3D3D;
+                    color: #FFFFFF;
+                    gridline-color: #555555;
+                    border: 1px solid #555555;
+                }
+                QTableView::item:selected {
+                    background-color: #0D7377;
+                }
+                QHeaderView::section {
+                    background-color: #2D2D2D;
+                    color: #FFFFFF;
+                    border: 1px solid #555555;
+                }
+                QProgressBar {
+                    border: 1px solid #555555;
+                    border-radius: 4px;
+                    text-align: center;
+                    background-color: #3D3D3D;
+                }
+                QProgressBar::chunk {
+                    background-color: #14FFEC;
+                }
+                QTabWidget::pane {
+                    border: 1px solid #555555;
+                }
+                QTabBar::tab {
+                    background-color: #2D2D2D;
+                    color: #FFFFFF;
+                    padding: 8px 16px;
+                    border: 1px solid #555555;
+                    border-bottom: none;
+                    border-top-left-radius: 4px;
+                    border-top-right-radius: 4px;
+                }
+                QTabBar::tab:selected {
+                    background-color: #3D3D3D;
+                }
+            """)
+        else:
+            # Light theme
+            self.setStyleSheet("""
+                QWidget {
+                    background-color: #FFFFFF;
+                    color: #333333;
+                    font-family: 'Segoe UI';
+                    font-size: 12pt;
+                }
+                QPushButton {
+                    background-color: #4F98CA;
+                    color: white;
+                    border: none;
+                    padding: 8px 16px;
+                    border-radius: 4px;
+                }
+                QPushButton:hover {
+                    background-color: #3A7CA5;
+                }
+                QLineEdit, QTextEdit, QComboBox {
+                    background-color: #F5F5F5;
+                    color: #333333;
+                    border: 1px solid #DDDDDD;
+                    padding: 4px;
+                    border-radius: 4px;
+                }
+                QTableView {
+                    background-color: #FFFFFF;
+                    color: #333333;
+                    gridline-color: #DDDDDD;
+                    border: 1px solid #DDDDDD;
+                }
+                QTableView::item:selected {
+                    background-color: #4F98CA;
+                    color: #FFFFFF;
+                }
+                QHeaderView::section {
+                    background-color: #F0F0F0;
+                    color: #333333;
+                    border: 1px solid #DDDDDD;
+                }
+                QProgressBar {
+                    border: 1px solid #DDDDDD;
+                    border-radius: 4px;
+                    text-align: center;
+                }
+                QProgressBar::chunk {
+                    background-color: #4F98CA;
+                }
+                QTabWidget::pane {
+                    border: 1px solid #DDDDDD;
+                }
+                QTabBar::tab {
+                    background-color: #F0F0F0;
+                    color: #333333;
+                    padding: 8px 16px;
+                    border: 1px solid #DDDDDD;
+                    border-bottom: none;
+                    border-top-left-radius: 4px;
+                    border-top-right-radius: 4px;
+                }
+                QTabBar::tab:selected {
+                    background-color: #FFFFFF;
+                }
+            """)
+    
+
+    def load_history(self):
+        home = os.path.expanduser("~")
+        try:
+            self.history_store = HistoryStore(
+                os.path.join(home, "yt_downloader_history.db"),
+                os.path.join(home, "yt_downloader_history.json"),
+                self.log_message
+            )
+        except Exception as e:
+            # Keep going with an in-memory store
+            self.log_message(f"Error loading history: {str(e)}")
+            self.history_store = HistoryStore(":memory:")
+    
+    def open_queue_store(self):
+        try:
+            return QueueStore(os.path.join(os.path.expanduser("~"), "yt_downloader_queue.db"))
+        except Exception as e:
+            # Keep going with a queue that only lives as long as the window
+            self.log_message(f"Error opening saved queue: {str(e)}")
+            return QueueStore(":memory:")
+    
+    def restore_queue(self):
+        """Put the saved queue back; returns True if downloads were running when it was saved"""
+        try:
+            items = self.queue_store.load()
+        except Exception as e:
+            self.log_message(f"Error loading saved queue: {str(e)}")
+            return False
+        if not items:
+            return False
+        
+        interrupted = False
+        for item in items:
+            if item.status == "Pausing":
+                item.status = "Resumable" if item.downloaded_bytes else "Paused"
+            elif item.status in QueueStore.IN_PROGRESS_STATES:
+                # Scheduled again, the new job continues from the partial files
+                item.status = "Queued"
+                interrupted = True
+            else:
+                continue
+            self.queue_store.save(item)
+        
+        self.queue_model.append_items(items)
+        placeholders = [item for item in items if item.status == "Resolving"]
+        if placeholders:
+            self.resolve_items(placeholders)
+        
+        self.log_message(f"Restored {len(items)} items from the last session")
+        if interrupted:
+            self.log_message("Resuming interrupted downloads")
+        return interrupted
+    
+    def open_info_cache(self):
+        try:
+            return InfoCache(os.path.join(os.path.expanduser("~"), "yt_downloader_info_cache.db"))
+        except Exception as e:
+            # Caching is an optimization only, run without it
+            self.pending_log_messages.append(f"Error opening info cache: {str(e)}")
+            return None
+    
+    def save_history(self, history_item):
+        if self.history_store is None:
+            self.load_history()
+        try:
+            return self.history_store.add(history_item)
+        except Exception as e:
+            self.log_message(f"Error saving history: {str(e)}")
+            return None
+    
+    def log_message(self, message):
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.log_text.append(f"[{timestamp}] {message}")
+        
+        # Also log to file for debugging
+        self.log_writer.write(f"[{timestamp}] {message}")
+    
+    
+    def show_error(self, message):
+        QMessageBox.critical(self, "Error", message)
+    
+    def dragEnterEvent(self, event: QDragEnterEvent):
+        if event.mimeData().hasText() or event.mimeData().hasUrls():
+            event.acceptProposedAction()
+    
+    def dropEvent(self, event: QDropEvent):
+        # Dropped files are URL lists, dropped text or links are imported as they are
+        mime_data = event.mimeData()
+        files = [url.toLocalFile() for url in mime_data.urls() if url.isLocalFile()]
+        if files:
+            self.import_url_files(files)
+        elif mime_data.hasText():
+            self.import_urls(mime_data.text())
+        else:
+            self.import_urls("\n".join(url.toString() for url in mime_data.urls()))
+        event.acceptProposedAction()
+    
+    def closeEvent(self, event):
+        reply = QMessageBox.question(
+            self, 
+            "Exit", 
+            "Are you sure you want to exit?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        
+        if reply == QMessageBox.StandardButton.Yes:
+            event.accept()
+        else:
+            event.ignore()
+
+def run_gui(argv, started_at=None, startup_report=None, exit_after_startup=False):
+    startup = StartupTimer(started_at, startup_report, exit_after_startup)
+    startup.mark("imports")
+    app = QApplication(argv)
+    window = YTDownloaderGUI(startup)
+    return app.exec()
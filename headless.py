@@ -0,0 +1,267 @@
+import os
+import re
+import sys
+import json
+import queue
+import threading
+
+from yt_dlp.utils import parse_bytes
+
+from postprocess import ConversionPool
+from metrics import MetricsRegistry, MetricsServer, MetricsSnapshotWriter
+from engine import (DownloadItem, DownloadScheduler, UrlResolver, ThreadWorker, LogWriter, HistoryStore,
+                    DownloadArchive, InfoCache, BandwidthManager, YoutubeDLPool, history_entry, parse_sections,
+                    section_label)
+
+FORMATS = {"video": "Video (MP4)", "audio": "Audio (MP3)"}
+DEFAULT_QUALITY = {"video": "720p", "audio": "128 kbps"}
+
+# Headless queue runner
+class HeadlessRunner:
+    """
+    Run a list of URLs through the download engine without any GUI, printing one
+    JSON object per line to stdout for every queue event
+    """
+    def __init__(self, output_path, format_type, quality, max_concurrent=3, progress_interval=1.0,
+                 use_archive=True, bandwidth=None, fragment_concurrency=4, conversion_workers=2,
+                 embed_thumbnail=True, metrics=None, max_retries=3, policy="fifo", audio_copy=False,
+                 sections=None, out=sys.stdout):
+        self.output_path = output_path
+        self.format_type = format_type
+        self.quality = quality
+        # Time ranges and chapter names to download of every video, see parse_sections
+        self.sections = sections
+        self.out = out
+        self.download_queue = []
+        self.events = queue.Queue()
+        self.failures = 0
+        self.interrupted = False
+
+        home = os.path.expanduser("~")
+        self.log_writer = LogWriter(os.path.join(home, "yt_downloader_logs"))
+        self.history_store = HistoryStore(
+            os.path.join(home, "yt_downloader_history.db"),
+            os.path.join(home, "yt_downloader_history.json"),
+            self.log_message
+        )
+        self.info_cache = InfoCache(os.path.join(home, "yt_downloader_info_cache.db"))
+        # Warm YoutubeDL instances shared by resolving and downloading
+        self.ydl_pool = YoutubeDLPool(os.path.join(home, "yt_downloader_cache"))
+
+        self.scheduler = DownloadScheduler(
+            self.download_queue,
+            lambda job, on_progress, on_log, on_finished:
+                ThreadWorker(job, on_progress, on_log, on_finished, self.events),
+            max_concurrent,
+            progress_interval
+        )
+        self.scheduler.info_cache = self.info_cache
+        self.scheduler.ydl_pool = self.ydl_pool
+        self.scheduler.bandwidth = bandwidth
+        self.scheduler.fragment_concurrency = fragment_concurrency
+        self.conversion_pool = ConversionPool(conversion_workers)
+        self.scheduler.conversion_pool = self.conversion_pool
+        self.scheduler.embed_thumbnail = embed_thumbnail
+        self.scheduler.audio_copy = audio_copy
+        if metrics is not None:
+            self.scheduler.set_metrics(metrics)
+        self.scheduler.max_retries = max_retries
+        self.scheduler.set_policy(policy)
+        self.scheduler.call_later = self.call_later
+        if use_archive:
+            self.scheduler.download_archive = DownloadArchive(os.path.join(home, "yt_downloader_archive.txt"))
+
+        self.scheduler.on_item_started = lambda item: self.emit("started", item)
+        self.scheduler.on_item_progress = lambda item, snapshot: self.emit("progress", item, **snapshot)
+        self.scheduler.on_item_finished = self.download_finished
+        self.scheduler.on_item_skipped = lambda item: self.emit("skipped", item)
+        self.scheduler.on_item_converting = lambda item: self.emit("converting", item)
+        self.scheduler.on_item_paused = lambda item: self.emit("paused", item, downloaded_bytes=item.downloaded_bytes)
+        self.scheduler.on_item_retrying = lambda item, delay: self.emit(
+            "retrying", item, attempt=item.attempts, delay=round(delay, 1), error_class=item.error_class)
+        self.scheduler.on_log = self.log_message
+        self.resolver = UrlResolver(info_cache=self.info_cache, ydl_pool=self.ydl_pool, audio_copy=audio_copy)
+
+    def emit(self, event, item=None, **fields):
+        record = {"event": event}
+        if item is not None:
+            record.update(url=item.url, title=item.title, status=item.status)
+            if item.section is not None:
+                record.update(section=section_label(item.section))
+        record.update(fields)
+        self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+
+    def log_message(self, message):
+        self.log_writer.write(message)
+        self.emit("log", message=message)
+
+    def download_finished(self, item, success):
+        self.history_store.add(history_entry(item, success))
+        if not success:
+            self.failures += 1
+        self.emit("finished", item, success=success)
+
+    def call_later(self, delay, callback):
+        # The timer only posts the callback, it runs on the main thread like every other
+        timer = threading.Timer(delay, self.events.put, ((callback, ()),))
+        timer.daemon = True
+        timer.start()
+
+    def process_event(self):
+        callback, args = self.events.get()
+        callback(*args)
+
+    def resolve(self, urls):
+        """
+        Queue the videos behind urls, with the full metadata of playlist entries
+        fetched several at a time like the GUI does, so sizes are known before the
+        first download is scheduled
+        """
+        on_metadata = lambda item, metadata: item.metadata.update(metadata)
+        items = []
+        for url in urls:
+            placeholder = DownloadItem(url, self.output_path, self.format_type, self.quality)
+            placeholder.sections = self.sections
+            items += self.resolver.resolve(placeholder, on_metadata, self.log_message)
+
+        pending = [item for item in items if self.resolver.needs_metadata(item)]
+        if pending:
+            self.resolver.fetch_metadata(pending, on_metadata, self.log_message)
+
+        for item in items:
+            if item.metadata.get('title'):
+                item.title = item.metadata['title']
+            self.download_queue.append(item)
+            # Items naming chapters the video does not have are not downloaded
+            if item.status == "Failed":
+                self.download_finished(item, False)
+            else:
+                self.emit("queued", item)
+
+    def run(self, urls):
+        """Resolve and download every URL; returns the number of failed downloads"""
+        self.log_writer.start()
+        try:
+            self.resolve(urls)
+            self.scheduler.start()
+
+            # All scheduler callbacks run here, on the main thread
+            try:
+                while self.scheduler.is_running:
+                    self.process_event()
+            except KeyboardInterrupt:
+                # Let in-flight downloads stop cleanly so the next run resumes their partial data
+                self.interrupted = True
+                self.scheduler.pause()
+                while self.scheduler.stopping:
+                    self.process_event()
+
+            completed = sum(1 for item in self.download_queue if item.status == "Completed")
+            self.emit("done", completed=completed, failed=self.failures, interrupted=self.interrupted)
+            return self.failures
+        finally:
+            self.conversion_pool.shutdown()
+            self.ydl_pool.close()
+            self.log_writer.close()
+            self.history_store.close()
+
+def read_urls(source):
+    """Read one URL per line, ignoring blank lines and # comments"""
+    urls = []
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
+
+def parse_rate(rate):
+    """Parse a rate such as 500K or 2M into bytes per second"""
+    value = parse_bytes(rate)
+    if value is None:
+        raise ValueError(f"Invalid rate: {rate}")
+    return value
+
+def is_clock_time(hhmm):
+    """Whether an H:MM or HH:MM time is a time of day, 0:00 to 23:59"""
+    hours, minutes = hhmm.split(":")
+    return int(hours) < 24 and int(minutes) < 60
+
+def parse_schedule(windows):
+    """Parse HH:MM-HH:MM=RATE windows into BandwidthManager schedule entries"""
+    schedule = []
+    for window in windows:
+        match = re.fullmatch(r'(\d{1,2}:\d{2})-(\d{1,2}:\d{2})=(\S+)', window)
+        if not match or not all(is_clock_time(match.group(group)) for group in (1, 2)):
+            raise ValueError(f"Invalid schedule window: {window}")
+        schedule.append((match.group(1), match.group(2), parse_rate(match.group(3))))
+    return schedule
+
+def run_headless(args):
+    format_type = FORMATS[args.format]
+    quality = args.quality or DEFAULT_QUALITY[args.format]
+
+    if args.input == "-":
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            urls = read_urls(f)
+
+    if args.sections:
+        try:
+            parse_sections(args.sections)
+        except ValueError as e:
+            sys.stderr.write(f"{e}\n")
+            return 2
+
+    bandwidth = None
+    if args.limit_rate or args.limit_rate_per_item or args.limit_schedule:
+        try:
+            bandwidth = BandwidthManager(
+                parse_rate(args.limit_rate) if args.limit_rate else 0,
+                parse_rate(args.limit_rate_per_item) if args.limit_rate_per_item else 0,
+                parse_schedule(args.limit_schedule)
+            )
+        except ValueError as e:
+            sys.stderr.write(f"{e}\n")
+            return 2
+
+    metrics = MetricsRegistry()
+    server = writer = None
+    try:
+        if args.metrics_port:
+            server = MetricsServer(metrics, args.metrics_port)
+            server.start()
+        if args.metrics_file:
+            writer = MetricsSnapshotWriter(metrics, os.path.abspath(args.metrics_file))
+            writer.start()
+    except OSError as e:
+        sys.stderr.write(f"Cannot export metrics: {e}\n")
+        return 2
+
+    runner = HeadlessRunner(
+        os.path.abspath(args.output),
+        format_type,
+        quality,
+        max_concurrent=args.concurrency,
+        use_archive=not args.no_archive,
+        bandwidth=bandwidth,
+        fragment_concurrency=args.concurrent_fragments,
+        conversion_workers=args.conversion_workers,
+        embed_thumbnail=not args.no_thumbnail,
+        metrics=metrics,
+        max_retries=args.retries,
+        policy=args.policy,
+        audio_copy=args.audio_copy,
+        sections=args.sections
+    )
+    try:
+        failures = runner.run(urls)
+    finally:
+        if writer is not None:
+            writer.close()
+        if server is not None:
+            server.close()
+    if runner.interrupted:
+        return 130
+    return 1 if failures else 0
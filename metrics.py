@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metric names, types and help texts, in export order
+METRICS = {
+    'osd_downloads_total': ('counter', "Finished download jobs by extractor and result"),
+    'osd_download_retries_total': ('counter', "Retries yt-dlp made, by extractor"),
+    'osd_download_errors_total': ('counter', "Failed download attempts by extractor and error class"),
+    'osd_downloaded_bytes_total': ('counter', "Bytes received from the network"),
+    'osd_conversions_total': ('counter', "Finished conversions by result"),
+    'osd_phase_seconds': ('summary', "Time spent in each phase of a download"),
+    'osd_conversion_seconds': ('summary', "Time of finished conversions by mode (remux, copy, encode)"),
+    'osd_time_to_first_byte_seconds': ('summary', "Time from the end of extraction to the first byte"),
+    'osd_throughput_bytes_per_second': ('gauge', "Aggregate download rate over the last seconds"),
+    'osd_active_downloads': ('gauge', "Downloads in flight"),
+    'osd_active_conversions': ('gauge', "Conversions in flight"),
+    'osd_queued_items': ('gauge', "Items waiting in the queue"),
+}
+
+QUANTILES = (0.5, 0.95)
+
+# Metrics registry
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and summaries for the download engine. Summaries
+    keep the last max_samples observations for their quantiles.
+    """
+    def __init__(self, window=10.0, max_samples=1000):
+        self.window = window
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._gauge_functions = {}
+        self._summaries = {}
+        # (second, bytes) buckets for the throughput gauge
+        self._rate_buckets = deque()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def gauge_function(self, name, function):
+        """Report name as the value of function() whenever the registry is read"""
+        with self.lock:
+            self._gauge_functions[name] = function
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {'count': 0, 'sum': 0.0,
+                                                  'samples': deque(maxlen=self.max_samples)}
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['samples'].append(value)
+
+    def add_bytes(self, nbytes):
+        """Count downloaded bytes, called from the progress hooks of running jobs"""
+        if nbytes <= 0:
+            return
+        second = int(time.monotonic())
+        with self.lock:
+            key = ('osd_downloaded_bytes_total', ())
+            self._counters[key] = self._counters.get(key, 0) + nbytes
+            if self._rate_buckets and self._rate_buckets[-1][0] == second:
+                self._rate_buckets[-1][1] += nbytes
+            else:
+                self._rate_buckets.append([second, nbytes])
+
+    def throughput(self):
+        """Bytes per second over the last window seconds"""
+        with self.lock:
+            return self._throughput()
+
+    def _throughput(self):
+        oldest = time.monotonic() - self.window
+        while self._rate_buckets and self._rate_buckets[0][0] < oldest:
+            self._rate_buckets.popleft()
+        return sum(nbytes for _, nbytes in self._rate_buckets) / self.window
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict"""
+        with self.lock:
+            gauges = dict(self._gauges)
+            gauges[self._key('osd_throughput_bytes_per_second', {})] = self._throughput()
+            functions = list(self._gauge_functions.items())
+            counters = dict(self._counters)
+            summaries = {key: (summary['count'], summary['sum'], sorted(summary['samples']))
+                         for key, summary in self._summaries.items()}
+
+        # Gauge functions read other objects, so they run outside the lock
+        for name, function in functions:
+            try:
+                gauges[(name, ())] = function()
+            except Exception:
+                pass
+
+        result = {'timestamp': time.time(), 'counters': {}, 'gauges': {}, 'summaries': {}}
+        for (name, labels), value in counters.items():
+            result['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), value in gauges.items():
+            result['gauges'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), (count, total, samples) in summaries.items():
+            entry = {'labels': dict(labels), 'count': count, 'sum': total}
+            for q in QUANTILES:
+                entry[f'p{int(q * 100)}'] = _quantile(samples, q)
+            result['summaries'].setdefault(name, []).append(entry)
+        return result
+
+    def to_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            section = {'counter': 'counters', 'gauge': 'gauges', 'summary': 'summaries'}[kind]
+            entries = snapshot[section].get(name)
+            if not entries:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for entry in entries:
+                labels = entry['labels']
+                if kind == 'summary':
+                    for q in QUANTILES:
+                        value = entry[f'p{int(q * 100)}']
+                        if value is not None:
+                            lines.append(f"{name}{_labels(labels, quantile=q)} {value}")
+                    lines.append(f"{name}_sum{_labels(labels)} {entry['sum']}")
+                    lines.append(f"{name}_count{_labels(labels)} {entry['count']}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {entry['value']}")
+        return "\n".join(lines) + "\n"
+
+def _quantile(samples, q):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    text = ",".join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for key, value in sorted(labels.items()))
+    return "{" + text + "}"
+
+# Local metrics endpoint
+class MetricsServer:
+    """Serve /metrics (Prometheus text) and /metrics.json on a local port"""
+    def __init__(self, registry, port, host="127.0.0.1"):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry_ref.to_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(registry_ref.snapshot()).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# Periodic JSON snapshots
+class MetricsSnapshotWriter(threading.Thread):
+    """Write the registry snapshot to a JSON file every interval seconds"""
+    def __init__(self, registry, path, interval=10.0):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        # Readers never see a half written file
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.registry.snapshot(), f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        """Stop the thread and write a final snapshot"""
+        self._stop_event.set()
+        self.write()
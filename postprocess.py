@@ -0,0 +1,262 @@
+import os
+import re
+import time
+import shutil
+import subprocess
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, CancelledError
+
+# This module is imported by the conversion processes, so it stays free of Qt and yt-dlp
+
+def find_ffmpeg():
+    return shutil.which("ffmpeg")
+
+# Containers that can carry a cover image next to the audio
+COVER_AUDIO_EXTS = (".mp3", ".m4a", ".flac")
+
+def conversion_mode(task):
+    """What ffmpeg does for a task: "encode" audio to MP3, "copy" audio as it is or "remux" video"""
+    if task.get('audio_copy'):
+        return "copy"
+    return "encode" if task.get('audio_bitrate') else "remux"
+
+def build_command(task, output):
+    """
+    ffmpeg command for a conversion task. Video tasks copy every stream of the inputs
+    into one MP4, audio tasks encode the first audio stream to MP3 at audio_bitrate,
+    or with audio_copy copy it as it is into the output's container.
+    """
+    command = [task['ffmpeg'], '-y', '-nostdin', '-hide_banner', '-loglevel', 'error',
+               '-progress', task['progress_file']]
+    for path in task['inputs']:
+        command += ['-i', path]
+
+    thumbnail_input = len(task['inputs'])
+    if task.get('thumbnail'):
+        command += ['-i', task['thumbnail']]
+
+    if task.get('audio_bitrate') or task.get('audio_copy'):
+        command += ['-map', '0:a:0']
+        if task.get('audio_copy'):
+            command += ['-c:a', 'copy']
+        else:
+            command += ['-c:a', 'libmp3lame', '-b:a', task['audio_bitrate']]
+        ext = os.path.splitext(output)[1].lower()
+        if task.get('thumbnail') and ext in COVER_AUDIO_EXTS:
+            command += ['-map', f'{thumbnail_input}:v:0', '-c:v', 'mjpeg', '-disposition:v', 'attached_pic']
+            if ext == ".mp3":
+                command += ['-id3v2_version', '3']
+        for key, value in (task.get('tags') or {}).items():
+            command += ['-metadata', f'{key}={value}']
+    else:
+        for index in range(len(task['inputs'])):
+            command += ['-map', f'{index}:v?', '-map', f'{index}:a?']
+        command += ['-c', 'copy']
+        if task.get('thumbnail'):
+            # The cover comes after the video streams of the inputs
+            cover = task.get('video_streams', 1)
+            command += ['-map', f'{thumbnail_input}:v:0', f'-c:v:{cover}', 'mjpeg',
+                        f'-disposition:v:{cover}', 'attached_pic']
+
+    command.append(output)
+    return command
+
+def convert(task):
+    """
+    Run one conversion task in a pool process. Returns (success, message). The
+    downloaded inputs are removed once the output is in place.
+    """
+    root, ext = os.path.splitext(task['output'])
+    temp_output = f"{root}.temp{ext}"
+    try:
+        try:
+            process = subprocess.Popen(build_command(task, temp_output),
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            return False, f"Cannot run ffmpeg: {str(e)}"
+
+        while True:
+            try:
+                _, stderr = process.communicate(timeout=0.2)
+                break
+            except subprocess.TimeoutExpired:
+                # The parent asks for cancellation by creating the cancel file
+                if os.path.exists(task['cancel_file']):
+                    process.kill()
+                    process.communicate()
+                    _remove(temp_output)
+                    return False, "Conversion cancelled"
+
+        if process.returncode != 0:
+            _remove(temp_output)
+            lines = stderr.decode("utf-8", "replace").strip().splitlines()
+            return False, lines[-1] if lines else f"ffmpeg exited with code {process.returncode}"
+
+        os.replace(temp_output, task['output'])
+        for path in task['inputs'] + [task.get('thumbnail')]:
+            if path and path != task['output']:
+                _remove(path)
+        return True, task['output']
+    finally:
+        _remove(task['progress_file'])
+        _remove(task['cancel_file'])
+
+def read_progress(progress_file):
+    """Seconds of output ffmpeg has written so far, from its -progress file"""
+    return read_progress_state(progress_file)[0]
+
+def read_progress_state(progress_file):
+    """(seconds, bytes) of output ffmpeg has written so far, from its -progress file; (None, 0) before any"""
+    try:
+        with open(progress_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            tail = f.read().decode("utf-8", "replace")
+    except OSError:
+        return None, 0
+    times = re.findall(r'out_time_us=(\d+)', tail)
+    sizes = re.findall(r'total_size=(\d+)', tail)
+    return (int(times[-1]) / 1000000 if times else None), (int(sizes[-1]) if sizes else 0)
+
+def _remove(path):
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+# Conversion process pool
+class ConversionPool:
+    """
+    Bounded pool of processes running conversion tasks, so CPU heavy merges and
+    encodes run next to the downloads instead of inside their worker threads
+    """
+    def __init__(self, max_workers=2):
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, task):
+        with self._lock:
+            if self._executor is None:
+                # Forking a process that runs Qt and download threads is not safe, spawn fresh ones
+                self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor.submit(convert, task)
+
+    def set_max_workers(self, max_workers):
+        """Resize the pool; conversions already running finish in the old processes"""
+        with self._lock:
+            self.max_workers = max(1, max_workers)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+# Conversion job, runs on a worker thread
+class ConvertJob:
+    """
+    Hand a conversion task to the ConversionPool and report its progress. It has
+    the same run() and cancel() interface as DownloadJob, so the same workers run it.
+    """
+    def __init__(self, url, task, pool, progress_interval=0.5, metrics=None):
+        self.url = url
+        self.task = task
+        self.pool = pool
+        self.progress_interval = progress_interval
+        self.metrics = metrics
+        self.is_cancelled = False
+        self.keep_partial = True
+        # The pool's future while the conversion is queued or running, guarded by _lock
+        self._future = None
+        self._lock = threading.Lock()
+
+    def run(self, on_progress, on_log):
+        """Convert the task, returning True on success"""
+        start = time.monotonic()
+        success = self._run(on_progress, on_log)
+        if self.metrics is not None:
+            self.metrics.observe('osd_phase_seconds', time.monotonic() - start, phase='postprocess')
+            result = "cancelled" if self.is_cancelled else "completed" if success else "failed"
+            self.metrics.inc('osd_conversions_total', result=result)
+            if success:
+                self.metrics.observe('osd_conversion_seconds', time.monotonic() - start,
+                                     mode=conversion_mode(self.task))
+        return success
+
+    def _run(self, on_progress, on_log):
+        on_log(f"Converting {os.path.basename(self.task['output'])}...")
+        start = time.monotonic()
+        try:
+            with self._lock:
+                if self.is_cancelled:
+                    raise CancelledError()
+                future = self._future = self.pool.submit(self.task)
+            while True:
+                try:
+                    success, message = future.result(timeout=self.progress_interval)
+                    break
+                except TimeoutError:
+                    on_progress(self._snapshot(time.monotonic() - start))
+        except CancelledError:
+            # Cancelled before a process picked it up, or dropped by a pool shutdown
+            success, message = False, "Conversion cancelled"
+        except Exception as e:
+            on_log(f"Error during conversion: {str(e)}")
+            return False
+        finally:
+            with self._lock:
+                self._future = None
+            # A cancel that raced the end of the conversion must not stop the next one to this output
+            _remove(self.task['cancel_file'])
+
+        if not success:
+            if self.is_cancelled and not self.keep_partial:
+                for path in self.task['inputs'] + [self.task.get('thumbnail')]:
+                    if path:
+                        _remove(path)
+            on_log(f"Conversion failed: {message}")
+            return False
+
+        on_progress(self._snapshot(time.monotonic() - start, done=True))
+        mode = {"copy": "audio copied", "encode": "audio encoded", "remux": "streams copied"}[conversion_mode(self.task)]
+        on_log(f"Converted {os.path.basename(message)} ({mode}) in {time.monotonic() - start:.1f} seconds")
+        return True
+
+    def _snapshot(self, elapsed, done=False):
+        progress, eta = (100, 0) if done else (0, None)
+        converted = read_progress(self.task['progress_file'])
+        duration = self.task.get('duration')
+        if not done and converted and duration:
+            fraction = min(converted / duration, 1.0)
+            progress = int(fraction * 100)
+            if fraction > 0:
+                eta = int(elapsed / fraction - elapsed)
+
+        # Same keys as a DownloadJob snapshot
+        return {
+            'status': "Converting",
+            'progress': progress,
+            'downloaded_bytes': None,
+            'total_bytes': None,
+            'speed': None,
+            'eta': eta,
+            'fragment_index': None,
+            'fragment_count': None,
+            'rate_limit': 0,
+        }
+
+    def cancel(self, keep_partial=True):
+        """Kill the running ffmpeg; without keep_partial the downloaded inputs are removed too"""
+        with self._lock:
+            self.keep_partial = keep_partial
+            self.is_cancelled = True
+            # Only a conversion that is running reads the cancel file, a queued one is dropped
+            future = self._future
+            if future is not None and not future.cancel() and not future.done():
+                open(self.task['cancel_file'], "w").close()
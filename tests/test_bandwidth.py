@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+
+import engine
+from engine import BandwidthManager
+
+def rates(manager, *keys):
+    return [manager.rate_for(key) for key in keys]
+
+def test_rate_is_split_by_weight():
+    manager = BandwidthManager(global_limit=700_000)
+    manager.register("high", weight=4)
+    manager.register("normal", weight=2)
+    manager.register("low", weight=1)
+    assert rates(manager, "high", "normal", "low") == [400_000, 200_000, 100_000]
+
+def test_leaving_jobs_hand_their_share_back():
+    manager = BandwidthManager(global_limit=600_000)
+    manager.register("a")
+    manager.register("b")
+    manager.register("c")
+    manager.unregister("b")
+    assert rates(manager, "a", "b", "c") == [300_000, 0, 300_000]
+
+def test_capped_jobs_leave_the_rest_to_the_others():
+    manager = BandwidthManager(global_limit=1_000_000, per_item_limit=300_000)
+    manager.register("high", weight=4)
+    manager.register("normal", weight=2)
+    manager.register("low", weight=1)
+    assert rates(manager, "high", "normal", "low") == [300_000, 300_000, 300_000]
+    manager.set_weight("low", 8)
+    assert rates(manager, "low", "high", "normal") == [300_000, 300_000, 300_000]
+
+def test_cap_redistribution_by_weight():
+    manager = BandwidthManager(global_limit=1_000_000, per_item_limit=500_000)
+    manager.register("high", weight=4)
+    manager.register("normal", weight=2)
+    manager.register("low", weight=1)
+    # high is capped at 500k of its 571k share, the 500k left splits 2:1
+    assert rates(manager, "high", "normal", "low") == [500_000, 333_333, 166_666]
+
+def test_per_item_limit_alone():
+    manager = BandwidthManager(per_item_limit=250_000)
+    manager.register("a")
+    manager.register("b")
+    assert rates(manager, "a", "b") == [250_000, 250_000]
+
+def test_unlimited():
+    manager = BandwidthManager()
+    manager.register("a")
+    assert manager.rate_for("a") == 0
+    assert manager.consume("a", 10_000_000) == 0
+
+def test_reconfiguring_applies_to_running_jobs():
+    manager = BandwidthManager(global_limit=200_000)
+    manager.register("a")
+    manager.configure(global_limit=800_000)
+    assert manager.rate_for("a") == 800_000
+
+class FixedClock:
+    def __init__(self, hour, minute):
+        self.time = datetime(2024, 1, 1, hour, minute)
+
+    def now(self):
+        return self.time
+
+@pytest.mark.parametrize("hour, minute, limit", [
+    (8, 59, 1_000_000),
+    (9, 0, 100_000),
+    (16, 59, 100_000),
+    (17, 0, 1_000_000),
+    (23, 30, 0),
+    (5, 59, 0),
+    (6, 0, 1_000_000),
+])
+def test_schedule_windows(monkeypatch, hour, minute, limit):
+    monkeypatch.setattr(engine, "datetime", FixedClock(hour, minute))
+    manager = BandwidthManager(global_limit=1_000_000,
+                               schedule=[("9:00", "17:00", 100_000), ("23:00", "06:00", 0)])
+    assert manager.limit_now() == limit
+
+def test_schedule_window_crossed_while_downloading(monkeypatch):
+    clock = FixedClock(8, 59)
+    monkeypatch.setattr(engine, "datetime", clock)
+    manager = BandwidthManager(global_limit=1_000_000, schedule=[("09:00", "17:00", 100_000)])
+    manager.register("a")
+    assert manager.rate_for("a") == 1_000_000
+    clock.time = datetime(2024, 1, 1, 9, 0)
+    manager.consume("a", 1)
+    assert manager.rate_for("a") == 100_000
@@ -0,0 +1,47 @@
+import ssl
+
+import pytest
+from yt_dlp.utils import DownloadError
+
+from engine import (classify_error, ERROR_PERMANENT, ERROR_RATE_LIMITED, ERROR_RESTRICTED,
+                    ERROR_TRANSIENT)
+
+@pytest.mark.parametrize("message, error_class", [
+    ("ERROR: [youtube] abc: HTTP Error 429: Too Many Requests", ERROR_RATE_LIMITED),
+    ("ERROR: [youtube] abc: Sign in to confirm you're not a bot", ERROR_RATE_LIMITED),
+    ("ERROR: [youtube] abc: Video unavailable. This video is private", ERROR_PERMANENT),
+    ("ERROR: [youtube] abc: Private video. Sign in if you've been granted access", ERROR_RESTRICTED),
+    ("ERROR: [youtube] abc: Sign in to confirm your age", ERROR_RESTRICTED),
+    ("ERROR: [generic] Unsupported URL: https://example.com/", ERROR_PERMANENT),
+    ("ERROR: unable to download video data: HTTP Error 404: Not Found", ERROR_PERMANENT),
+    ("ERROR: unable to download video data: HTTP Error 403: Forbidden", ERROR_TRANSIENT),
+    ("ERROR: unable to download video data: HTTP Error 503: Service Unavailable", ERROR_TRANSIENT),
+    ("ERROR: Requested format is not available", ERROR_PERMANENT),
+    ("[Errno 28] No space left on device", ERROR_PERMANENT),
+    ("Read timed out. (read timeout=30)", ERROR_TRANSIENT),
+    ("Connection reset by peer", ERROR_TRANSIENT),
+    ("[SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed: unable to get local issuer certificate",
+     ERROR_PERMANENT),
+    ("[SSL: UNEXPECTED_EOF_WHILE_READING] EOF occurred in violation of protocol", ERROR_TRANSIENT),
+    ("Something nobody expected", ERROR_PERMANENT),
+])
+def test_messages(message, error_class):
+    assert classify_error(Exception(message)) == error_class
+
+def test_unrecognized_network_errors_are_transient():
+    assert classify_error(ConnectionError("odd failure")) == ERROR_TRANSIENT
+
+def test_wrapped_exception_decides():
+    try:
+        raise ssl.SSLCertVerificationError("certificate verify failed: self-signed certificate")
+    except ssl.SSLError as e:
+        error = DownloadError("ERROR: Unable to download webpage", exc_info=(type(e), e, e.__traceback__))
+    assert classify_error(error) == ERROR_PERMANENT
+
+def test_geo_restriction_by_type():
+    class GeoRestrictedError(Exception):
+        pass
+
+    error = GeoRestrictedError("The uploader has not made this available")
+    wrapped = DownloadError("ERROR: blocked", exc_info=(type(error), error, None))
+    assert classify_error(wrapped) == ERROR_RESTRICTED
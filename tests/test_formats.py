@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+from formats import FormatSelector, select_formats
+
+# A YouTube video's format list as yt-dlp extracts it, worst first, with the sizes of a
+# 10 minute video
+with open(os.path.join(os.path.dirname(__file__), "data", "youtube_formats.json"), encoding="utf-8") as f:
+    YOUTUBE = json.load(f)["formats"]
+
+def with_sizes(formats, **sizes):
+    """Copy of formats with the filesize of some format ids replaced"""
+    return [dict(fmt, filesize=sizes[fmt['format_id']]) if fmt['format_id'] in sizes else fmt
+            for fmt in formats]
+
+@pytest.mark.parametrize("quality, format_id", [
+    ("1080p", "137+140"),
+    ("720p", "136+140"),
+    ("480p", "135+140"),
+    ("360p", "134+140"),
+])
+def test_video_merges_h264_with_aac(quality, format_id):
+    plan = select_formats(YOUTUBE, "Video (MP4)", quality)
+    assert plan.format_id == format_id
+    assert plan.merge and plan.preferred
+
+def test_video_above_every_height_takes_the_best():
+    assert select_formats(YOUTUBE, "Video (MP4)", "2160p").format_id == "137+140"
+
+def test_video_without_merging_takes_the_muxed_format():
+    plan = select_formats(YOUTUBE, "Video (MP4)", "720p", can_merge=False)
+    assert plan.format_id == "18"
+    assert plan.describe() == "360p avc1/mp4a, single file"
+
+def test_video_takes_a_much_smaller_vp9_stream():
+    # Half the size of H.264 outweighs the charge for a codec fewer players handle
+    formats = with_sizes(YOUTUBE, **{"248": 80_000_000})
+    plan = select_formats(formats, "Video (MP4)", "1080p")
+    assert plan.format_id == "248+140"
+    assert plan.compatible and not plan.preferred
+
+def test_video_with_opus_only_takes_the_smaller_video():
+    # Without AAC every pairing pays for its codecs, which leaves size to decide
+    formats = [fmt for fmt in YOUTUBE if fmt['format_id'] not in ("139", "140", "18")]
+    assert select_formats(formats, "Video (MP4)", "720p").format_id == "247+251"
+
+@pytest.mark.parametrize("quality, format_id", [
+    ("192 kbps", "251"),
+    ("128 kbps", "140"),
+    ("96 kbps", "140"),
+])
+def test_audio_takes_the_smallest_stream_reaching_the_bitrate(quality, format_id):
+    plan = select_formats(YOUTUBE, "Audio (MP3)", quality)
+    assert plan.format_id == format_id
+    assert plan.describe().endswith("to MP3")
+
+def test_audio_copy_names_the_container():
+    plan = select_formats(YOUTUBE, "Audio (MP3)", "128 kbps", audio_copy=True)
+    assert plan.format_id == "140"
+    assert plan.describe() == "130k mp4a, copy to .m4a"
+
+def test_formats_without_sizes():
+    formats = [{'format_id': '0', 'ext': 'mp4', 'url': 'http://example.com/video.mp4', 'protocol': 'http'}]
+    plan = select_formats(formats, "Video (MP4)", "720p")
+    assert plan.format_id == "0"
+    assert plan.size is None
+
+def test_selector_yields_the_plan():
+    selected, = FormatSelector("Video (MP4)", "1080p")({'formats': YOUTUBE})
+    assert selected['format_id'] == "137+140"
+    assert selected['ext'] == "mp4"
+    assert selected['format_plan'] == "1080p avc1/mp4a, merge"
+    assert selected['filesize_approx'] == 172_395_000 + 9_712_500
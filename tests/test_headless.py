@@ -0,0 +1,83 @@
+import io
+
+import pytest
+
+from engine import DownloadItem, UrlResolver
+from headless import HeadlessRunner, parse_schedule
+
+# Sizes of the videos of a playlist, only known once each entry is extracted
+SIZES = {"https://example.com/watch/a": 300_000_000, "https://example.com/watch/b": 20_000_000,
+         "https://example.com/watch/c": 90_000_000}
+
+class PlaylistResolver:
+    """Expands every URL into a playlist whose entries have flat metadata, like yt-dlp's extract_flat"""
+    needs_metadata = staticmethod(UrlResolver.needs_metadata)
+
+    def __init__(self):
+        self.fetched = []
+
+    def resolve(self, item, on_metadata, on_log):
+        entries = []
+        for url in SIZES:
+            entry = DownloadItem(url, item.output_path, item.format_type, item.quality)
+            entry.metadata = {'id': url[-1], 'title': url[-1]}
+            entries.append(entry)
+        return entries
+
+    def fetch_metadata(self, items, on_metadata, on_log):
+        for item in items:
+            self.fetched.append(item.url)
+            on_metadata(item, {'id': item.url[-1], 'format_id': "18", 'filesize': SIZES[item.url]})
+
+class RecordingWorker:
+    def __init__(self, job, started):
+        self.job = job
+        self.started = started
+
+    def start(self):
+        self.started.append(self.job.url)
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    runner = HeadlessRunner(str(tmp_path), "Video (MP4)", "720p", max_concurrent=10, use_archive=False,
+                            out=io.StringIO())
+    runner.resolver = PlaylistResolver()
+    runner.started = []
+    runner.scheduler.worker_factory = lambda job, *callbacks: RecordingWorker(job, runner.started)
+    yield runner
+    runner.conversion_pool.shutdown()
+    runner.ydl_pool.close()
+
+def test_playlist_entries_get_their_metadata(runner):
+    runner.resolve(["https://example.com/playlist"])
+    assert runner.resolver.fetched == list(SIZES)
+    assert [item.metadata.get('filesize') for item in runner.download_queue] == list(SIZES.values())
+
+def test_sjf_starts_the_smallest_playlist_entry_first(runner):
+    runner.scheduler.set_policy("sjf")
+    runner.resolve(["https://example.com/playlist"])
+    runner.scheduler.start()
+    assert runner.started == sorted(SIZES, key=SIZES.get)
+
+def test_fifo_keeps_the_playlist_order(runner):
+    runner.resolve(["https://example.com/playlist"])
+    runner.scheduler.start()
+    assert runner.started == list(SIZES)
+
+def test_fully_extracted_items_need_no_metadata():
+    item = DownloadItem("https://example.com/watch/a", "", "Video (MP4)", "720p")
+    assert not UrlResolver.needs_metadata(item)
+    item.metadata = {'id': "a", 'title': "a"}
+    assert UrlResolver.needs_metadata(item)
+    item.metadata['format_id'] = "18"
+    assert not UrlResolver.needs_metadata(item)
+
+def test_schedule_windows():
+    assert parse_schedule(["9:00-17:30=500K", "23:00-06:00=0"]) == [("9:00", "17:30", 500 * 1024),
+                                                                    ("23:00", "06:00", 0)]
+
+@pytest.mark.parametrize("window", ["24:00-06:00=1M", "09:00-17:60=1M", "9-17=1M", "09:00-17:00"])
+def test_invalid_schedule_windows(window):
+    with pytest.raises(ValueError):
+        parse_schedule([window])
@@ -0,0 +1,62 @@
+import pytest
+
+from engine import (DownloadItem, parse_sections, parse_timestamp, section_label, section_seconds,
+                    select_sections, split_sections)
+
+CHAPTERS = [{'start_time': 0, 'end_time': 65.5, 'title': "Intro"},
+            {'start_time': 65.5, 'end_time': 300, 'title': "Main part"},
+            {'start_time': 300, 'end_time': 360, 'title': "Outro"}]
+
+@pytest.mark.parametrize("text, seconds", [("42", 42), ("1:30", 90), ("1:02:03.5", 3723.5), ("0:00", 0)])
+def test_timestamps(text, seconds):
+    assert parse_timestamp(text) == seconds
+
+@pytest.mark.parametrize("text", ["", "1::2", "a:10", "1:2:3:4"])
+def test_invalid_timestamps(text):
+    with pytest.raises(ValueError):
+        parse_timestamp(text)
+
+def test_ranges_and_chapter_names():
+    assert parse_sections("1:30-3:00, 1:02:00-end, -0:10, 5:00-, Intro") == (
+        [(90, 180), (3720, None), (0, 10), (300, None)], ["Intro"])
+
+@pytest.mark.parametrize("text", ["-", " - ", "-end", "3:00-1:30", "1:00-1:00", "1::2-3:00"])
+def test_invalid_ranges(text):
+    with pytest.raises(ValueError):
+        parse_sections(text)
+
+def test_chapters_match_by_part_of_the_title():
+    sections, unmatched = select_sections("main, 5:00-5:30, intro, Credits, Main part", CHAPTERS)
+    assert sections == [(0, 65.5, "Intro"), (65.5, 300, "Main part"), (300, 330, None)]
+    assert unmatched == ["Credits"]
+
+def test_labels_and_lengths():
+    assert section_label((90, 180, None)) == "1:30-3:00"
+    assert section_label((3720, None, None)) == "1:02:00-end"
+    assert section_label((0, 65.5, "Intro")) == "Intro"
+    assert section_seconds((90, 180, None)) == 90
+    assert section_seconds((300, None, None)) is None
+    assert section_seconds((300, None, None), duration=360) == 60
+
+def item_with(sections):
+    item = DownloadItem("https://example.com/v", "", "Video (MP4)", "720p")
+    item.sections = sections
+    return item
+
+def test_split_into_one_item_per_section():
+    item = item_with("Outro, 0:10-0:20")
+    items = split_sections(item, {'title': "Video", 'chapters': CHAPTERS}, print)
+    assert [copy.section for copy in items] == [(10, 20, None), (300, 360, "Outro")]
+    assert all(copy.title == "Video" for copy in items)
+
+def test_single_section_stays_on_the_item():
+    item = item_with("0:10-0:20")
+    assert split_sections(item, {}, print) == [item]
+    assert item.section == (10, 20, None)
+
+def test_missing_chapter_fails_the_item():
+    logged = []
+    item = item_with("0:10-0:20, Credits")
+    assert split_sections(item, {'title': "Video", 'chapters': CHAPTERS}, logged.append) == [item]
+    assert item.status == "Failed" and item.section is None
+    assert logged == ["No chapter matching 'Credits' in Video, not downloading it"]
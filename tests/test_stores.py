@@ -0,0 +1,105 @@
+import pytest
+
+from engine import DownloadItem, HistoryStore, QueueStore
+
+def items(*urls):
+    return [DownloadItem(url, "", "Video (MP4)", "720p") for url in urls]
+
+@pytest.fixture
+def queue(tmp_path):
+    store = QueueStore(str(tmp_path / "queue.db"))
+    yield store
+    store.close()
+
+def stored_urls(store):
+    return [item.url for item in store.load()]
+
+def test_queue_keeps_the_order_items_were_added_in(queue):
+    queue.add(items("a", "b"))
+    queue.add(items("c"))
+    assert stored_urls(queue) == ["a", "b", "c"]
+
+def test_replaced_item_keeps_its_place(queue):
+    a, b, c = items("a", "b", "c")
+    queue.add([a, b, c])
+    queue.replace(b, items("b1", "b2", "b3"))
+    assert stored_urls(queue) == ["a", "b1", "b2", "b3", "c"]
+    assert b.queue_id is None
+
+def test_moves_land_between_their_neighbours(queue):
+    a, b, c, d = items("a", "b", "c", "d")
+    queue.add([a, b, c, d])
+    queue.move(d, before=b)
+    assert stored_urls(queue) == ["a", "d", "b", "c"]
+    queue.move(a, before=b)
+    queue.move(b)
+    assert stored_urls(queue) == ["d", "a", "c", "b"]
+
+def test_moves_into_the_same_gap_keep_the_order(queue):
+    # Each move halves the gap after d, far past what a float can tell apart
+    a, b, c, d = items("a", "b", "c", "d")
+    queue.add([a, b, c, d])
+    queue.move(d, before=b)
+    queue.move(a, before=b)
+    queue.move(b)
+    for _ in range(100):
+        queue.move(c, before=a)
+        queue.move(a, before=c)
+    assert stored_urls(queue) == ["d", "a", "c", "b"]
+
+def test_replacements_into_the_same_gap_keep_the_order(queue):
+    first, last = items("first", "last")
+    queue.add([first, last])
+    expected = ["first", "last"]
+    for n in range(100):
+        head, tail = items(f"{n}", f"{n}.1")
+        queue.replace(first, [first, head, tail])
+        expected[1:1] = [head.url, tail.url]
+    assert stored_urls(queue) == expected
+
+def test_move_to_the_front(queue):
+    a, b = items("a", "b")
+    queue.add([a, b])
+    queue.move(b, before=a)
+    assert stored_urls(queue) == ["b", "a"]
+
+def test_saved_state_survives_reopening(tmp_path):
+    path = str(tmp_path / "queue.db")
+    store = QueueStore(path)
+    item, = items("a")
+    store.add([item])
+    item.status = "Paused"
+    item.section = (10, 20, "Intro")
+    item.partial_files = [("a.mp4.part", "a.mp4")]
+    store.save(item)
+    store.close()
+    
+    store = QueueStore(path)
+    loaded, = store.load()
+    store.close()
+    assert (loaded.status, loaded.section, loaded.partial_files) == ("Paused", (10, 20, "Intro"),
+                                                                     [("a.mp4.part", "a.mp4")])
+
+@pytest.fixture
+def history():
+    store = HistoryStore(":memory:")
+    for title, date in [("beta", "2024-01-02"), (None, "2024-01-03"), ("alpha", "2024-01-01"),
+                        (None, "2024-01-05"), ("beta", "2024-01-04")]:
+        store.add({'url': f"https://example.com/{date}", 'title': title, 'date': date, 'status': "Completed"})
+    yield store
+    store.close()
+
+@pytest.mark.parametrize("order_by", ["title", "date"])
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("text_filter", ["", "example.com/2024-01-0"])
+def test_positions_match_page_order(history, order_by, descending, text_filter):
+    entries = history.page(0, 100, order_by, descending, text_filter)
+    assert len(entries) == 5
+    assert [history.position(entry['id'], order_by, descending, text_filter) for entry in entries] == \
+           list(range(len(entries)))
+
+def test_filtered_out_entry_has_no_position(history):
+    entry, = history.page(0, 1, "title", text_filter="alpha")
+    assert history.position(entry['id'], "title", text_filter="alpha") == 0
+    assert history.position(entry['id'], "title", text_filter="beta") is None
+    assert history.position(12345) is None
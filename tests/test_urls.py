@@ -0,0 +1,49 @@
+import pytest
+
+from engine import find_urls, normalize_url, plan_import, video_key
+
+WATCH = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s&list=PL123",
+    "http://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ",
+    "www.youtube.com/watch?v=dQw4w9WgXcQ#comments",
+    "youtu.be/dQw4w9WgXcQ",
+])
+def test_youtube_videos_become_one_watch_url(url):
+    assert normalize_url(url) == WATCH
+
+@pytest.mark.parametrize("url, normalized", [
+    ("https://www.youtube.com/playlist?list=PL123&index=2", "https://www.youtube.com/playlist?list=PL123"),
+    ("HTTPS://Example.COM/Video?id=1#t=10", "https://example.com/Video?id=1"),
+    ("https://example.com", "https://example.com/"),
+    # Not a video id, kept as it is
+    ("https://www.youtube.com/watch?v=short", "https://www.youtube.com/watch?v=short"),
+])
+def test_other_urls_keep_path_and_query(url, normalized):
+    assert normalize_url(url) == normalized
+
+@pytest.mark.parametrize("url", ["ftp://example.com/file", "https://", "http://[::1"])
+def test_unusable_urls(url):
+    assert normalize_url(url) is None
+
+def test_find_urls_in_text():
+    text = "first https://youtu.be/dQw4w9WgXcQ, then <https://example.com/a> and youtube.com/watch?v=x"
+    assert find_urls(text) == ["https://youtu.be/dQw4w9WgXcQ", "https://example.com/a", "youtube.com/watch?v=x"]
+
+def test_video_key_of_youtube_needs_no_extractor():
+    assert video_key("https://youtu.be/dQw4w9WgXcQ") == "youtube dQw4w9WgXcQ"
+
+def test_plan_import_drops_duplicates_and_invalid_urls():
+    known = {"youtube aaaaaaaaaaa"}
+    candidates = ["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/dQw4w9WgXcQ",
+                  "https://www.youtube.com/shorts/dQw4w9WgXcQ", "ftp://example.com/x", "https://example.com/b"]
+    urls, invalid, duplicates = plan_import(candidates, known)
+    assert urls == [WATCH, "https://example.com/b"]
+    assert (invalid, duplicates) == (1, 2)
+    assert "youtube dQw4w9WgXcQ" in known